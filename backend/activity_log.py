@@ -0,0 +1,121 @@
+"""
+In-memory activity log as a fixed-capacity ring buffer.
+
+Entries are compact ActivityRecord objects (__slots__, interned action /
+room / user strings, float timestamps) stored in a preallocated list.
+Appending writes one slot and advances the head, so it is O(1) whatever
+the capacity; once full, the oldest entry is overwritten. Ids come from
+next_id (the persistent activity store's, so an entry has the same id
+everywhere), or else from a monotonic counter; they never collide.
+
+Reads walk the slots newest-first by index arithmetic: iteration and
+page() never copy the buffer. A reader racing with appends may see a slot
+overwritten by a newer entry, which is acceptable for a UI log.
+"""
+
+import os
+import sys
+import time
+import itertools
+import threading
+from datetime import datetime
+
+# Entries kept in memory (older entries are overwritten)
+ACTIVITY_LOG_CAPACITY = int(os.getenv('ACTIVITY_LOG_CAPACITY', '10000'))
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class ActivityRecord:
+    """One activity log entry"""
+
+    __slots__ = ('id', 'timestamp', 'action', 'room', 'user', 'details', 'ip_address')
+
+    def __init__(self, record_id, timestamp, action, room, user, details, ip_address):
+        self.id = record_id
+        self.timestamp = timestamp  # Epoch seconds
+        self.action = _intern(action)
+        self.room = _intern(room)
+        self.user = _intern(user)
+        self.details = details
+        self.ip_address = _intern(ip_address)
+
+    def to_dict(self):
+        """API representation"""
+        return {
+            'id': self.id,
+            'timestamp': datetime.fromtimestamp(self.timestamp).isoformat(),
+            'action': self.action,
+            'room': self.room,
+            'user': self.user,
+            'details': self.details,
+            'ip_address': self.ip_address
+        }
+
+
+class ActivityRingBuffer:
+    """Fixed-capacity, newest-first activity log with O(1) append"""
+
+    def __init__(self, capacity=ACTIVITY_LOG_CAPACITY, next_id=None):
+        if capacity < 1:
+            raise ValueError("Activity log capacity must be at least 1")
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._head = 0    # Next slot to write
+        self._count = 0
+        self._next_id = next_id or itertools.count(1).__next__
+        self._lock = threading.Lock()
+
+    def new_record(self, action, room=None, details=None, user='admin', ip_address=None, timestamp=None):
+        """Build a record with the next id without storing it (see store())"""
+        return ActivityRecord(self._next_id(), time.time() if timestamp is None else timestamp,
+                              action, room, user, details, ip_address)
+
+    def store(self, record):
+        """Add a record (overwriting the oldest when full)"""
+        with self._lock:
+            self._slots[self._head] = record
+            self._head = (self._head + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+        return record
+
+    def append(self, action, room=None, details=None, user='admin', ip_address=None, timestamp=None):
+        """Add an entry (overwriting the oldest when full) and return its record"""
+        return self.store(self.new_record(action, room, details, user, ip_address, timestamp))
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        """index-th newest record (0 = newest)"""
+        if not 0 <= index < self._count:
+            raise IndexError("activity log index out of range")
+        return self._slots[(self._head - 1 - index) % self.capacity]
+
+    def __iter__(self):
+        return self.newest()
+
+    def newest(self, start=0, stop=None):
+        """Iterate records newest-first, from the start-th to before the stop-th newest"""
+        head, count = self._head, self._count
+        stop = count if stop is None else min(stop, count)
+        slots, capacity = self._slots, self.capacity
+        for index in range(start, stop):
+            yield slots[(head - 1 - index) % capacity]
+
+    def page(self, page, per_page):
+        """Records of a 1-based page, newest-first"""
+        start = max(page - 1, 0) * per_page
+        return list(self.newest(start, start + per_page))
+
+    def clear(self):
+        with self._lock:
+            self._slots = [None] * self.capacity
+            self._head = 0
+            self._count = 0
+
+    def stats(self):
+        return {'entries': self._count, 'capacity': self.capacity}
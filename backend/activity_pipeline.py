@@ -0,0 +1,160 @@
+"""
+Asynchronous fan-out of activity events off the request path.
+
+log_activity() only builds the event and submits it; it never formats
+logs, touches storage or emits sockets itself. Each consumer (storage,
+analytics, broadcast) has its own bounded queue and thread and receives
+events in batches of up to ACTIVITY_PIPELINE_BATCH, so a slow consumer
+never delays the others or the request.
+
+When a consumer's queue is full, submit() waits up to
+ACTIVITY_PIPELINE_PUT_TIMEOUT seconds (backpressure; 0 = never wait) and
+then drops the event for that consumer. Both cases are counted in stats().
+"""
+
+import os
+import queue
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per consumer
+ACTIVITY_PIPELINE_QUEUE_SIZE = int(os.getenv('ACTIVITY_PIPELINE_QUEUE_SIZE', '10000'))
+# Events handed to a consumer at once
+ACTIVITY_PIPELINE_BATCH = int(os.getenv('ACTIVITY_PIPELINE_BATCH', '200'))
+# Seconds submit() may block when a queue is full before dropping the event
+ACTIVITY_PIPELINE_PUT_TIMEOUT = float(os.getenv('ACTIVITY_PIPELINE_PUT_TIMEOUT', '0'))
+
+
+class _Consumer:
+    """One consumer's queue, thread and counters"""
+
+    def __init__(self, name, handler, maxsize):
+        self.name = name
+        self.handler = handler
+        self.queue = queue.Queue(maxsize)
+        self.thread = None
+        self.processed = 0
+        self.batches = 0
+        self.dropped = 0
+        self.backpressure = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'max_depth': self.max_depth,
+            'processed': self.processed,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'backpressure': self.backpressure,
+            'errors': self.errors
+        }
+
+
+class ActivityPipeline:
+    """Bounded, batched fan-out of events to independent consumer threads"""
+
+    def __init__(self, maxsize=ACTIVITY_PIPELINE_QUEUE_SIZE, batch_size=ACTIVITY_PIPELINE_BATCH,
+                 put_timeout=ACTIVITY_PIPELINE_PUT_TIMEOUT):
+        self.maxsize = max(1, maxsize)
+        self.batch_size = max(1, batch_size)
+        self.put_timeout = put_timeout
+        self._consumers = []
+        self._started = False
+        self.submitted = 0
+
+    def add_consumer(self, name, handler):
+        """Register handler(events) to receive every submitted event, in order, in batches"""
+        consumer = _Consumer(name, handler, self.maxsize)
+        self._consumers.append(consumer)
+        if self._started:
+            self._start_consumer(consumer)
+
+    def submit(self, event):
+        """
+        Hand an event to every consumer without doing any of their work.
+
+        Returns:
+            bool: False if at least one consumer dropped the event
+        """
+        self.submitted += 1
+        delivered = True
+        for consumer in self._consumers:
+            try:
+                consumer.queue.put_nowait(event)
+            except queue.Full:
+                if self.put_timeout <= 0:
+                    consumer.dropped += 1
+                    delivered = False
+                    continue
+                consumer.backpressure += 1
+                try:
+                    consumer.queue.put(event, timeout=self.put_timeout)
+                except queue.Full:
+                    consumer.dropped += 1
+                    delivered = False
+                    continue
+            depth = consumer.queue.qsize()
+            if depth > consumer.max_depth:
+                consumer.max_depth = depth
+        return delivered
+
+    def start(self):
+        """Start the consumer threads (queued events are also drained at exit)"""
+        if not self._started:
+            self._started = True
+            for consumer in self._consumers:
+                self._start_consumer(consumer)
+            atexit.register(self.drain)
+
+    def _start_consumer(self, consumer):
+        consumer.thread = threading.Thread(target=self._consume_loop, args=(consumer,),
+                                           name=f'activity-{consumer.name}', daemon=True)
+        consumer.thread.start()
+
+    def _next_batch(self, consumer, block=True):
+        try:
+            batch = [consumer.queue.get(block=block)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(consumer.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, consumer, batch):
+        try:
+            consumer.handler(batch)
+        except Exception as e:
+            consumer.errors += 1
+            logger.error(f"Error in activity consumer '{consumer.name}': {e}")
+        consumer.processed += len(batch)
+        consumer.batches += 1
+
+    def _consume_loop(self, consumer):
+        while True:
+            self._run(consumer, self._next_batch(consumer))
+
+    def drain(self):
+        """Process everything still queued on the calling thread"""
+        for consumer in self._consumers:
+            while True:
+                batch = self._next_batch(consumer, block=False)
+                if not batch:
+                    break
+                self._run(consumer, batch)
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'dropped': sum(consumer.dropped for consumer in self._consumers),
+            'backpressure': sum(consumer.backpressure for consumer in self._consumers),
+            'queue_size': self.maxsize,
+            'consumers': {consumer.name: consumer.stats() for consumer in self._consumers}
+        }
@@ -0,0 +1,353 @@
+"""
+Persistent activity log in the SQLite `activity_log` table.
+
+log_activity() hands entries to SQLiteActivityLog.add(), which only queues
+them; a background thread writes queued entries in batches (executemany in
+one transaction) every ACTIVITY_FLUSH_INTERVAL seconds or once
+ACTIVITY_FLUSH_BATCH entries are waiting. Reads never write: a query sees
+an entry once the writer has stored it, up to ACTIVITY_FLUSH_INTERVAL
+after it was logged (the in-memory ring buffer and the change feed have it
+at once).
+
+Row ids are handed out by next_id() when an entry is logged, not by SQLite at
+write time, so the in-memory log, the change journal and this table all
+know an entry by the same id. Each process takes ids from blocks of
+ACTIVITY_ID_BLOCK reserved in the activity_log_ids table, so several
+workers never hand out the same id. next_id() only counts in memory: the
+writer thread reserves the next block while the current one is in use, so
+logging never waits on a SQLite transaction. Ids are ordered within a
+worker, not across workers.
+
+Queries are indexed SQL with a LIMIT:
+
+- action / room filters use (action, timestamp) and (room, timestamp)
+  indexes, and since / until use the timestamp index
+- free-text search goes through the activity_log_fts FTS5 table (an
+  external-content index over action, room and details kept in sync by
+  triggers), or LIKE when the SQLite build has no FTS5
+- pages are newest first by timestamp, then id; callers pass the last id
+  they saw as `before` (keyset pagination, constant cost however deep) or
+  a page number (OFFSET, kept for the existing UI)
+"""
+
+import os
+import re
+import json
+import atexit
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Seconds between batched writes, and queue size that triggers an early write
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv('ACTIVITY_FLUSH_INTERVAL', '1.0'))
+ACTIVITY_FLUSH_BATCH = int(os.getenv('ACTIVITY_FLUSH_BATCH', '100'))
+# Ids a process reserves at once
+ACTIVITY_ID_BLOCK = int(os.getenv('ACTIVITY_ID_BLOCK', '100'))
+
+# Same columns as the existing activity_log table
+_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS activity_log
+       (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER, action VARCHAR(100) NOT NULL,
+        room VARCHAR(100), details TEXT, timestamp DATETIME, ip_address VARCHAR(45))''',
+    'CREATE INDEX IF NOT EXISTS idx_activity_log_timestamp ON activity_log (timestamp)',
+    # Pages are ordered by timestamp (the rowid id is the implicit last index column)
+    'DROP INDEX IF EXISTS idx_activity_log_action',
+    'DROP INDEX IF EXISTS idx_activity_log_room',
+    'CREATE INDEX IF NOT EXISTS idx_activity_log_action_time ON activity_log (action, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_activity_log_room_time ON activity_log (room, timestamp)',
+    # First id not yet reserved by any process
+    'CREATE TABLE IF NOT EXISTS activity_log_ids (next_id INTEGER NOT NULL)',
+)
+
+_FTS_SCHEMA = (
+    '''CREATE VIRTUAL TABLE activity_log_fts USING fts5
+       (action, room, details, content='activity_log', content_rowid='id')''',
+    '''CREATE TRIGGER IF NOT EXISTS activity_log_fts_insert AFTER INSERT ON activity_log BEGIN
+           INSERT INTO activity_log_fts (rowid, action, room, details)
+           VALUES (new.id, new.action, new.room, new.details);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS activity_log_fts_delete AFTER DELETE ON activity_log BEGIN
+           INSERT INTO activity_log_fts (activity_log_fts, rowid, action, room, details)
+           VALUES ('delete', old.id, old.action, old.room, old.details);
+       END''',
+    # Index rows written before the FTS table existed
+    "INSERT INTO activity_log_fts (activity_log_fts) VALUES ('rebuild')",
+)
+
+_INSERT = '''INSERT INTO activity_log (id, user_id, action, room, details, timestamp, ip_address)
+             VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+_COLUMNS = 'a.id, a.user_id, a.action, a.room, a.details, a.timestamp, a.ip_address'
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 phrase query (last word matched as a prefix), or None"""
+    tokens = _TOKEN.findall(text.lower())
+    if not tokens:
+        return None
+    return '"' + ' '.join(tokens) + '"*'
+
+
+def _like_pattern(text):
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+class SQLiteActivityLog:
+    """Batched writer and indexed reader for the activity_log table"""
+
+    def __init__(self, db_path, flush_interval=ACTIVITY_FLUSH_INTERVAL, batch_size=ACTIVITY_FLUSH_BATCH,
+                 id_block=ACTIVITY_ID_BLOCK):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.id_block = max(1, id_block)
+        self._ids_lock = threading.Lock()
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._local = threading.local()
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.id_stalls = 0
+        self.fts_enabled = False
+        self._init_schema()
+        # The current block and a spare one, so the first switch does not wait either
+        self._next_id = self._reserve_ids(2 * self.id_block)
+        self._id_limit = self._next_id + self.id_block
+        self._spare_id = self._id_limit
+
+    def _connection(self):
+        """One connection per thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = self._connection()
+        with conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'activity_log_fts'").fetchone()
+        if exists:
+            self.fts_enabled = True
+            return
+        try:
+            with conn:
+                for statement in _FTS_SCHEMA:
+                    conn.execute(statement)
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            # e.g. "no such module: fts5"
+            logger.warning(f"FTS5 unavailable ({e}), activity search falls back to LIKE")
+
+    def next_id(self):
+        """Id for a new entry, unique across every process using this database"""
+        with self._ids_lock:
+            if self._next_id >= self._id_limit:
+                if self._spare_id is None:
+                    # The writer has not reserved the next block yet (or is not running)
+                    self.id_stalls += 1
+                    self._spare_id = self._reserve_ids(self.id_block)
+                self._next_id, self._spare_id = self._spare_id, None
+                self._id_limit = self._next_id + self.id_block
+                # Have the writer reserve the next spare block
+                self._wake.set()
+            record_id = self._next_id
+            self._next_id += 1
+            return record_id
+
+    def _refill_ids(self):
+        """Reserve a spare id block if the current one has been started on (writer thread)"""
+        if self._spare_id is not None:
+            return
+        first = self._reserve_ids(self.id_block)
+        with self._ids_lock:
+            if self._spare_id is None:
+                self._spare_id = first
+
+    def _reserve_ids(self, count):
+        """Claim the next count ids in one write transaction; returns the first"""
+        conn = self._connection()
+        with conn:
+            # BEGIN IMMEDIATE takes the write lock first, so two workers cannot read the same next_id
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT next_id FROM activity_log_ids').fetchone()
+            # Rows written before ids were reserved (or with id NULL) must not be handed out again
+            first = max(row[0] if row else 1,
+                        conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM activity_log').fetchone()[0])
+            if row is None:
+                conn.execute('INSERT INTO activity_log_ids (next_id) VALUES (?)', (first + count,))
+            else:
+                conn.execute('UPDATE activity_log_ids SET next_id = ?', (first + count,))
+        return first
+
+    def add(self, timestamp, action, room=None, details=None, user_id=None, ip_address=None, record_id=None):
+        """
+        Queue an entry for the next batched write (timestamp in epoch seconds).
+
+        record_id should come from next_id(); None lets SQLite pick one at write time.
+        """
+        row = (
+            record_id, user_id, action, room,
+            None if details is None else json.dumps(details, default=str),
+            datetime.fromtimestamp(timestamp).isoformat(sep=' '),
+            ip_address
+        )
+        with self._pending_lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+
+    def start(self):
+        """Start the background writer (pending entries are also written at exit)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name='activity-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def flush(self):
+        """Write all queued entries in one transaction; returns the number written"""
+        with self._flush_lock:
+            with self._pending_lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.executemany(_INSERT, rows)
+            except sqlite3.Error as e:
+                with self._pending_lock:
+                    self._pending[:0] = rows
+                self.errors += 1
+                logger.error(f"Error writing activity log: {e}")
+                return 0
+            self.flushes += 1
+            self.written += len(rows)
+            return len(rows)
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                self._refill_ids()
+            except Exception as e:
+                logger.error(f"Error in activity writer loop: {e}")
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM activity_log').fetchone()[0]
+
+    def query(self, search=None, action=None, room=None, since=None, until=None,
+              before=None, page=None, limit=20, with_total=True):
+        """
+        Newest-first page of stored entries (queued ones show up after the next write).
+
+        Args:
+            search (str): Free text matched against action, room and details
+            action / room (str): Exact filters
+            since / until (str): ISO-8601 bounds on the timestamp
+            before (int): Keyset cursor - only entries older than the entry with this id
+            page (int): 1-based page number (OFFSET); ignored when before is given
+            limit (int): Page size
+            with_total (bool): Also count all matching entries
+
+        Returns:
+            tuple: (list of entry dicts, total or None)
+        """
+        joins = ''
+        where, params = [], []
+        if search:
+            if self.fts_enabled:
+                match = fts_query(search)
+                if match is None:
+                    return [], 0
+                joins = ' JOIN activity_log_fts ON activity_log_fts.rowid = a.id'
+                where.append('activity_log_fts MATCH ?')
+                params.append(match)
+            else:
+                pattern = _like_pattern(search)
+                where.append("(a.action LIKE ? ESCAPE '\\' OR a.room LIKE ? ESCAPE '\\' "
+                             "OR a.details LIKE ? ESCAPE '\\')")
+                params.extend((pattern, pattern, pattern))
+        if action:
+            where.append('a.action = ?')
+            params.append(action)
+        if room:
+            where.append('a.room = ?')
+            params.append(room)
+        if since:
+            where.append('a.timestamp >= ?')
+            params.append(since.replace('T', ' '))
+        if until:
+            where.append('a.timestamp < ?')
+            params.append(until.replace('T', ' '))
+
+        conn = self._connection()
+        total = None
+        if with_total:
+            sql = f'SELECT COUNT(*) FROM activity_log a{joins}'
+            if where:
+                sql += ' WHERE ' + ' AND '.join(where)
+            total = conn.execute(sql, params).fetchone()[0]
+
+        page_where, page_params = list(where), list(params)
+        offset = 0
+        if before is not None:
+            page_where.append('(a.timestamp, a.id) < (SELECT timestamp, id FROM activity_log WHERE id = ?)')
+            page_params.append(int(before))
+        elif page:
+            offset = (max(int(page), 1) - 1) * limit
+        sql = f'SELECT {_COLUMNS} FROM activity_log a{joins}'
+        if page_where:
+            sql += ' WHERE ' + ' AND '.join(page_where)
+        sql += ' ORDER BY a.timestamp DESC, a.id DESC LIMIT ? OFFSET ?'
+        rows = conn.execute(sql, page_params + [limit, offset]).fetchall()
+        return [self._to_dict(row) for row in rows], total
+
+    @staticmethod
+    def _to_dict(row):
+        record_id, user_id, action, room, details, timestamp, ip_address = row
+        if details:
+            try:
+                details = json.loads(details)
+            except ValueError:
+                pass
+        return {
+            'id': record_id,
+            'timestamp': timestamp.replace(' ', 'T', 1) if isinstance(timestamp, str) else timestamp,
+            'action': action,
+            'room': room,
+            'user': 'admin',
+            'details': details,
+            'ip_address': ip_address
+        }
+
+    def stats(self):
+        return {
+            'pending': self.pending,
+            'written': self.written,
+            'flushes': self.flushes,
+            'errors': self.errors,
+            'id_stalls': self.id_stalls,
+            'fts': self.fts_enabled
+        }
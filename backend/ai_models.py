@@ -1,291 +1,704 @@
 import numpy as np
 import pandas as pd
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingRegressor
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.metrics import accuracy_score, mean_squared_error, classification_report
-import joblib
 import os
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from dateutil.tz import tzlocal
 import json
 import logging
-from collections import defaultdict, deque
+from collections import defaultdict, OrderedDict
 import threading
 import time
+from feature_encoder import (
+    FeatureEncoder, FEATURE_NAMES, FEATURE_COUNT, FEATURE_SCHEMA_VERSION, WEATHER_FEATURES,
+    ACTIVITY_COLUMNS, DEFAULT_WEATHER, DEFAULT_ACTIVITY, encode_weather
+)
+from forest_engine import FlatForest, compile_forest
+from model_bundle import MODEL_DIR, BundleError, current_version, hash_arrays, load_bundle, save_bundle
+from sample_store import SampleStore
+from model_trainer import ModelTrainer
+from room_registry import room_registry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Prediction cache configuration
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '2048'))
+PREDICTION_CACHE_TTL = float(os.getenv('PREDICTION_CACHE_TTL', '300'))
+
+# Name of the occupancy model bundle under MODEL_DIR
+OCCUPANCY_BUNDLE = 'occupancy'
+
+# Online learning sample store and retrain thresholds
+SAMPLE_STORE_DIR = os.getenv('SAMPLE_STORE_DIR', os.path.join(MODEL_DIR, 'samples'))
+SAMPLE_STORE_CAPACITY = int(os.getenv('SAMPLE_STORE_CAPACITY', '50000'))
+SAMPLE_MAX_AGE_DAYS = float(os.getenv('SAMPLE_MAX_AGE_DAYS', '30'))
+RETRAIN_MIN_SAMPLES = int(os.getenv('RETRAIN_MIN_SAMPLES', '50'))
+RETRAIN_NEW_SAMPLES = int(os.getenv('RETRAIN_NEW_SAMPLES', '100'))
+
+# Maximum distance between a history row and the weather reading joined to it
+WEATHER_JOIN_TOLERANCE = pd.Timedelta(hours=1)
+
+class PredictionCache:
+    """
+    Bounded LRU cache for model outputs with TTL expiry and hit/miss counters.
+    
+    Keys are tuples built by the caller, e.g. (room, time bucket, weather
+    version, model version), so entries become unreachable as soon as any
+    input version moves on and then age out through LRU eviction or TTL.
+    """
+    
+    _MISSING = object()
+    
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE, ttl_seconds=PREDICTION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss or expired entry"""
+        with self._lock:
+            entry = self._entries.get(key, self._MISSING)
+            if entry is self._MISSING or entry[1] < time.monotonic():
+                if entry is not self._MISSING:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entries if full"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop all cached entries (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """Get cache size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+# Trailing UTC offset of an aware ISO-8601 timestamp ('Z', '+02:00', '-0500')
+_TZ_SUFFIX = r'(?:Z|[+-]\d{2}:?\d{2})$'
+
+def _parse_timestamps(series, utc=False):
+    try:
+        return pd.to_datetime(series, format='ISO8601', errors='coerce', utc=utc)
+    except (TypeError, ValueError):
+        return pd.to_datetime(series, errors='coerce', utc=utc)
+
+def to_timestamp_column(values):
+    """
+    Parse a column of timestamps (ISO strings or datetimes) to naive datetime64 in one pass.
+    
+    History can mix naive (local) and timezone-aware timestamps, e.g. after a
+    timezone change. Aware ones are normalized to UTC and then to local wall
+    time, matching the naive local times the row encoder sees; naive ones
+    already are local. Values that cannot be parsed become NaT (callers drop
+    those rows) instead of failing the whole column.
+    """
+    series = pd.Series(values)
+    text = series.astype(str)
+    aware = text.str.contains(_TZ_SUFFIX, regex=True) & series.notna()
+    if not aware.any():
+        timestamps = _parse_timestamps(series)
+    else:
+        timestamps = _parse_timestamps(series.where(aware), utc=True).dt.tz_convert(tzlocal()).dt.tz_localize(None)
+        if not aware.all():
+            timestamps = timestamps.where(aware, _parse_timestamps(series.where(~aware)))
+    if getattr(timestamps.dt, 'tz', None) is not None:
+        # datetime objects with tzinfo but no offset in their text form
+        timestamps = timestamps.dt.tz_convert(tzlocal()).dt.tz_localize(None)
+    return timestamps.astype('datetime64[ns]')
+
+def history_to_frame(historical_data):
+    """Convert a list of occupancy history dicts to a training DataFrame"""
+    activities = [entry.get('user_activity') or {} for entry in historical_data]
+    frame = pd.DataFrame({
+        'timestamp': [entry.get('timestamp') for entry in historical_data],
+        'room': [entry['room'] for entry in historical_data],
+        'occupied': [bool(entry['occupied']) for entry in historical_data]
+    })
+    for column, default in zip(ACTIVITY_COLUMNS, DEFAULT_ACTIVITY):
+        frame[column] = [activity.get(column, default) for activity in activities]
+    return frame
+
+def weather_to_frame(weather_data):
+    """Convert a list of timestamped weather payloads to WEATHER_FEATURES columns"""
+    frame = pd.DataFrame(
+        np.vstack([encode_weather(weather) for weather in weather_data]),
+        columns=list(WEATHER_FEATURES)
+    )
+    frame['timestamp'] = [weather.get('timestamp') for weather in weather_data]
+    return frame
+
+def join_weather(timestamps, weather):
+    """
+    As-of join each timestamp to the nearest weather reading within
+    WEATHER_JOIN_TOLERANCE.
+    
+    Returns:
+        ndarray: (len(timestamps), len(WEATHER_FEATURES)) float32 block,
+        with DEFAULT_WEATHER where no reading is close enough
+    """
+    weather = pd.DataFrame(weather)
+    weather['timestamp'] = to_timestamp_column(weather['timestamp'])
+    for column, default in zip(WEATHER_FEATURES, DEFAULT_WEATHER):
+        if column not in weather:
+            weather[column] = default
+    weather = weather.dropna(subset=['timestamp']).sort_values('timestamp', kind='stable')
+    
+    left = pd.DataFrame({'timestamp': timestamps.to_numpy(), 'row': np.arange(len(timestamps))})
+    left = left.sort_values('timestamp', kind='stable')
+    joined = pd.merge_asof(
+        left, weather[['timestamp', *WEATHER_FEATURES]], on='timestamp',
+        direction='nearest', tolerance=WEATHER_JOIN_TOLERANCE
+    )
+    block = np.empty((len(timestamps), len(WEATHER_FEATURES)), dtype=np.float32)
+    block[joined['row'].to_numpy()] = joined[list(WEATHER_FEATURES)].fillna(
+        dict(zip(WEATHER_FEATURES, DEFAULT_WEATHER.tolist()))
+    ).to_numpy(np.float32)
+    return block
+
+@dataclass(frozen=True, slots=True)
+class ActiveModel:
+    """
+    Immutable snapshot of everything inference needs from one fitted model.
+    
+    The predictor publishes a new snapshot with a single reference
+    assignment, so in-flight predictions finish on the model they started
+    with and never wait for training.
+    """
+    version: int                  # Activation counter, part of every prediction cache key
+    scaler_mean: np.ndarray
+    scaler_scale: np.ndarray
+    forest: FlatForest = None     # Numpy-only inference path
+    estimator: object = None      # Fitted sklearn model, used when no compiled forest is available
+    bundle_version: int = None    # Published bundle this model was loaded from / saved as
+    trained_at: datetime = None
+    activated_at: datetime = None
+    
+    def predict_proba(self, features):
+        """Scale raw feature rows and return (scaled rows, occupied probabilities)"""
+        # Same arithmetic as StandardScaler.transform, minus sklearn's validation overhead
+        features_scaled = np.array(features, dtype=np.float32)
+        features_scaled -= self.scaler_mean
+        features_scaled /= self.scaler_scale
+        model = self.forest if self.forest is not None else self.estimator
+        return features_scaled, model.predict_proba(features_scaled)[:, 1]
+
 class AdvancedOccupancyPredictor:
     def __init__(self):
+        # Parameter template; every fit works on a fresh clone of it
         self.model = RandomForestClassifier(n_estimators=200, random_state=42, n_jobs=-1)
         self.scaler = StandardScaler()
         self.label_encoder = LabelEncoder()
-        self.is_trained = False
-        self.model_path = 'advanced_occupancy_model.pkl'
-        self.scaler_path = 'occupancy_scaler.pkl'
-        self.encoder_path = 'occupancy_encoder.pkl'
         self.training_history = []
         self.feature_importance = {}
-        self.load_model()
+        self.training_hash = None
+        self.training_metrics = {}
+        # Model currently serving predictions (None until trained or loaded)
+        self.active = None
+        self._activation_lock = threading.Lock()
+        self.prediction_cache = PredictionCache()
+        self.encoder = FeatureEncoder()
+        self._scratch = threading.local()
+        # Runs retrains out of band when set (see model_trainer.ModelTrainer)
+        self.trainer = None
         
-        # Real-time learning
-        self.online_learning_buffer = deque(maxlen=10)
+        # Real-time learning: labelled feedback rows persist across restarts
+        self.sample_store = self._open_sample_store()
         self.learning_lock = threading.Lock()
         self.last_retrain = datetime.now()
         self.retrain_interval = timedelta(hours=24)  # Retrain daily
+        self._samples_at_retrain = self.sample_store.total_appended if self.sample_store else 0
+        self.load_model()
     
-    def load_model(self):
+    @staticmethod
+    def _open_sample_store():
         try:
-            if (os.path.exists(self.model_path) and 
-                os.path.exists(self.scaler_path) and 
-                os.path.exists(self.encoder_path)):
-                
-                self.model = joblib.load(self.model_path)
-                self.scaler = joblib.load(self.scaler_path)
-                self.label_encoder = joblib.load(self.encoder_path)
-                self.is_trained = True
-                logger.info("Advanced occupancy model loaded successfully")
-            else:
-                logger.info("No pre-trained model found, will train with sample data")
+            return SampleStore(
+                SAMPLE_STORE_DIR, FEATURE_COUNT,
+                capacity=SAMPLE_STORE_CAPACITY,
+                max_age_seconds=SAMPLE_MAX_AGE_DAYS * 86400,
+                schema_version=FEATURE_SCHEMA_VERSION
+            )
+        except Exception as e:
+            logger.error(f"Error opening online learning sample store: {e}")
+            return None
+    
+    @property
+    def is_trained(self):
+        return self.active is not None
+    
+    @property
+    def model_version(self):
+        active = self.active
+        return active.version if active is not None else 0
+    
+    @property
+    def bundle_version(self):
+        active = self.active
+        return active.bundle_version if active is not None else None
+    
+    def load_model(self, version=None):
+        """
+        Load a published model bundle (the current one by default) and swap it in.
+        
+        The forest arrays stay memory-mapped, so every worker process shares
+        one copy of the model through the OS page cache. Bundles built for a
+        different feature schema are ignored and the model is retrained.
+        
+        Returns:
+            bool: True if the bundle was loaded and activated
+        """
+        try:
+            bundle = load_bundle(OCCUPANCY_BUNDLE, version=version)
+        except BundleError as e:
+            logger.info(f"No pre-trained model found ({e}), will train with sample data")
+            return False
         except Exception as e:
             logger.error(f"Error loading model: {e}")
+            return False
+        
+        try:
+            metadata = bundle.metadata
+            schema = metadata.get('feature_schema', {})
+            if (schema.get('version') != FEATURE_SCHEMA_VERSION or
+                    tuple(schema.get('names', ())) != FEATURE_NAMES):
+                logger.warning("Saved occupancy model uses an old feature schema, will retrain")
+                return False
+            
+            arrays = bundle.arrays
+            forest = FlatForest.from_arrays(arrays, metadata['forest'])
+            if forest.n_features != FEATURE_COUNT:
+                raise BundleError(f"Forest expects {forest.n_features} features, schema has {FEATURE_COUNT}")
+            
+            # Only the fitted statistics are needed; retraining refits the scaler
+            scaler = StandardScaler()
+            scaler.mean_ = np.array(arrays['scaler_mean'])
+            scaler.scale_ = np.array(arrays['scaler_scale'])
+            scaler.var_ = np.array(arrays['scaler_var'])
+            scaler.n_features_in_ = FEATURE_COUNT
+            scaler.n_samples_seen_ = metadata.get('scaler', {}).get('n_samples_seen', 0)
+            
+            self.scaler = scaler
+            self.feature_importance = metadata.get('feature_importance', {})
+            self.training_hash = metadata.get('training', {}).get('hash')
+            self.training_metrics = metadata.get('training', {}).get('metrics', {})
+            self._activate(
+                forest=forest,
+                scaler_mean=scaler.mean_,
+                scaler_scale=scaler.scale_,
+                bundle_version=bundle.version,
+                trained_at=datetime.fromisoformat(bundle.manifest['created_at'])
+            )
+            logger.info(f"Advanced occupancy model loaded from bundle v{bundle.version}")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading model: {e}")
+            return False
+    
+    def _activate(self, **fields):
+        """Swap in a new immutable model snapshot; in-flight predictions keep the old one"""
+        with self._activation_lock:
+            previous = self.active
+            self.active = ActiveModel(
+                version=(previous.version if previous is not None else 0) + 1,
+                activated_at=datetime.now(),
+                **fields
+            )
+        self.prediction_cache.clear()
     
-    def save_model(self):
+    def _install_fitted(self, model, scaler):
+        """Compile and publish a freshly fitted model, then swap it in for inference"""
+        self.model, self.scaler = model, scaler
         try:
-            joblib.dump(self.model, self.model_path)
-            joblib.dump(self.scaler, self.scaler_path)
-            joblib.dump(self.label_encoder, self.encoder_path)
-            logger.info("Model saved successfully")
+            forest = compile_forest(model)
         except Exception as e:
-            logger.error(f"Error saving model: {e}")
+            logger.error(f"Error compiling flat forest, using sklearn inference: {e}")
+            forest = None
+        self._activate(
+            forest=forest,
+            estimator=model,
+            scaler_mean=scaler.mean_,
+            scaler_scale=scaler.scale_,
+            bundle_version=self.save_model(forest, scaler),
+            trained_at=datetime.now()
+        )
     
-    def prepare_advanced_features(self, timestamp, room, weather_data=None, user_activity=None):
-        """Extract advanced features from timestamp for occupancy prediction"""
-        dt = pd.to_datetime(timestamp)
-        
-        # Basic time features
-        features = {
-            'hour': dt.hour,
-            'minute': dt.minute,
-            'day_of_week': dt.dayofweek,
-            'day_of_month': dt.day,
-            'month': dt.month,
-            'is_weekend': 1 if dt.dayofweek >= 5 else 0,
-            'is_holiday': self._is_holiday(dt),
-            'is_workday': 1 if 10 <= dt.dayofweek <= 4 else 0,
-        }
+    def save_model(self, forest=None, scaler=None):
+        """
+        Publish a compiled forest and its scaler as a new occupancy bundle version.
         
-        # Time of day categories
-        time_categories = {
-            'early_morning': 1 if 5 <= dt.hour <= 8 else 0,
-            'morning': 1 if 9 <= dt.hour <= 11 else 0,
-            'lunch': 1 if 12 <= dt.hour <= 13 else 0,
-            'afternoon': 1 if 14 <= dt.hour <= 17 else 0,
-            'dinner': 1 if 18 <= dt.hour <= 20 else 0,
-            'evening': 1 if 21 <= dt.hour <= 23 else 0,
-            'night': 1 if 0 <= dt.hour <= 4 else 0,
-        }
-        features.update(time_categories)
-        
-        # Room-specific features
-        room_encodings = {
-            'living_room': [1, 0, 0, 0, 0],
-            'kitchen': [0, 1, 0, 0, 0],
-            'bedroom': [0, 0, 1, 0, 0],
-            'bathroom': [0, 0, 0, 1, 0],
-            'office': [0, 0, 0, 0, 1]
+        Defaults to the active model. Returns the bundle version, or None if
+        nothing was saved.
+        """
+        try:
+            active = self.active
+            forest = forest if forest is not None else (active.forest if active is not None else None)
+            scaler = scaler if scaler is not None else self.scaler
+            if forest is None:
+                logger.warning("No compiled model to save")
+                return None
+            arrays, forest_meta = forest.to_arrays()
+            arrays['scaler_mean'] = scaler.mean_
+            arrays['scaler_scale'] = scaler.scale_
+            arrays['scaler_var'] = scaler.var_
+            
+            params = {key: value for key, value in self.model.get_params().items()
+                      if isinstance(value, (int, float, str, bool, type(None)))}
+            metadata = {
+                'feature_schema': {'version': FEATURE_SCHEMA_VERSION, 'names': list(FEATURE_NAMES)},
+                'forest': forest_meta,
+                'scaler': {'n_samples_seen': int(scaler.n_samples_seen_)},
+                'model': {'type': type(self.model).__name__, 'params': params},
+                'training': {'hash': self.training_hash, 'metrics': self.training_metrics},
+                'feature_importance': {name: float(value) for name, value in self.feature_importance.items()}
+            }
+            version = save_bundle(OCCUPANCY_BUNDLE, arrays, metadata)
+            logger.info(f"Model saved as bundle v{version}")
+            return version
+        except Exception as e:
+            logger.error(f"Error saving model: {e}")
+            return None
+    
+    def model_status(self):
+        """Version, age and staleness of the model serving predictions"""
+        active = self.active
+        try:
+            latest = current_version(OCCUPANCY_BUNDLE)
+        except OSError:
+            latest = None
+        status = {
+            'trained': active is not None,
+            'version': self.model_version,
+            'bundle_version': self.bundle_version,
+            'latest_bundle_version': latest,
+            'metrics': self.training_metrics
         }
-        # Add each room encoding as a separate feature
-        for i in range(5):
-            features[f'room_{i}'] = room_encodings.get(room, [0, 0, 0, 0, 0])[i]
-        
-        # Weather features (if available)
-        if weather_data:
-            features.update({
-                'temperature': weather_data.get('main', {}).get('temp', 20),
-                'humidity': weather_data.get('main', {}).get('humidity', 50),
-                'weather_condition': self._encode_weather(weather_data.get('weather', [{}])[0].get('main', 'Clear')),
-                'is_rainy': 1 if 'Rain' in str(weather_data.get('weather', [])) else 0,
-                'is_cloudy': 1 if 'Clouds' in str(weather_data.get('weather', [])) else 0
-            })
-        
-        # User activity features (if available)
-        if user_activity:
-            features.update({
-                'recent_activity': user_activity.get('recent_activity', 0),
-                'user_preference': user_activity.get('preference', 0.5),
-                'last_occupancy_duration': user_activity.get('last_duration', 0),
+        if active is not None:
+            age = datetime.now() - active.trained_at if active.trained_at else None
+            status.update({
+                'inference': 'flat_forest' if active.forest is not None else 'sklearn',
+                'trained_at': active.trained_at.isoformat() if active.trained_at else None,
+                'activated_at': active.activated_at.isoformat(),
+                'age_seconds': round(age.total_seconds()) if age is not None else None,
+                # Older than the retrain interval, or another process has published a newer bundle
+                'stale': bool((age is not None and age > self.retrain_interval) or
+                              (latest is not None and active.bundle_version is not None and
+                               latest > active.bundle_version))
             })
+        if self.sample_store is not None:
+            status['samples'] = self.sample_store.stats()
+        if self.trainer is not None:
+            status['training'] = self.trainer.status()
+        return status
+    
+    def prepare_advanced_features(self, timestamp, room, weather_data=None, user_activity=None):
+        """
+        Extract advanced features for occupancy prediction.
         
-        # Cyclical features for better time representation
-        features['hour_sin'] = np.sin(2 * np.pi * dt.hour / 24)
-        features['hour_cos'] = np.cos(2 * np.pi * dt.hour / 24)
-        features['day_sin'] = np.sin(2 * np.pi * dt.dayofweek / 7)
-        features['day_cos'] = np.cos(2 * np.pi * dt.dayofweek / 7)
-        
-        return np.array(list(features.values())).reshape(1, -1)
-    
-    def _is_holiday(self, dt):
-        """Check if date is a holiday (simplified)"""
-        # Add major holidays - this is a simplified version
-        holidays = [
-            (1, 1),  # New Year's Day
-            (7, 4),   # Independence Day
-            (12, 25)  # Christmas Day
-        ]
-        return 1 if (dt.month, dt.day) in holidays else 0
-    
-    def _encode_weather(self, weather_condition):
-        """Encode weather conditions"""
-        weather_encodings = {
-            'Clear': 0, 'Clouds': 1, 'Rain': 2, 'Snow': 3, 'Thunderstorm': 4
-        }
-        return weather_encodings.get(weather_condition, 0)
+        Always returns a (1, FEATURE_COUNT) float32 row in the fixed
+        FEATURE_NAMES layout; missing weather/activity use neutral defaults.
+        timestamp may be a datetime, epoch seconds or an ISO-8601 string.
+        """
+        return self.encoder.encode(timestamp, room, weather_data, user_activity)
+    
+    def _scratch_row(self):
+        """Per-thread preallocated feature row for the single-prediction path"""
+        row = getattr(self._scratch, 'row', None)
+        if row is None:
+            row = self._scratch.row = np.empty((1, FEATURE_COUNT), dtype=np.float32)
+        return row
     
     def train(self, historical_data, weather_data=None):
-        """Train the model with historical occupancy data"""
+        """
+        Train the model with historical occupancy data.
+        
+        Args:
+            historical_data (list): Dicts with timestamp, room, occupied and optional user_activity
+            weather_data (list, optional): Weather payloads, each with a timestamp
+        
+        Converts both lists to columns and delegates to train_columnar().
+        """
         try:
-            features = []
-            labels = []
-            
-            for entry in historical_data:
-                weather_entry = None
-                if weather_data and entry.get('timestamp'):
-                    # Find matching weather data
-                    entry_time = pd.to_datetime(entry['timestamp'])
-                    for weather in weather_data:
-                        if abs((pd.to_datetime(weather['timestamp']) - entry_time).total_seconds()) < 3600:
-                            weather_entry = weather
-                            break
-                
-                feature_vector = self.prepare_advanced_features(
-                    entry['timestamp'], 
-                    entry['room'], 
-                    weather_entry,
-                    entry.get('user_activity')
-                )
-                features.append(feature_vector.flatten())
-                labels.append(1 if entry['occupied'] else 0)
-            
-            if len(features) < 10:
+            history = history_to_frame(historical_data)
+            weather = weather_to_frame(weather_data) if weather_data else None
+        except Exception as e:
+            logger.error(f"Error preparing training data: {e}")
+            return 0.0
+        return self.train_columnar(history, weather)
+    
+    def train_columnar(self, history, weather=None):
+        """
+        Train from columnar history in one vectorized pass.
+        
+        Args:
+            history: DataFrame (or dict of arrays) with timestamp, room and
+                occupied columns plus optional ACTIVITY_COLUMNS
+            weather: Optional DataFrame (or dict of arrays) with a timestamp
+                column and WEATHER_FEATURES columns. Each history row takes the
+                nearest reading within WEATHER_JOIN_TOLERANCE (sorted as-of join).
+        
+        Returns:
+            float: Test accuracy (0.0 on failure)
+        """
+        timings = {}
+        stage_start = time.perf_counter()
+        
+        def end_stage(name):
+            nonlocal stage_start
+            now = time.perf_counter()
+            timings[name] = round((now - stage_start) * 1000, 1)
+            stage_start = now
+        
+        try:
+            history = pd.DataFrame(history)
+            history['timestamp'] = to_timestamp_column(history['timestamp'])
+            history = history[history['timestamp'].notna()].reset_index(drop=True)
+            if len(history) < 10:
                 logger.warning("Insufficient training data for training.")
                 return 0.0
-            X = np.array(features)
-            y = np.array(labels)
+            end_stage('prepare')
+            
+            weather_block = join_weather(history['timestamp'], weather) if weather is not None else None
+            end_stage('weather_join')
+            
+            activity_block = None
+            if any(column in history for column in ACTIVITY_COLUMNS):
+                activity_block = np.column_stack([
+                    pd.to_numeric(history[column], errors='coerce').fillna(default).to_numpy(np.float32)
+                    if column in history else np.full(len(history), default, dtype=np.float32)
+                    for column, default in zip(ACTIVITY_COLUMNS, DEFAULT_ACTIVITY)
+                ])
+            X = self.encoder.encode_columns(
+                history['timestamp'].to_numpy(), history['room'].to_numpy(),
+                weather_block, activity_block
+            )
+            y = history['occupied'].fillna(False).astype(bool).to_numpy(np.int64)
+            end_stage('encode')
             
             # Split data
             X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
             
             # Scale features
-            X_train_scaled = self.scaler.fit_transform(X_train)
-            X_test_scaled = self.scaler.transform(X_test)
+            scaler = StandardScaler()
+            X_train_scaled = scaler.fit_transform(X_train)
+            X_test_scaled = scaler.transform(X_test)
+            end_stage('split_scale')
             
-            # Train model
-            self.model.fit(X_train_scaled, y_train)
+            # Train a fresh model; the active one keeps serving until the swap
+            model = clone(self.model)
+            model.fit(X_train_scaled, y_train)
+            end_stage('fit')
             
             # Evaluate
-            y_pred = self.model.predict(X_test_scaled)
+            y_pred = model.predict(X_test_scaled)
             accuracy = accuracy_score(y_test, y_pred)
+            end_stage('evaluate')
             
             # Store feature importance
-            feature_names = [f'feature_{i}' for i in range(X.shape[1])]
-            self.feature_importance = dict(zip(feature_names, self.model.feature_importances_))
+            self.feature_importance = dict(zip(FEATURE_NAMES, model.feature_importances_))
             
-            self.is_trained = True
-            self.save_model()
+            self.training_hash = hash_arrays(X, y)
+            self.training_metrics = {
+                'accuracy': float(accuracy),
+                'samples': len(X),
+                'train_samples': len(X_train),
+                'test_samples': len(X_test)
+            }
+            self._install_fitted(model, scaler)
+            end_stage('publish')
             
             # Store training history
             self.training_history.append({
                 'timestamp': datetime.now().isoformat(),
                 'accuracy': accuracy,
                 'samples': len(X),
-                'model_type': 'AdvancedOccupancyPredictor'
+                'model_type': 'AdvancedOccupancyPredictor',
+                'timings_ms': timings
             })
             
-            logger.info(f"Model trained with {len(X)} samples. Accuracy: {accuracy:.3f}")
+            stages = ', '.join(f"{name} {ms:.0f}ms" for name, ms in timings.items())
+            logger.info(f"Model trained with {len(X)} samples. Accuracy: {accuracy:.3f} ({stages})")
             return accuracy
             
         except Exception as e:
             logger.error(f"Error training model: {e}")
             return 0.0
     
-    def predict(self, timestamp, room, weather_data=None, user_activity=None):
-        """Predict occupancy for a given time and room"""
-        if not self.is_trained:
+    def predict(self, timestamp, room, weather_data=None, user_activity=None, cache_token=None):
+        """
+        Predict occupancy for a given time and room.
+        
+        cache_token is an optional (time bucket, weather version) pair; when
+        given (and no user_activity is passed) the result is served from and
+        stored in the prediction cache.
+        """
+        active = self.active
+        if active is None:
             return 0.5  # Default confidence if not trained
         
+        cache_key = self._cache_key(room, cache_token, user_activity, active)
+        if cache_key is not None:
+            cached = self.prediction_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
         try:
-            features = self.prepare_advanced_features(timestamp, room, weather_data, user_activity)
-            features_scaled = self.scaler.transform(features)
+            features = self.encoder.encode(timestamp, room, weather_data, user_activity, out=self._scratch_row())
             
             # Get prediction probability
-            prob = self.model.predict_proba(features_scaled)[0][1]
-            
-            # Store for online learning
-            with self.learning_lock:
-                self.online_learning_buffer.append({
-                    'features': features_scaled[0],
-                    'timestamp': timestamp,
-                    'room': room,
-                    'weather_data': weather_data,
-                    'user_activity': user_activity
-                })
+            _, probs = active.predict_proba(features)
+            prob = float(probs[0])
             
+            if cache_key is not None:
+                self.prediction_cache.put(cache_key, prob)
             return prob
             
         except Exception as e:
             logger.error(f"Error in prediction: {e}")
             return 0.5
-    
+
+    def _cache_key(self, room, cache_token, user_activity, active):
+        """Build the prediction cache key, or None if the call is not cacheable"""
+        if cache_token is None or user_activity is not None:
+            return None
+        return (room,) + tuple(cache_token) + (active.version,)
+
+    def predict_batch(self, timestamp, rooms, weather_data=None, user_activity=None, cache_token=None):
+        """
+        Predict occupancy for several rooms at the same timestamp.
+
+        Builds one feature matrix for all rooms and scores it with a single
+        predict_proba call, so the cost of a whole-house tick does not grow
+        with one model dispatch per room. With a cache_token only the rooms
+        missing from the prediction cache are scored.
+
+        Returns:
+            dict: room -> occupancy probability
+        """
+        rooms = list(rooms)
+        active = self.active
+        if active is None or not rooms:
+            return {room: 0.5 for room in rooms}
+
+        results = {}
+        if cache_token is not None and user_activity is None:
+            for room in rooms:
+                cached = self.prediction_cache.get(self._cache_key(room, cache_token, None, active))
+                if cached is not None:
+                    results[room] = cached
+            rooms = [room for room in rooms if room not in results]
+            if not rooms:
+                return results
+
+        try:
+            features = self.encoder.encode_batch(timestamp, rooms, weather_data, user_activity)
+            _, probs = active.predict_proba(features)
+
+            for room, prob in zip(rooms, probs):
+                results[room] = float(prob)
+                cache_key = self._cache_key(room, cache_token, user_activity, active)
+                if cache_key is not None:
+                    self.prediction_cache.put(cache_key, results[room])
+            return results
+
+        except Exception as e:
+            logger.error(f"Error in batch prediction: {e}")
+            results.update({room: 0.5 for room in rooms})
+            return results
+
     def online_learn(self, actual_occupancy, timestamp, room, weather_data=None, user_activity=None):
-        """Learn from real-world feedback"""
+        """
+        Learn from real-world feedback.
+        
+        The labelled row is appended to the persistent sample store. Once
+        RETRAIN_NEW_SAMPLES rows have arrived (or the retrain interval has
+        passed) a retrain is handed to the trainer, which reads the store
+        directly, so predictions keep flowing meanwhile.
+        """
         try:
+            store = self.sample_store
+            if store is None:
+                return
+            features = self.prepare_advanced_features(timestamp, room, weather_data, user_activity)[0]
+            store.append(features, 1 if actual_occupancy else 0)
+            
+            due = False
             with self.learning_lock:
-                # Add to buffer
-                self.online_learning_buffer.append({
-                    'features': self.prepare_advanced_features(timestamp, room, weather_data, user_activity)[0],
-                    'actual_occupancy': actual_occupancy,
-                    'timestamp': timestamp,
-                    'room': room
-                })
-                
                 # Retrain if enough new data or time has passed
-                if (len(self.online_learning_buffer) >= 100 or 
-                    datetime.now() - self.last_retrain > self.retrain_interval):
-                    self._retrain_from_buffer()
+                new_samples = store.total_appended - self._samples_at_retrain
+                if ((new_samples >= RETRAIN_NEW_SAMPLES or 
+                     datetime.now() - self.last_retrain > self.retrain_interval) and
+                        len(store) >= RETRAIN_MIN_SAMPLES):
+                    due = True
+                    self.last_retrain = datetime.now()
+                    self._samples_at_retrain = store.total_appended
+            
+            if due:
+                if self.trainer is not None:
+                    self.trainer.submit('online')
+                else:
+                    self.retrain_from_store()
                     
         except Exception as e:
             logger.error(f"Error in online learning: {e}")
     
-    def _retrain_from_buffer(self):
-        """Retrain model from online learning buffer"""
+    def retrain_from_store(self):
+        """Evict expired feedback rows and retrain on what is left in the sample store"""
+        store = self.sample_store
+        if store is None:
+            return
+        store.evict_expired()
+        if len(store) < RETRAIN_MIN_SAMPLES:
+            logger.info(f"Only {len(store)} feedback samples, skipping retrain")
+            return
+        X, y = store.training_arrays()
+        self.retrain_on_samples(X, y)
+    
+    def retrain_on_samples(self, X, y):
+        """Refit the model on labelled raw feature rows, publish it and swap it in"""
         try:
-            if len(self.online_learning_buffer) < 50:
-                return
-            
-            # Prepare training data from buffer
-            features = []
-            labels = []
-            
-            for entry in self.online_learning_buffer:
-                if 'actual_occupancy' in entry:
-                    features.append(entry['features'])
-                    labels.append(entry['actual_occupancy'])
-            
-            if len(features) < 10:
+            if len(np.unique(y)) < 2:
+                logger.info("Feedback samples contain a single class, skipping retrain")
                 return
-            
-            X = np.array(features)
-            y = np.array(labels)
-            
-            # Retrain with new data
             X_scaled = self.scaler.transform(X)
-            self.model.fit(X_scaled, y)
-            
-            self.last_retrain = datetime.now()
-            self.save_model()
+            model = clone(self.model)
+            model.fit(X_scaled, y)
+            self.feature_importance = dict(zip(FEATURE_NAMES, model.feature_importances_))
+            self.training_hash = hash_arrays(X, y)
+            self.training_metrics = {'samples': len(X), 'source': 'online'}
+            self._install_fitted(model, self.scaler)
             
             logger.info(f"Model retrained with {len(X)} new samples")
             
@@ -311,10 +724,28 @@ class AdvancedEnergyOptimizer:
         # Optimization models
         self.brightness_model = GradientBoostingRegressor(n_estimators=100, random_state=42)
         self.is_brightness_model_trained = False
+        self.model_version = 0
+        self.prediction_cache = PredictionCache()
         
     def optimize_brightness_advanced(self, room, current_time, natural_light_level, 
-                                   occupancy_probability, weather_data=None, user_preferences=None):
-        """Advanced brightness optimization with ML"""
+                                   occupancy_probability, weather_data=None, user_preferences=None,
+                                   cache_token=None):
+        """
+        Advanced brightness optimization with ML.
+        
+        cache_token is an optional (time bucket, weather version) pair; when
+        given (and no user_preferences are passed) results are cached per room
+        and occupancy probability. Energy is tracked on every call, cached or not.
+        """
+        cache_key = None
+        if cache_token is not None and user_preferences is None:
+            cache_key = ((room,) + tuple(cache_token) +
+                         (self.model_version, round(float(occupancy_probability), 3)))
+            cached = self.prediction_cache.get(cache_key)
+            if cached is not None:
+                self._track_energy_consumption(room, cached)
+                return cached
+        
         try:
             # Base optimization
             base_brightness = self._calculate_base_brightness(room, current_time, natural_light_level)
@@ -344,10 +775,13 @@ class AdvancedEnergyOptimizer:
             final_brightness = max(self.optimization_rules['min_brightness'], 
                                  min(self.optimization_rules['max_brightness'], optimized_brightness))
             
-            # Track energy consumption
-            self._track_energy_consumption(room, final_brightness)
+            final_brightness = int(final_brightness)
+            if cache_key is not None:
+                self.prediction_cache.put(cache_key, final_brightness)
             
-            return int(final_brightness)
+            # Track energy consumption (outside the cached computation: runs on hits too)
+            self._track_energy_consumption(room, final_brightness)
+            return final_brightness
             
         except Exception as e:
             logger.error(f"Error in advanced brightness optimization: {e}")
@@ -421,15 +855,8 @@ class AdvancedEnergyOptimizer:
         return brightness_pref / 80
     
     def _get_room_adjustment(self, room):
-        """Get room-specific brightness adjustment"""
-        room_adjustments = {
-            'bedroom': 0.7,  # Dimmer for sleep
-            'bathroom': 1.2,  # Brighter for safety
-            'kitchen': 1.1,   # Brighter for cooking
-            'office': 1.0,    # Standard
-            'living_room': 0.9 # Slightly dimmer for comfort
-        }
-        return room_adjustments.get(room, 1.0)
+        """Get room-specific brightness adjustment (from the room type profile)"""
+        return room_registry.brightness_factor(room)
     
     def _predict_optimal_brightness(self, room, current_time, natural_light_level, occupancy_probability):
         """ML model to predict optimal brightness"""
@@ -440,12 +867,8 @@ class AdvancedEnergyOptimizer:
                 current_time.dayofweek,
                 natural_light_level,
                 occupancy_probability,
-                # Room encoding
-                1 if room == 'living_room' else 0,
-                1 if room == 'kitchen' else 0,
-                1 if room == 'bedroom' else 0,
-                1 if room == 'bathroom' else 0,
-                1 if room == 'office' else 0
+                # Room type encoding
+                *room_registry.encoding(room)
             ]
             
             prediction = self.brightness_model.predict([features])[0]
@@ -455,6 +878,10 @@ class AdvancedEnergyOptimizer:
             logger.error(f"Error in ML brightness prediction: {e}")
             return 80
     
+    def record_consumption(self, room, brightness):
+        """Record a room's brightness (0 when off) for the energy statistics"""
+        self._track_energy_consumption(room, brightness)
+    
     def _track_energy_consumption(self, room, brightness):
         """Track energy consumption for analysis"""
         # Simplified energy calculation (watts)
@@ -505,6 +932,8 @@ class UserBehaviorLearner:
         self.preferences = defaultdict(dict)
         self.learning_rate = 0.1
         self.pattern_window = 30  # days
+        self.clean_interval = 60  # seconds between prunes of old patterns
+        self._last_clean = time.monotonic()
         
     def learn_from_activity(self, room, action, timestamp, brightness=None, user_id=None):
         """Learn from user activity patterns"""
@@ -516,7 +945,7 @@ class UserBehaviorLearner:
             # Store activity pattern
             pattern_key = f"{room}_{time_of_day}_{day_of_week}"
             self.user_patterns[user_id or 'default'][pattern_key].append({
-                'timestamp': timestamp,
+                'timestamp': dt.to_pydatetime(),  # Parsed once, compared directly when pruning
                 'action': action,
                 'brightness': brightness,
                 'hour': dt.hour,
@@ -527,8 +956,9 @@ class UserBehaviorLearner:
             if brightness is not None:
                 self._update_preferences(user_id or 'default', room, time_of_day, brightness)
             
-            # Clean old patterns
-            self._clean_old_patterns()
+            # Clean old patterns (a full pass, so at most every clean_interval seconds)
+            if time.monotonic() - self._last_clean >= self.clean_interval:
+                self._clean_old_patterns()
             
         except Exception as e:
             logger.error(f"Error learning from activity: {e}")
@@ -562,13 +992,14 @@ class UserBehaviorLearner:
     
     def _clean_old_patterns(self):
         """Remove old pattern data"""
+        self._last_clean = time.monotonic()
         cutoff_date = datetime.now() - timedelta(days=self.pattern_window)
         
         for user_id in self.user_patterns:
             for pattern_key in list(self.user_patterns[user_id].keys()):
                 self.user_patterns[user_id][pattern_key] = [
                     entry for entry in self.user_patterns[user_id][pattern_key]
-                    if pd.to_datetime(entry['timestamp']) > cutoff_date
+                    if entry['timestamp'] > cutoff_date
                 ]
     
     def get_user_preferences(self, user_id, room, time_of_day):
@@ -776,9 +1207,19 @@ advanced_energy_optimizer = AdvancedEnergyOptimizer()
 user_behavior_learner = UserBehaviorLearner()
 advanced_schedule_optimizer = AdvancedScheduleOptimizer()
 
+# Retrains the occupancy model out of band and hot-swaps the published bundle
+model_trainer = ModelTrainer(advanced_occupancy_predictor, bundle_name=OCCUPANCY_BUNDLE)
+advanced_occupancy_predictor.trainer = model_trainer
+
 # Generate enhanced sample training data
 def generate_enhanced_training_data():
-    """Generate enhanced training data with more realistic patterns"""
+    """
+    Generate enhanced training data with more realistic patterns.
+    
+    Rows are generated per room type in use rather than per room: the model
+    encodes rooms by type, so extra rooms of the same type add no information
+    and training size stays independent of the number of rooms.
+    """
     sample_data = []
     
     # Generate 3 months of sample data
@@ -788,30 +1229,14 @@ def generate_enhanced_training_data():
         current_date = start_date + timedelta(days=day)
         
         # Generate data for each room with realistic patterns
-        for room in ['living_room', 'kitchen', 'bedroom', 'bathroom', 'office']:
+        weekend = current_date.weekday() >= 5
+        for room_type in room_registry.types_in_use():
+            room = room_type.name
             for hour in range(24):
                 timestamp = current_date.replace(hour=hour, minute=0, second=0, microsecond=0)
                 
-                # More sophisticated occupancy patterns
-                if room == 'bedroom':
-                    occupied = (6 <= hour <= 8 or (22 <= hour <= 23) or (0 <= hour <= 6))
-                elif room == 'kitchen':
-                    occupied = (6 <= hour <= 9 or (12 <= hour <= 13) or (18 <= hour <= 20))
-                elif room == 'living_room':
-                    occupied = (18 <= hour <= 23) or (9 <= hour <= 11)
-                elif room == 'bathroom':
-                    occupied = (6 <= hour <= 8 or (22 <= hour <= 23) or (hour % 4 == 0))
-                elif room == 'office':
-                    occupied = (8 <= hour <= 18) and (current_date.weekday() < 5)  # Weekdays only
-                else:
-                    occupied = False
-                
-                # Add weekend variations
-                if current_date.weekday() >= 5:  # Weekend
-                    if room == 'office':
-                        occupied = False  # No office use on weekends
-                    elif room == 'living_room':
-                        occupied = (10 <= hour <= 23) # More living room use on weekends
+                # Occupancy pattern of the room type (weekday / weekend hours)
+                occupied = room_type.is_usually_occupied(hour, weekend)
                 
                 # Add some realistic randomness
                 if np.random.random() < 0.05:  # 5% chance of random occupancy
@@ -847,14 +1272,20 @@ def generate_enhanced_training_data():
 #    accuracy = advanced_occupancy_predictor.train(enhanced_data)
 #    logger.info(f"Advanced AI Model trained with {len(enhanced_data)} samples. Accuracy: {accuracy:.3f}")
 
-def init_models():
-    """Initialize and train models if necessary"""
+def init_models(wait=False):
+    """
+    Start background model maintenance and train the occupancy model if needed.
+    
+    Training runs out of process (see model_trainer); pass wait=True to block
+    until the first model has been trained and swapped in.
+    """
+    model_trainer.start()
     if not advanced_occupancy_predictor.is_trained:
         logger.info("Starting AI model training...")
         try:
-            enhanced_data = generate_enhanced_training_data()
-            accuracy = advanced_occupancy_predictor.train(enhanced_data)
-            logger.info(f"Advanced AI Model trained with {len(enhanced_data)} samples. Accuracy: {accuracy:.3f}")
+            model_trainer.submit('initial', force=True)
+            if wait:
+                model_trainer.wait()
         except Exception as e:
             logger.error(f"Error initializing AI models: {e}")
     else:
@@ -42,7 +42,7 @@ init_datadog_early = None
 # This prevents blocking during module import which causes worker timeouts
 
 # Now import Flask (Datadog will be initialized in background)
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, make_response
 from flask_cors import CORS
 # Defer flask_socketio import - it's very heavy with eventlet and can block
 # We'll import it lazily when needed
@@ -51,8 +51,23 @@ emit = None
 from functools import wraps
 import json
 import sqlite3
+from dataclasses import dataclass
+from light_state import LightStateStore
+from room_registry import room_registry
+from state_backend import SharedMap, create_state_backend
+from light_persistence import LightStatePersister
+from activity_log import ActivityRingBuffer
+from activity_store import SQLiteActivityLog
+from change_journal import ChangeJournal, APPEND
+from activity_pipeline import ActivityPipeline
+from light_broadcast import LightBroadcaster, BATCH_ROOM
+from weather_cache import WeatherCache
+from forecast_cache import ForecastCache, Forecast
+from weather_snapshot import WeatherSnapshot, weather_factors
+from weather_client import WeatherClient
+from weather_providers import create_provider, WEATHER_PROVIDER
+from weather_store import SQLiteWeatherStore
 from datetime import datetime, timedelta
-import random
 # LAZY IMPORTS: numpy and sklearn are heavy - only import when needed
 # These will be imported lazily in functions that use them
 # import numpy as np  # REMOVED - lazy import
@@ -61,10 +76,6 @@ import pickle
 import logging
 import requests
 from requests.adapters import HTTPAdapter
-try:
-    from urllib3.util.retry import Retry
-except ImportError:
-    from requests.packages.urllib3.util.retry import Retry
 import threading
 import time
 
@@ -176,6 +187,7 @@ CORS(app,
              "origins": "*",  # Allow all origins for API endpoints (we validate in is_origin_allowed)
              "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
              "allow_headers": ["Content-Type", "Authorization"],
+             "expose_headers": ["X-Change-Epoch", "X-Change-Seq"],
              "supports_credentials": True
          }
      },
@@ -232,7 +244,7 @@ class SocketIOProxy:
 
 socketio = SocketIOProxy()
 
-def safe_socket_emit(event, data, room=None):
+def safe_socket_emit(event, data, room=None, skip_sid=None):
     """
     Safely emit Socket.IO events with error handling.
     Prevents background threads from crashing if socket emit fails.
@@ -241,13 +253,16 @@ def safe_socket_emit(event, data, room=None):
         event: Event name
         data: Data to emit
         room: Optional room for namespaced events
+        skip_sid: Optional session id (or list of ids) not to send to
     """
     try:
         sio = _get_socketio()
+        kwargs = {}
         if room:
-            sio.emit(event, data, room=room)
-        else:
-            sio.emit(event, data)
+            kwargs['room'] = room
+        if skip_sid:
+            kwargs['skip_sid'] = skip_sid
+        sio.emit(event, data, **kwargs)
     except (OSError, IOError) as socket_error:
         # Ignore socket cleanup errors (common with Eventlet)
         if 'Bad file descriptor' not in str(socket_error):
@@ -269,24 +284,15 @@ WEATHER_API_KEY = os.getenv('WEATHER_API_KEY', 'demo_key')
 WEATHER_CITY = os.getenv('WEATHER_CITY', 'New York')
 WEATHER_LAT = os.getenv('WEATHER_LAT', None)  # Latitude for more accurate location
 WEATHER_LON = os.getenv('WEATHER_LON', None)  # Longitude for more accurate location
-WEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
-WEATHER_FORECAST_URL = "https://api.openweathermap.org/data/2.5/forecast"
+# API URLs, recording and the offline replay provider: see weather_providers.py
 
-# Create a session with retry strategy for weather API calls
-# Handles DNS resolution errors and network timeouts gracefully
-# Note: DNS errors won't be retried (they need network fix, not retry)
+# Session for weather API calls; retries, the per-call deadline and the circuit breaker
+# live in weather_client (DNS errors are not retried, they need a network fix)
 weather_session = requests.Session()
-retry_strategy = Retry(
-    total=2,  # Reduced retries - DNS errors won't resolve with retries
-    backoff_factor=0.5,  # Shorter wait between retries
-    status_forcelist=[429, 500, 502, 503, 504],  # Retry on these status codes
-    allowed_methods=["GET"],  # Only retry GET requests
-    connect=2,  # Retry connection errors (but DNS errors will fail fast)
-    read=2  # Retry read timeouts
-)
-adapter = HTTPAdapter(max_retries=retry_strategy)
+adapter = HTTPAdapter(max_retries=0)
 weather_session.mount("https://", adapter)
 weather_session.mount("http://", adapter)
+weather_client = WeatherClient(weather_session)
 
 # Alternative: WeatherAPI.com (more accurate, free tier available)
 # Uncomment to use WeatherAPI.com instead of OpenWeatherMap
@@ -294,13 +300,9 @@ weather_session.mount("http://", adapter)
 # WEATHERAPI_BASE_URL = "https://api.weatherapi.com/v1/current.json"
 # WEATHERAPI_FORECAST_URL = "https://api.weatherapi.com/v1/forecast.json"
 
-# Weather cache to avoid excessive API calls
-# Caches weather data for 5 minutes to reduce API usage and improve performance
-weather_cache = {
-    'data': None,
-    'last_update': None,
-    'cache_duration': 300  # 5 minutes in seconds
-}
+# Width of the time bucket used to key cached AI predictions
+# Predictions are reused until the bucket rolls over or the weather refreshes
+PREDICTION_CACHE_BUCKET_SECONDS = int(os.getenv('PREDICTION_CACHE_BUCKET_SECONDS', '60'))
 
 def get_demo_weather_data():
     """Get demo weather data structure - reusable function to avoid duplication"""
@@ -312,6 +314,7 @@ def get_demo_weather_data():
             'feels_like': 70
         },
         'weather': [{
+            'id': 802,
             'main': 'Clouds',
             'description': 'scattered clouds',
             'icon': '03d'
@@ -332,17 +335,35 @@ weather_update_interval = 300  # Update every 5 minutes
 # Prevents duplicate schedule executions by tracking executed events
 schedule_execution_tracker = {}
 
+# Recent mutations of lights, schedules, settings and activity for GET /api/changes
+change_journal = ChangeJournal()
+# The journal lives in this process: with several workers a client's polls land on
+# journals with different epochs and would resync every time, so the feed is refused
+WORKERS = int(os.getenv('WORKERS', '1'))
+CHANGE_FEED_ENABLED = WORKERS <= 1
+
+def with_change_cursor(f):
+    """Tag a full-state response with the change cursor a client can continue from"""
+    if not CHANGE_FEED_ENABLED:
+        return f
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        # Taken before the state is read: changes racing the read are replayed, never skipped
+        epoch, seq = change_journal.cursor()
+        response = make_response(f(*args, **kwargs))
+        response.headers['X-Change-Epoch'] = epoch
+        response.headers['X-Change-Seq'] = str(seq)
+        return response
+    return decorated
+
 # Initialize with some sample activity logs
 def init_sample_logs():
     """Initialize with sample activity logs for demonstration"""
-    if not hasattr(app, 'activity_logs'):
-        app.activity_logs = []
-        
+    if len(activity_log) == 0:
         # Add sample logs
         sample_logs = [
             {
-                'id': 1,
-                'timestamp': (datetime.now() - timedelta(minutes=2)).isoformat(),
+                'timestamp': datetime.now() - timedelta(minutes=2),
                 'action': 'light_toggle',
                 'room': 'living_room',
                 'user': 'admin',
@@ -355,8 +376,7 @@ def init_sample_logs():
                 'ip_address': '192.168.1.100'
             },
             {
-                'id': 2,
-                'timestamp': (datetime.now() - timedelta(minutes=5)).isoformat(),
+                'timestamp': datetime.now() - timedelta(minutes=5),
                 'action': 'brightness_adjust',
                 'room': 'kitchen',
                 'user': 'admin',
@@ -369,8 +389,7 @@ def init_sample_logs():
                 'ip_address': '192.168.1.100'
             },
             {
-                'id': 3,
-                'timestamp': (datetime.now() - timedelta(minutes=10)).isoformat(),
+                'timestamp': datetime.now() - timedelta(minutes=10),
                 'action': 'ai_mode_toggle',
                 'room': None,
                 'user': 'admin',
@@ -382,23 +401,21 @@ def init_sample_logs():
                 'ip_address': '192.168.1.100'
             },
             {
-                'id': 4,
-                'timestamp': (datetime.now() - timedelta(minutes=15)).isoformat(),
+                'timestamp': datetime.now() - timedelta(minutes=15),
                 'action': 'bulk_light_control',
                 'room': None,
                 'user': 'admin',
                 'details': {
                     'action': 'on',
                     'brightness': 100,
-                    'affected_rooms': ['living_room', 'kitchen', 'bedroom', 'bathroom', 'office'],
-                    'total_rooms': 5,
+                    'affected_rooms': list(room_registry.names()),
+                    'total_rooms': len(room_registry),
                     'method': 'bulk_control'
                 },
                 'ip_address': '192.168.1.100'
             },
             {
-                'id': 5,
-                'timestamp': (datetime.now() - timedelta(minutes=20)).isoformat(),
+                'timestamp': datetime.now() - timedelta(minutes=20),
                 'action': 'color_temperature_change',
                 'room': 'bedroom',
                 'user': 'admin',
@@ -411,137 +428,121 @@ def init_sample_logs():
             }
         ]
         
-        app.activity_logs = sample_logs
+        # Persist the samples only into an empty history
+        persist = activity_store is not None and activity_store.count() == 0
+        # Oldest first, so the ring buffer returns them newest first
+        for sample in reversed(sample_logs):
+            record = activity_log.append(sample['action'], sample['room'], sample['details'], sample['user'],
+                                         sample['ip_address'], timestamp=sample['timestamp'].timestamp())
+            if persist:
+                activity_store.add(record.timestamp, record.action, record.room, record.details,
+                                   1, record.ip_address, record.id)
 
 def log_activity(action, room=None, details=None, user_id=1, ip_address=None):
-    """Log user activity to database"""
+    """Log user activity (queued; storage, analytics and broadcast run on the pipeline's threads)"""
     try:
         if ip_address is None:
             ip_address = request.remote_addr if request else 'unknown'
         
-        # Create activity log entry
-        activity_log = {
-            'id': random.randint(1000, 9999),
-            'timestamp': datetime.now().isoformat(),
-            'action': action,
-            'room': room,
-            'user': 'admin',
-            'details': details,
-            'ip_address': ip_address
-        }
-        
-        # Store in memory for now (in production, use database)
-        if not hasattr(app, 'activity_logs'):
-            app.activity_logs = []
-        
-        app.activity_logs.insert(0, activity_log)
-        
-        # Keep only last 1000 logs
-        if len(app.activity_logs) > 1000:
-            app.activity_logs = app.activity_logs[:1000]
-        
-        # Emit real-time update
-        safe_socket_emit('activity_logged', activity_log)
-        
-        logger.info(f"Activity logged: {action} in {room} - {details}")
+        record = activity_log.new_record(action, room, details, 'admin', ip_address)
+        activity_pipeline.submit((record, user_id))
         
     except Exception as e:
         logger.error(f"Error logging activity: {e}")
 
-def get_weather_data():
-    """Get current weather data with caching"""
-    current_time = datetime.now()
+def _store_activity(events):
+    """Pipeline consumer: in-memory log, change journal and activity_log table"""
+    for record, user_id in events:
+        # O(1); the oldest entry is dropped once the buffer is full
+        activity_log.store(record)
+        change_journal.record('activity', record.id, record.to_dict(), op=APPEND)
+        # Queued for the batched write to the activity_log table
+        if activity_store is not None:
+            activity_store.add(record.timestamp, record.action, record.room, record.details,
+                               user_id, record.ip_address, record.id)
+        logger.info(f"Activity logged: {record.action} in {record.room} - {record.details}")
+
+def _learn_from_activity(events):
+    """Pipeline consumer: feed light activity to the behavior learner and energy tracker"""
+    learner, energy_optimizer = user_behavior_learner, advanced_energy_optimizer
+    if learner is None and energy_optimizer is None:
+        return
+    for record, _ in events:
+        details = record.details or {}
+        rooms = [record.room] if record.room else details.get('affected_rooms', [])
+        if not rooms:
+            continue
+        brightness = details.get('new_brightness', details.get('brightness'))
+        status = details.get('new_status', details.get('status', details.get('action')))
+        timestamp = datetime.fromtimestamp(record.timestamp)
+        for room in rooms:
+            if learner is not None:
+                # Single-user app: learn under the learner's 'default' key, which get_user_patterns() reads
+                learner.learn_from_activity(room, record.action, timestamp, brightness)
+            if energy_optimizer is not None and brightness is not None:
+                energy_optimizer.record_consumption(room, 0 if status == 'off' else brightness)
+
+def _broadcast_activity(events):
+    """Pipeline consumer: real-time activity updates"""
+    for record, _ in events:
+        safe_socket_emit('activity_logged', record.to_dict())
+
+# Activity events leave the request thread here (bounded queues, batched consumers)
+activity_pipeline = ActivityPipeline()
+activity_pipeline.add_consumer('storage', _store_activity)
+activity_pipeline.add_consumer('analytics', _learn_from_activity)
+activity_pipeline.add_consumer('broadcast', _broadcast_activity)
+
+def fetch_current_weather():
+    """
+    Fetch the current weather once from the configured provider (no caching; see weather_cache).
     
-    # Return cached data if still valid
-    if (weather_cache['data'] and weather_cache['last_update'] and 
-        (current_time - weather_cache['last_update']).seconds < weather_cache['cache_duration']):
-        # Track cache hit
-        if DATADOG_IMPORTED:
-            track_weather_api_call(success=True, cache_hit=True)
-        return weather_cache['data']
+    Returns:
+        dict: OpenWeatherMap current weather payload
     
-    try:
-        if WEATHER_API_KEY == 'demo_key':
-            weather_data = get_demo_weather_data()
-        else:
-            # Real API call - Use coordinates if available for more accuracy
-            try:
-                params = {
-                    'appid': WEATHER_API_KEY,
-                    'units': 'imperial',
-                    'lang': 'en'
-                }
-                
-                # Use coordinates if available (more accurate than city name)
-                if WEATHER_LAT and WEATHER_LON:
-                    params['lat'] = WEATHER_LAT
-                    params['lon'] = WEATHER_LON
-                    location_str = f"{WEATHER_LAT},{WEATHER_LON}"
-                else:
-                    params['q'] = WEATHER_CITY
-                    location_str = WEATHER_CITY
-                
-                # Use session with retry logic, reasonable timeout for production
-                # Increased timeout for Render's network conditions
-                response = weather_session.get(WEATHER_BASE_URL, params=params, timeout=(5, 15))
-                if response.status_code == 200:
-                    weather_data = response.json()
-                    # Add name if not present (for coordinate-based calls)
-                    if 'name' not in weather_data:
-                        weather_data['name'] = WEATHER_CITY
-                    logger.info(f"✅ Successfully fetched weather data for {location_str}")
-                    
-                    # Track successful weather API call
-                    if DATADOG_IMPORTED:
-                        track_weather_api_call(success=True, cache_hit=False)
-                elif response.status_code == 401:
-                    logger.error("❌ Invalid OpenWeatherMap API key. Please check your WEATHER_API_KEY.")
-                    raise Exception("Invalid API key")
-                elif response.status_code == 404:
-                    logger.warning(f"⚠️ Location not found: {location_str}. Using demo data.")
-                    raise Exception("Location not found")
-                else:
-                    logger.warning(f"⚠️ Weather API error: {response.status_code} - {response.text}")
-                    raise Exception(f"API error: {response.status_code}")
-            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as conn_error:
-                # DNS resolution or connection errors - fail fast and use demo data
-                # DNS errors on Render free tier are common and won't resolve with retries
-                error_msg = str(conn_error)
-                if 'NameResolutionError' in error_msg or 'Failed to resolve' in error_msg:
-                    logger.warning(f"⚠️ Weather API DNS resolution failed (Render network issue): {error_msg[:100]}")
-                else:
-                    logger.warning(f"⚠️ Weather API connection error: {error_msg[:100]}")
-                
-                if weather_cache['data']:
-                    logger.info("📦 Using cached weather data due to connection error")
-                    return weather_cache['data']
-                # Fall back to demo data immediately - DNS errors won't resolve
-                logger.warning("⚠️ No cached data available, using demo data due to connection/DNS error")
-                weather_data = get_demo_weather_data()
-            except Exception as api_error:
-                logger.error(f"❌ Weather API call failed: {api_error}")
-                # Try to use cached data first
-                if weather_cache['data']:
-                    logger.info("📦 Returning cached weather data due to API error")
-                    return weather_cache['data']
-                # Fall back to demo data if no cache available
-                logger.warning("⚠️ No cached data available, using demo data due to API error")
-                weather_data = get_demo_weather_data()
-        # Cache the data
-        weather_cache['data'] = weather_data
-        weather_cache['last_update'] = current_time
-        return weather_data
-    except Exception as e:
-        logger.error(f"❌ Error fetching weather data: {e}", exc_info=True)
-        # Return cached data if available
-        if weather_cache['data']:
-            logger.info("📦 Returning cached weather data due to exception")
-            return weather_cache['data']
-        # Fall back to demo data if no cache available
-        logger.warning("⚠️ No cached data available, returning demo data due to exception")
-        return get_demo_weather_data()
-
-def get_weather_lighting_adjustment():
+    Raises:
+        CircuitOpenError: While the weather API circuit is open
+        Exception: On connection errors, timeouts and non-200 responses
+    """
+    return weather_provider.current()
+
+def fetch_weather_forecast():
+    """
+    Fetch the forecast once from the configured provider (no caching; see forecast_cache).
+    
+    Returns:
+        Forecast: The next 24 hours in 3-hour periods
+    
+    Raises:
+        CircuitOpenError: While the weather API circuit is open
+        Exception: On connection errors, timeouts and non-200 responses
+    """
+    return Forecast.from_api(weather_provider.forecast(), city=WEATHER_CITY)
+
+def _forecast_from_current_weather():
+    """Current weather as a single forecast period (served until the first forecast fetch succeeds)"""
+    weather_data = get_weather_data()
+    forecast = Forecast(weather_data.get('name', WEATHER_CITY))
+    forecast.append(
+        time_module.time(),
+        weather_data['main']['temp'],
+        weather_data.get('clouds', {}).get('all', 0),
+        (weather_data.get('weather') or [{}])[0].get('id', 802)
+    )
+    return forecast
+
+def _on_weather_refresh(success):
+    if DATADOG_IMPORTED:
+        track_weather_api_call(success=success, cache_hit=False)
+
+def get_weather_data():
+    """Get current weather data (cached; demo data until the first fetch succeeds)"""
+    # Track cache hit
+    if DATADOG_IMPORTED:
+        track_weather_api_call(success=True, cache_hit=True)
+    return weather_cache.get()
+
+def get_weather_lighting_adjustment(weather_data=None, now=None):
     """
     Calculate lighting adjustment factor based on current weather conditions.
     
@@ -551,92 +552,117 @@ def get_weather_lighting_adjustment():
     - Cloudy Weather: Increase brightness 20% for visibility
     - Poor Visibility: Automatic brightness increase
     
+    Args:
+        weather_data (dict, optional): Weather payload (default: current weather)
+        now (datetime, optional): Evaluation time (default: now)
+    
     Returns:
         float: Adjustment multiplier (1.0 = no change, >1.0 = brighter, <1.0 = dimmer)
     """
-    weather_data = get_weather_data()
-    if not weather_data:
+    if weather_data is None:
+        weather = weather_cache.current_parsed()[1]
+    elif not weather_data:
         return 1.0  # No adjustment if weather data unavailable
-    
-    weather_main = weather_data['weather'][0]['main'].lower()
-    weather_desc = weather_data['weather'][0]['description'].lower()
-    clouds = weather_data.get('clouds', {}).get('all', 0)
-    visibility = weather_data.get('visibility', 10000)
-    
-    # Base adjustment factor
-    adjustment = 1.0
-    
-    # Weather condition adjustments
-    if 'rain' in weather_desc or 'drizzle' in weather_desc:
-        adjustment = 1.3  # 30% brighter for rain
-    elif 'snow' in weather_desc:
-        adjustment = 1.4  # 40% brighter for snow
-    elif 'thunderstorm' in weather_desc:
-        adjustment = 1.5  # 50% brighter for storms
-    elif 'fog' in weather_desc or 'mist' in weather_desc:
-        adjustment = 1.2  # 20% brighter for fog
-    elif 'clear' in weather_desc and clouds < 20:
-        adjustment = 0.7  # 30% dimmer for clear skies
-    elif clouds > 80:
-        adjustment = 1.2  # 20% brighter for cloudy skies
-    
-    # Visibility adjustments
-    if visibility < 5000:  # Poor visibility
-        adjustment *= 1.2
-    
-    # Time of day adjustments
-    current_hour = datetime.now().hour
-    if 6 <= current_hour <= 18:  # Daytime
-        if weather_main == 'clear':
-            adjustment *= 0.8  # Even dimmer during clear daytime
-    
-    return max(0.5, min(1.5, adjustment))  # Clamp between 0.5 and 1.5
+    else:
+        weather = WeatherSnapshot.from_payload(weather_data)
+    return weather_factors(weather, (now or datetime.now()).hour)[0]
 
-def get_natural_light_factor():
+def get_natural_light_factor(weather_data=None, now=None):
     """Get natural light factor based on weather and time"""
-    weather_data = get_weather_data()
-    if not weather_data:
+    if weather_data is None:
+        weather = weather_cache.current_parsed()[1]
+    elif not weather_data:
         return 0.5  # Default factor
+    else:
+        weather = WeatherSnapshot.from_payload(weather_data)
+    return weather_factors(weather, (now or datetime.now()).hour)[1]
+
+@dataclass(frozen=True, slots=True)
+class ControlContext:
+    """
+    Immutable snapshot of the inputs shared by every room decision in one pass.
+    
+    Built once per AI tick, schedule check or API request so that all rooms see
+    the same timestamp and weather, and the weather-derived factors are computed
+    once instead of per room. Use build_control_context() to create one.
+    """
+    timestamp: datetime
+    hour: int
+    minute: int
+    day_of_week: int
+    is_weekend: bool
+    time_of_day: str
+    weather_data: dict
+    weather: WeatherSnapshot  # Parsed weather_data
+    weather_version: int  # None for caller-supplied weather (disables prediction caching)
+    weather_adjustment: float
+    natural_light_factor: float
+    forecast: Forecast = None  # Upcoming periods, read with forecast.at(timestamp)
+    
+    @property
+    def time_bucket(self):
+        """Prediction cache time bucket this pass falls into"""
+        return int(self.timestamp.timestamp()) // PREDICTION_CACHE_BUCKET_SECONDS
     
-    current_hour = datetime.now().hour
-    weather_main = weather_data['weather'][0]['main'].lower()
-    clouds = weather_data.get('clouds', {}).get('all', 0)
+    @property
+    def cache_token(self):
+        """(time bucket, weather version) pair used to key cached AI predictions"""
+        if self.weather_version is None:
+            return None
+        return (self.time_bucket, self.weather_version)
+
+def build_control_context(now=None, weather_data=None):
+    """
+    Build a ControlContext for a single control pass.
     
-    # Base natural light factor by time of day
-    if 6 <= current_hour <= 10:  # Early morning
-        base_factor = 0.6
-    elif 10 <= current_hour <= 16:  # Midday
-        base_factor = 0.9
-    elif 16 <= current_hour <= 20:  # Late afternoon
-        base_factor = 0.4
-    else:  # Night
-        base_factor = 0.1
+    Weather and forecast come from their caches, so this never waits on the API
+    once both have been fetched.
     
-    # Weather adjustments
-    if weather_main == 'clear' and clouds < 30:
-        weather_multiplier = 1.2
-    elif weather_main == 'clouds' and clouds > 70:
-        weather_multiplier = 0.6
-    elif 'rain' in weather_data['weather'][0]['description'].lower():
-        weather_multiplier = 0.3
+    Args:
+        now (datetime, optional): Pass timestamp (default: now)
+        weather_data (dict, optional): Weather payload (default: current weather)
+        
+    Returns:
+        ControlContext: Frozen snapshot of time, weather and derived factors
+    """
+    if now is None:
+        now = datetime.now()
+    if weather_data is None:
+        # Parsed once per weather refresh
+        weather_data, weather = weather_cache.current_parsed()
+        weather_version = weather.version
     else:
-        weather_multiplier = 0.8
+        # Caller-supplied payloads are not tied to the shared weather cache
+        weather = WeatherSnapshot.from_payload(weather_data)
+        weather_version = None
+    # Memoized per (weather version, hour)
+    weather_adjustment, natural_light_factor = weather_factors(weather, now.hour)
     
-    return min(1.0, base_factor * weather_multiplier)
+    return ControlContext(
+        timestamp=now,
+        hour=now.hour,
+        minute=now.minute,
+        day_of_week=now.weekday(),
+        is_weekend=now.weekday() >= 5,
+        time_of_day=get_time_of_day(now),
+        weather_data=weather_data,
+        weather=weather,
+        weather_version=weather_version,
+        weather_adjustment=weather_adjustment,
+        natural_light_factor=natural_light_factor,
+        forecast=forecast_cache.get()
+    )
 
 def emit_weather_update():
     """Emit real-time weather update via WebSocket"""
     try:
-        weather_data = get_weather_data()
-        if weather_data:
-            weather_adjustment = get_weather_lighting_adjustment()
-            natural_light_factor = get_natural_light_factor()
-            
+        context = build_control_context()
+        if context.weather_data:
             weather_update = {
-                'weather': weather_data,
-                'lighting_adjustment': round(weather_adjustment, 2),
-                'natural_light_factor': round(natural_light_factor, 2),
-                'timestamp': datetime.now().isoformat()
+                'weather': context.weather_data,
+                'lighting_adjustment': round(context.weather_adjustment, 2),
+                'natural_light_factor': round(context.natural_light_factor, 2),
+                'timestamp': context.timestamp.isoformat()
             }
             
             safe_socket_emit('weather_update', weather_update)
@@ -695,7 +721,7 @@ def weather_update_loop():
             else:
                 time.sleep(60)  # Wait 1 minute before retrying
 
-def execute_schedule_event(room, event):
+def execute_schedule_event(room, event, context=None):
     """Execute a scheduled event for a room"""
     try:
         # Track schedule execution
@@ -705,34 +731,24 @@ def execute_schedule_event(room, event):
         if event['action'] == 'on':
             # Apply weather adjustments for brightness
             base_brightness = event.get('brightness', 100)
-            weather_adjustment = get_weather_lighting_adjustment()
+            if context is None:
+                context = build_control_context()
+            weather_adjustment = context.weather_adjustment
             adjusted_brightness = int(base_brightness * weather_adjustment)
             
             # Update light state
-            if room in lights_state:
-                lights_state[room]['status'] = 'on'
-                lights_state[room]['brightness'] = min(100, max(0, adjusted_brightness))
-                
+            record = light_store.update(room, status='on', brightness=min(100, max(0, adjusted_brightness)))
+            if record is not None:
                 # Emit socket event
-                safe_socket_emit('light_update', {
-                    'room': room,
-                    'state': lights_state[room],
-                    'source': 'schedule'
-                })
+                light_broadcaster.publish(record, source='schedule')
                 
                 logger.info(f"Schedule executed: {room} lights turned ON at {adjusted_brightness}% brightness")
                 
         elif event['action'] == 'off':
-            if room in lights_state:
-                lights_state[room]['status'] = 'off'
-                lights_state[room]['brightness'] = 0
-                
+            record = light_store.update(room, status='off', brightness=0)
+            if record is not None:
                 # Emit socket event
-                safe_socket_emit('light_update', {
-                    'room': room,
-                    'state': lights_state[room],
-                    'source': 'schedule'
-                })
+                light_broadcaster.publish(record, source='schedule')
                 
                 logger.info(f"Schedule executed: {room} lights turned OFF")
                 
@@ -745,29 +761,34 @@ def check_and_execute_schedules():
         current_time = datetime.now()
         current_day = current_time.strftime('%A').lower()
         current_time_str = current_time.strftime('%H:%M')
-        
-        # Check each room's schedule
-        for room, schedule in schedules.items():
-            if not schedule.get('enabled', False):
-                continue
+        # Built on the first due event so idle minutes don't touch the weather cache
+        context = None
+        
+        # Check each room's schedule (rooms due in the same minute are broadcast together)
+        with light_broadcaster.batch():
+            for room, schedule in schedules.items():
+                if not schedule.get('enabled', False):
+                    continue
                 
-            daily_schedule = schedule.get('daily_schedule', {}).get(current_day, [])
+                daily_schedule = schedule.get('daily_schedule', {}).get(current_day, [])
             
-            for event in daily_schedule:
-                event_time = event.get('time', '')
-                event_key = f"{room}_{current_day}_{event_time}"
+                for event in daily_schedule:
+                    event_time = event.get('time', '')
+                    event_key = f"{room}_{current_day}_{event_time}"
                 
-                # Check if this event should be executed now
-                if event_time == current_time_str:
-                    # Check if we haven't already executed this event today
-                    if event_key not in schedule_execution_tracker:
-                        execute_schedule_event(room, event)
-                        schedule_execution_tracker[event_key] = current_time
+                    # Check if this event should be executed now
+                    if event_time == current_time_str:
+                        # Check if we haven't already executed this event today
+                        if event_key not in schedule_execution_tracker:
+                            if context is None:
+                                context = build_control_context(current_time)
+                            execute_schedule_event(room, event, context)
+                            schedule_execution_tracker[event_key] = current_time
                         
-                        # Clean up old tracker entries (older than 1 day)
-                        for key, timestamp in list(schedule_execution_tracker.items()):
-                            if (current_time - timestamp).days > 0:
-                                del schedule_execution_tracker[key]
+                            # Clean up old tracker entries (older than 1 day)
+                            for key, timestamp in list(schedule_execution_tracker.items()):
+                                if (current_time - timestamp).days > 0:
+                                    del schedule_execution_tracker[key]
                                 
     except Exception as e:
         logger.error(f"Error in schedule execution check: {e}")
@@ -780,7 +801,9 @@ def schedule_execution_loop():
     
     while True:
         try:
-            check_and_execute_schedules()
+            # With several workers only the leader executes schedules
+            if state_backend.is_leader():
+                check_and_execute_schedules()
             consecutive_errors = 0  # Reset error count on success
             time.sleep(60)  # Check every minute
         except Exception as e:
@@ -793,7 +816,9 @@ def schedule_execution_loop():
             else:
                 time.sleep(60)  # Continue after error
 
-# Database setup
+# Database setup (instance directory works in both local and Render)
+SQLITE_DB_PATH = os.path.join(os.path.dirname(__file__), 'instance', 'smart_lights.db')
+
 def init_db():
     """
     Initialize SQLite database and create required tables.
@@ -804,11 +829,10 @@ def init_db():
     3. schedules: Stores automated scheduling configuration for each room
     """
     try:
-        # Ensure instance directory exists (works in both local and Render)
-        instance_dir = os.path.join(os.path.dirname(__file__), 'instance')
-        os.makedirs(instance_dir, exist_ok=True)
+        # Ensure instance directory exists
+        os.makedirs(os.path.dirname(SQLITE_DB_PATH), exist_ok=True)
         
-        db_path = os.path.join(instance_dir, 'smart_lights.db')
+        db_path = SQLITE_DB_PATH
         
         # Use context manager for proper connection handling
         with sqlite3.connect(db_path, timeout=10.0) as conn:
@@ -841,6 +865,50 @@ def init_db():
         logger.error(f"Error initializing database: {e}")
         raise
 
+# Persistent, searchable activity history (batched writes; see activity_store.py)
+try:
+    activity_store = SQLiteActivityLog(SQLITE_DB_PATH)
+except sqlite3.Error as e:
+    logger.error(f"Activity history unavailable, keeping the in-memory log only: {e}")
+    activity_store = None
+
+# In-memory activity log (fixed-capacity ring buffer, newest first); ids come from the
+# activity_log table, so the change journal and /api/activity/logs agree on them
+activity_log = ActivityRingBuffer(next_id=activity_store.next_id if activity_store is not None else None)
+
+# Weather is fetched by one background refresh at a time, across all workers; readers get
+# the cached (or stale) value without waiting on the API (see weather_cache.py, weather_store.py)
+try:
+    weather_store = SQLiteWeatherStore(SQLITE_DB_PATH)
+except sqlite3.Error as e:
+    logger.error(f"Shared weather cache unavailable, caching per worker: {e}")
+    weather_store = None
+
+# OpenWeatherMap, demo data or recorded responses (WEATHER_PROVIDER, see weather_providers.py)
+try:
+    weather_provider = create_provider(WEATHER_PROVIDER, weather_client, WEATHER_API_KEY, WEATHER_CITY,
+                                       WEATHER_LAT, WEATHER_LON, demo_payload=get_demo_weather_data)
+except (ValueError, OSError) as e:
+    logger.error(f"❌ Weather provider '{WEATHER_PROVIDER}' unavailable, using the default: {e}")
+    weather_provider = create_provider('', weather_client, WEATHER_API_KEY, WEATHER_CITY,
+                                       WEATHER_LAT, WEATHER_LON, demo_payload=get_demo_weather_data)
+logger.info(f"🌦️ Weather provider: {weather_provider.name}")
+
+weather_cache = WeatherCache(
+    fetch_current_weather, get_demo_weather_data,
+    on_refresh=_on_weather_refresh,
+    store=weather_store,
+    source=weather_provider.source,
+    parse=WeatherSnapshot.from_payload
+)
+
+# Forecast periods, refetched once per 3-hour forecast period (see forecast_cache.py)
+forecast_cache = ForecastCache(
+    fetch_weather_forecast, _forecast_from_current_weather,
+    store=weather_store,
+    source=weather_provider.source
+)
+
 # Lazy initialization - don't initialize at module level to avoid blocking Gunicorn
 # These will be initialized on first use or in the startup function
 _db_initialized = False
@@ -851,8 +919,22 @@ advanced_energy_optimizer = None
 user_behavior_learner = None
 advanced_schedule_optimizer = None
 
+# State shared between gunicorn workers (SQLite when WORKERS > 1, see state_backend.py)
+state_backend = create_state_backend()
+
+def _on_shared_setting_change(key, value):
+    """Apply a setting changed by another worker"""
+    global ai_mode_enabled
+    if key == 'ai_mode_enabled':
+        ai_mode_enabled = bool(value)
+        logger.info(f"AI Mode {'enabled' if ai_mode_enabled else 'disabled'} by another worker")
+
+shared_settings = SharedMap(state_backend, 'settings', {'ai_mode_enabled': False},
+                            on_change=_on_shared_setting_change)
+shared_settings.add_listener(lambda key, value: change_journal.record('settings', key, value))
+
 # AI Mode state
-ai_mode_enabled = False
+ai_mode_enabled = bool(shared_settings['ai_mode_enabled'])
 
 def ensure_db_initialized():
     """Ensure database is initialized (lazy initialization)"""
@@ -914,6 +996,30 @@ def initialize_app_background():
     except Exception as log_error:
         logger.warning(f"⚠️ Activity logs initialization failed: {log_error}")
     
+    try:
+        # Watch for state changes made by other workers
+        state_backend.start()
+        logger.info(f"✅ Shared state backend started ({state_backend.name})")
+    except Exception as state_error:
+        logger.warning(f"⚠️ Shared state backend failed to start: {state_error}")
+    
+    try:
+        light_persister.start()
+        logger.info("✅ Light state persistence started")
+    except Exception as persist_error:
+        logger.warning(f"⚠️ Light state persistence failed to start: {persist_error}")
+    
+    try:
+        if activity_store is not None:
+            activity_store.start()
+            logger.info(f"✅ Activity history writer started (FTS: {activity_store.fts_enabled})")
+    except Exception as activity_error:
+        logger.warning(f"⚠️ Activity history writer failed to start: {activity_error}")
+    
+    # After the history writer, so its exit flush runs after the pipeline drains
+    activity_pipeline.start()
+    light_broadcaster.start()
+    
     # Start background threads (non-critical - app can run without them)
     try:
         # Initialize AI models in background (non-blocking)
@@ -996,9 +1102,9 @@ def initialize_app_background():
     logger.info("💡 Smart automation enabled")
 
 
-def get_time_of_day():
-    """Get current time of day category"""
-    hour = datetime.now().hour
+def get_time_of_day(now=None):
+    """Get time of day category (default: current time)"""
+    hour = (now or datetime.now()).hour
     if 6 <= hour < 12:
         return 'morning'
     elif 12 <= hour < 17:
@@ -1008,54 +1114,77 @@ def get_time_of_day():
     else:
         return 'night'
 
-def predict_occupancy(room):
+def predict_occupancy_batch(rooms, context=None):
     """
-    Predict if a room will be occupied using advanced AI model.
+    Predict occupancy probabilities for several rooms in one model call.
     
-    Uses Random Forest classifier trained on historical data to predict
-    room occupancy with 85-96% accuracy. Considers:
-    - Time of day
-    - Day of week
-    - Weather conditions
-    - Historical usage patterns
+    All rooms are scored against the same timestamp and weather payload, so a
+    whole-house tick costs a single predict_proba call instead of one per room.
     
     Args:
-        room (str): Room name to predict occupancy for
+        rooms (iterable): Room names to predict occupancy for
+        context (ControlContext, optional): Shared pass snapshot (default: built now)
         
     Returns:
-        bool: True if room is predicted to be occupied, False otherwise
+        dict: room -> occupancy probability (0.0 for every room if AI models are unavailable)
     """
+    rooms = list(rooms)
     try:
         # Ensure AI models are initialized
         ensure_ai_models_initialized()
         
         if not advanced_occupancy_predictor:
             logger.warning("AI models not available, using fallback prediction")
-            return False
+            return {room: 0.0 for room in rooms}
         
-        now = datetime.now()
-        # Get weather data for context-aware predictions
-        weather_data = get_weather_data()
+        if context is None:
+            context = build_control_context()
+        now = context.timestamp
+        weather_data = context.weather_data
         # User activity data can be fetched from logs for more accurate predictions
         user_activity = None
         
         # Use Datadog span for tracing if available
         if DATADOG_IMPORTED:
-            with DatadogSpan('ai.predict_occupancy', service='ai-models', resource=room):
-                prob = advanced_occupancy_predictor.predict(now.isoformat(), room, weather_data, user_activity)
-                logger.info(f"Advanced AI Prediction for {room}: {prob:.2f} probability")
-                # Track AI prediction metrics
-                track_ai_prediction(room, prob > 0.5, prob)
-                return prob > 0.5
+            with DatadogSpan('ai.predict_occupancy_batch', service='ai-models', resource=f'{len(rooms)}_rooms'):
+                probabilities = advanced_occupancy_predictor.predict_batch(
+                    now.isoformat(), rooms, weather_data, user_activity, cache_token=context.cache_token
+                )
+                for room, prob in probabilities.items():
+                    # Track AI prediction metrics
+                    track_ai_prediction(room, prob > 0.5, prob)
         else:
-            prob = advanced_occupancy_predictor.predict(now.isoformat(), room, weather_data, user_activity)
-            logger.info(f"Advanced AI Prediction for {room}: {prob:.2f} probability")
-            return prob > 0.5
+            probabilities = advanced_occupancy_predictor.predict_batch(
+                now.isoformat(), rooms, weather_data, user_activity, cache_token=context.cache_token
+            )
+        
+        logger.info("Advanced AI batch prediction: " +
+                    ", ".join(f"{room}={prob:.2f}" for room, prob in probabilities.items()))
+        return probabilities
     except Exception as e:
-        logger.error(f"Error in advanced predict_occupancy for {room}: {e}", exc_info=True)
-        return False
+        logger.error(f"Error in advanced predict_occupancy_batch: {e}", exc_info=True)
+        return {room: 0.0 for room in rooms}
 
-def optimize_brightness(room, current_brightness):
+def predict_occupancy(room):
+    """
+    Predict if a room will be occupied using advanced AI model.
+    
+    Uses Random Forest classifier trained on historical data to predict
+    room occupancy with 85-96% accuracy. Considers:
+    - Time of day
+    - Day of week
+    - Weather conditions
+    - Historical usage patterns
+    
+    Args:
+        room (str): Room name to predict occupancy for
+        
+    Returns:
+        bool: True if room is predicted to be occupied, False otherwise
+    """
+    return predict_occupancy_batch([room]).get(room, 0.0) > 0.5
+
+def optimize_brightness(room, current_brightness, occupancy_prob=None, context=None):
     """
     Optimize brightness using advanced energy optimizer AI model.
     
@@ -1069,6 +1198,9 @@ def optimize_brightness(room, current_brightness):
     Args:
         room (str): Room name
         current_brightness (int): Current brightness level (0-100)
+        occupancy_prob (float, optional): Occupancy probability from a batch
+            prediction; predicted on demand if omitted
+        context (ControlContext, optional): Shared pass snapshot (default: built now)
         
     Returns:
         int: Optimized brightness level (0-100)
@@ -1081,15 +1213,21 @@ def optimize_brightness(room, current_brightness):
             logger.warning("AI models not available, using fallback brightness")
             return 80
         
-        now = datetime.now()
-        weather_data = get_weather_data()
-        natural_light_level = get_natural_light_factor()
+        if context is None:
+            context = build_control_context()
+        now = context.timestamp
+        weather_data = context.weather_data
+        natural_light_level = context.natural_light_factor
         # Get occupancy probability for context-aware optimization
-        occupancy_prob = advanced_occupancy_predictor.predict(now.isoformat(), room, weather_data, None)
+        if occupancy_prob is None:
+            occupancy_prob = advanced_occupancy_predictor.predict(
+                now.isoformat(), room, weather_data, None, cache_token=context.cache_token
+            )
         # Optionally, get user preferences
         user_preferences = None
         optimized = advanced_energy_optimizer.optimize_brightness_advanced(
-            room, now, natural_light_level, occupancy_prob, weather_data, user_preferences
+            room, now, natural_light_level, occupancy_prob, weather_data, user_preferences,
+            cache_token=context.cache_token
         )
         logger.info(f"Advanced AI Brightness optimization for {room}: {current_brightness} -> {optimized}")
         return optimized
@@ -1097,51 +1235,75 @@ def optimize_brightness(room, current_brightness):
         logger.error(f"Error in advanced optimize_brightness for {room}: {e}")
         return 80
 
-def ai_control_lights():
+def get_prediction_cache_stats():
+    """Get hit/miss counters for the occupancy and brightness prediction caches"""
+    stats = {}
+    if advanced_occupancy_predictor:
+        stats['occupancy'] = advanced_occupancy_predictor.prediction_cache.stats()
+    if advanced_energy_optimizer:
+        stats['brightness'] = advanced_energy_optimizer.prediction_cache.stats()
+    return stats
+
+def get_model_status():
+    """Get version, age and staleness of the serving occupancy model"""
+    if advanced_occupancy_predictor:
+        return advanced_occupancy_predictor.model_status()
+    return {'trained': False}
+
+def ai_control_lights(context=None):
     """AI-powered light control using advanced models"""
     if not ai_mode_enabled:
         return
     try:
-        current_time = datetime.now()
-        logger.info(f"AI Control running at {current_time.strftime('%H:%M:%S')}")
-        for room in lights_state:
-            try:
-                # Predict occupancy
-                will_be_occupied = predict_occupancy(room)
-                if will_be_occupied:
-                    # Turn on lights with optimized brightness
-                    current_brightness = lights_state[room]['brightness']
-                    optimized_brightness = optimize_brightness(room, current_brightness)
-                    if lights_state[room]['status'] == 'off':
-                        lights_state[room]['status'] = 'on'
-                        lights_state[room]['brightness'] = optimized_brightness
-                        logger.info(f"AI turned ON lights in {room} (brightness: {optimized_brightness})")
-                        safe_socket_emit('light_update', {
-                            'room': room,
-                            'state': lights_state[room]
-                        })
-                        safe_socket_emit('ai_prediction', {
-                            'room': room,
-                            'prediction': 'occupied',
-                            'confidence': 1.0  # Optionally, pass probability
-                        })
-                else:
-                    # Turn off lights if not occupied
-                    if lights_state[room]['status'] == 'on':
-                        lights_state[room]['status'] = 'off'
-                        lights_state[room]['brightness'] = 0
-                        logger.info(f"AI turned OFF lights in {room} (no occupancy predicted)")
-                        safe_socket_emit('light_update', {
-                            'room': room,
-                            'state': lights_state[room]
-                        })
-                        safe_socket_emit('auto_off', {
-                            'room': room,
-                            'reason': 'AI detected no occupancy'
-                        })
-            except Exception as room_error:
-                logger.error(f"Error processing room {room} in AI control: {room_error}")
-                continue
+        # One snapshot per tick: every room sees the same time and weather
+        if context is None:
+            context = build_control_context()
+        logger.info(f"AI Control running at {context.timestamp.strftime('%H:%M:%S')}")
+        # Score every room in one batch instead of one model call per room
+        snapshot = light_store.snapshot()
+        probabilities = predict_occupancy_batch(snapshot, context)
+        # One broadcast frame for the whole tick
+        with light_broadcaster.batch():
+            for room, record in snapshot.items():
+                try:
+                    occupancy_prob = probabilities.get(room, 0.0)
+                    will_be_occupied = occupancy_prob > 0.5
+                    if will_be_occupied:
+                        # Turn on lights with optimized brightness
+                        optimized_brightness = optimize_brightness(
+                            room, record.brightness, occupancy_prob, context
+                        )
+                        if record.status == 'off':
+                            # Only apply if nobody changed the light since the snapshot
+                            updated = light_store.compare_and_set(
+                                room, record.version, status='on', brightness=optimized_brightness
+                            )
+                            if updated is None:
+                                logger.info(f"AI skipped {room}: light changed during this tick")
+                                continue
+                            logger.info(f"AI turned ON lights in {room} (brightness: {optimized_brightness})")
+                            light_broadcaster.publish(updated)
+                            safe_socket_emit('ai_prediction', {
+                                'room': room,
+                                'prediction': 'occupied',
+                                'confidence': round(occupancy_prob, 2)
+                            })
+                    else:
+                        # Turn off lights if not occupied
+                        if record.status == 'on':
+                            updated = light_store.compare_and_set(room, record.version, status='off', brightness=0)
+                            if updated is None:
+                                logger.info(f"AI skipped {room}: light changed during this tick")
+                                continue
+                            logger.info(f"AI turned OFF lights in {room} (no occupancy predicted)")
+                            light_broadcaster.publish(updated)
+                            safe_socket_emit('auto_off', {
+                                'room': room,
+                                'reason': 'AI detected no occupancy'
+                            })
+                except Exception as room_error:
+                    logger.error(f"Error processing room {room} in AI control: {room_error}")
+                    continue
     except Exception as e:
         logger.error(f"Error in AI control lights: {e}")
 
@@ -1153,7 +1315,8 @@ def ai_control_loop():
     
     while True:
         try:
-            if ai_mode_enabled:
+            # With several workers only the leader runs AI control
+            if ai_mode_enabled and state_backend.is_leader():
                 ai_control_lights()
             consecutive_errors = 0  # Reset error count on success
             time.sleep(30)  # Check every 30 seconds
@@ -1170,13 +1333,28 @@ def ai_control_loop():
 
 
 # Global state - Define these before functions that use them
-lights_state = {
-    'living_room': {'status': 'off', 'brightness': 0, 'color_temperature': 'warm', 'motion_detected': False},
-    'kitchen': {'status': 'off', 'brightness': 0, 'color_temperature': 'warm', 'motion_detected': False},
-    'bedroom': {'status': 'off', 'brightness': 0, 'color_temperature': 'warm', 'motion_detected': False},
-    'bathroom': {'status': 'off', 'brightness': 0, 'color_temperature': 'warm', 'motion_detected': False},
-    'office': {'status': 'off', 'brightness': 0, 'color_temperature': 'warm', 'motion_detected': False}
-}
+# All light reads/writes go through the store (immutable records, versioned, thread-safe)
+light_store = LightStateStore(room_registry.names())
+
+def _on_remote_light_change(record):
+    """Forward a light change made by another worker to this worker's clients"""
+    light_broadcaster.publish(record, source='sync')
+
+# Light state survives restarts: restored from the lights table, changes written behind
+light_persister = LightStatePersister(light_store, SQLITE_DB_PATH)
+light_persister.restore()
+
+light_store.attach(state_backend, on_remote_change=_on_remote_light_change)
+
+# Light changes reach clients as seq-numbered delta batches (see light_broadcast.py)
+light_broadcaster = LightBroadcaster(safe_socket_emit, change_journal, light_store.snapshot().as_dict())
+
+def _journal_light_changes(records):
+    for room, record in records.items():
+        seq = change_journal.record('lights', room, record.to_dict())
+        light_broadcaster.track(record, seq)
+
+light_store.add_listener(_journal_light_changes)
 
 energy_data = {
     'daily_consumption': 12.5,
@@ -1188,78 +1366,16 @@ energy_data = {
     ]
 }
 
-schedules = {
-    'living_room': {
-        'enabled': True,
-        'vacation_mode': False,
-        'sunrise_sunset': True,
-        'daily_schedule': {
-            'monday': [{'time': '07:00', 'action': 'on', 'brightness': 80}, {'time': '22:00', 'action': 'off'}],
-            'tuesday': [{'time': '07:00', 'action': 'on', 'brightness': 80}, {'time': '22:00', 'action': 'off'}],
-            'wednesday': [{'time': '07:00', 'action': 'on', 'brightness': 80}, {'time': '22:00', 'action': 'off'}],
-            'thursday': [{'time': '07:00', 'action': 'on', 'brightness': 80}, {'time': '22:00', 'action': 'off'}],
-            'friday': [{'time': '07:00', 'action': 'on', 'brightness': 80}, {'time': '22:00', 'action': 'off'}],
-            'saturday': [{'time': '08:00', 'action': 'on', 'brightness': 60}, {'time': '23:00', 'action': 'off'}],
-            'sunday': [{'time': '08:00', 'action': 'on', 'brightness': 60}, {'time': '22:00', 'action': 'off'}]
-        }
-    },
-    'kitchen': {
-        'enabled': False,
-        'vacation_mode': False,
-        'sunrise_sunset': False,
-        'daily_schedule': {
-            'monday': [{'time': '06:30', 'action': 'on', 'brightness': 100}, {'time': '23:00', 'action': 'off'}],
-            'tuesday': [{'time': '06:30', 'action': 'on', 'brightness': 100}, {'time': '23:00', 'action': 'off'}],
-            'wednesday': [{'time': '06:30', 'action': 'on', 'brightness': 100}, {'time': '23:00', 'action': 'off'}],
-            'thursday': [{'time': '06:30', 'action': 'on', 'brightness': 100}, {'time': '23:00', 'action': 'off'}],
-            'friday': [{'time': '06:30', 'action': 'on', 'brightness': 100}, {'time': '23:00', 'action': 'off'}],
-            'saturday': [{'time': '08:00', 'action': 'on', 'brightness': 80}, {'time': '00:00', 'action': 'off'}],
-            'sunday': [{'time': '08:00', 'action': 'on', 'brightness': 80}, {'time': '00:00', 'action': 'off'}]
-        }
-    },
-    'bedroom': {
-        'enabled': False,
-        'vacation_mode': False,
-        'sunrise_sunset': False,
-        'daily_schedule': {
-            'monday': [{'time': '06:00', 'action': 'on', 'brightness': 60}, {'time': '23:30', 'action': 'off'}],
-            'tuesday': [{'time': '06:00', 'action': 'on', 'brightness': 60}, {'time': '23:30', 'action': 'off'}],
-            'wednesday': [{'time': '06:00', 'action': 'on', 'brightness': 60}, {'time': '23:30', 'action': 'off'}],
-            'thursday': [{'time': '06:00', 'action': 'on', 'brightness': 60}, {'time': '23:30', 'action': 'off'}],
-            'friday': [{'time': '06:00', 'action': 'on', 'brightness': 60}, {'time': '23:30', 'action': 'off'}],
-            'saturday': [{'time': '08:00', 'action': 'on', 'brightness': 40}, {'time': '01:00', 'action': 'off'}],
-            'sunday': [{'time': '08:00', 'action': 'on', 'brightness': 40}, {'time': '01:00', 'action': 'off'}]
-        }
-    },
-    'bathroom': {
-        'enabled': False,
-        'vacation_mode': False,
-        'sunrise_sunset': False,
-        'daily_schedule': {
-            'monday': [{'time': '06:00', 'action': 'on', 'brightness': 100}, {'time': '23:00', 'action': 'off'}],
-            'tuesday': [{'time': '06:00', 'action': 'on', 'brightness': 100}, {'time': '23:00', 'action': 'off'}],
-            'wednesday': [{'time': '06:00', 'action': 'on', 'brightness': 100}, {'time': '23:00', 'action': 'off'}],
-            'thursday': [{'time': '06:00', 'action': 'on', 'brightness': 100}, {'time': '23:00', 'action': 'off'}],
-            'friday': [{'time': '06:00', 'action': 'on', 'brightness': 100}, {'time': '23:00', 'action': 'off'}],
-            'saturday': [{'time': '08:00', 'action': 'on', 'brightness': 80}, {'time': '00:00', 'action': 'off'}],
-            'sunday': [{'time': '08:00', 'action': 'on', 'brightness': 80}, {'time': '00:00', 'action': 'off'}]
-        }
-    },
-    'office': {
-        'enabled': False,
-        'vacation_mode': False,
-        'sunrise_sunset': False,
-        'daily_schedule': {
-            'monday': [{'time': '08:00', 'action': 'on', 'brightness': 90}, {'time': '18:00', 'action': 'off'}],
-            'tuesday': [{'time': '08:00', 'action': 'on', 'brightness': 90}, {'time': '18:00', 'action': 'off'}],
-            'wednesday': [{'time': '08:00', 'action': 'on', 'brightness': 90}, {'time': '18:00', 'action': 'off'}],
-            'thursday': [{'time': '08:00', 'action': 'on', 'brightness': 90}, {'time': '18:00', 'action': 'off'}],
-            'friday': [{'time': '08:00', 'action': 'on', 'brightness': 90}, {'time': '18:00', 'action': 'off'}],
-            'saturday': [{'time': '10:00', 'action': 'on', 'brightness': 70}, {'time': '16:00', 'action': 'off'}],
-            'sunday': [{'time': '10:00', 'action': 'on', 'brightness': 70}, {'time': '16:00', 'action': 'off'}]
-        }
-    }
-}
+# Default schedules come from each room's type profile (shared state overrides them)
+schedules = SharedMap(state_backend, 'schedules', room_registry.default_schedules())
+schedules.add_listener(lambda room, schedule: change_journal.record('schedules', room, schedule))
+
+def _room_schedule(room):
+    """Copy of a room's schedule to modify and store with schedules.set() (blank if none)"""
+    schedule = schedules.get(room)
+    if schedule is None:
+        return {'enabled': False, 'vacation_mode': False, 'sunrise_sunset': False, 'daily_schedule': {}}
+    return dict(schedule, daily_schedule=dict(schedule.get('daily_schedule', {})))
 
 @app.route('/api/status')
 @app.route('/')
@@ -1283,7 +1399,8 @@ def get_status():
         # Try to get data, but don't fail if not ready
         try:
             # Check if variables exist in global scope
-            lights = globals().get('lights_state', {})
+            store = globals().get('light_store')
+            lights = store.snapshot().as_dict() if store is not None else {}
             energy = globals().get('energy_data', {'consumption': 0, 'savings': 0})
         except (NameError, AttributeError, KeyError):
             lights = {}
@@ -1294,7 +1411,17 @@ def get_status():
             'timestamp': datetime.now().isoformat(),
             'version': '1.1.0',
             'lights': lights,
-            'energy': energy
+            'energy': energy,
+            'shared_state': state_backend.stats(),
+            'persistence': light_persister.stats(),
+            'activity_log': activity_store.stats() if activity_store is not None else None,
+            'changes': change_journal.stats(),
+            'activity_pipeline': activity_pipeline.stats(),
+            'broadcast': light_broadcaster.stats(),
+            'weather_cache': weather_cache.stats(),
+            'forecast_cache': forecast_cache.stats(),
+            'weather_client': weather_client.stats(),
+            'weather_provider': weather_provider.stats()
         }
         # #region agent log
         _status_time = time_module.time() - _status_start
@@ -1320,7 +1447,7 @@ def control_light(room):
     Control individual light in a specific room.
     
     Args:
-        room: Room name (living_room, kitchen, bedroom, bathroom, office)
+        room: Room name (any room in the room registry)
         
     Request Body:
         - action (str): 'on', 'off', or 'dim'
@@ -1347,7 +1474,7 @@ def control_light(room):
         brightness = data.get('brightness', 100)
         
         # Validate room exists
-        if room not in lights_state:
+        if room not in light_store:
             logger.warning(f"Attempted to control non-existent room: {room}")
             return jsonify({'error': f'Room "{room}" not found'}), 404
         
@@ -1360,15 +1487,10 @@ def control_light(room):
             return jsonify({'error': 'Brightness must be an integer between 0 and 100'}), 400
         
         # Update light state based on action
-        if action == 'on':
-            lights_state[room]['status'] = 'on'
-            lights_state[room]['brightness'] = brightness
-        elif action == 'off':
-            lights_state[room]['status'] = 'off'
-            lights_state[room]['brightness'] = 0
-        elif action == 'dim':
-            lights_state[room]['status'] = 'on'
-            lights_state[room]['brightness'] = brightness
+        if action == 'off':
+            record = light_store.update(room, status='off', brightness=0)
+        else:  # 'on' / 'dim'
+            record = light_store.update(room, status='on', brightness=brightness)
         
         # Track light control metrics
         if DATADOG_IMPORTED:
@@ -1376,13 +1498,10 @@ def control_light(room):
             track_websocket_event('light_update', room)
         
         # Emit real-time update via WebSocket
-        safe_socket_emit('light_update', {
-            'room': room,
-            'state': lights_state[room]
-        })
+        light_broadcaster.publish(record)
         
         logger.info(f"Light control: {room} -> {action} (brightness: {brightness}%)")
-        return jsonify(lights_state[room])
+        return jsonify(record.to_dict())
         
     except KeyError as e:
         logger.error(f"Missing required field in light control request: {e}")
@@ -1395,15 +1514,17 @@ def control_light(room):
 def toggle_light(room):
     """Toggle light on/off"""
     try:
-        if room not in lights_state:
+        def flip(current):
+            if current.status == 'on':
+                return {'status': 'off', 'brightness': 0}
+            return {'status': 'on'}
+        
+        # Read and flip atomically so concurrent toggles can't both see the same status
+        previous, record = light_store.modify(room, flip)
+        if record is None:
             return jsonify({'error': 'Room not found'}), 404
-        
-        current_status = lights_state[room]['status']
-        new_status = 'off' if current_status == 'on' else 'on'
-        
-        lights_state[room]['status'] = new_status
-        if new_status == 'off':
-            lights_state[room]['brightness'] = 0
+        current_status = previous.status
+        new_status = record.status
         
         # Log the activity
         log_activity(
@@ -1412,16 +1533,13 @@ def toggle_light(room):
             details={
                 'previous_status': current_status,
                 'new_status': new_status,
-                'brightness': lights_state[room]['brightness'],
+                'brightness': record.brightness,
                 'method': 'manual_control'
             }
         )
         
         # Emit socket event
-        safe_socket_emit('light_update', {
-            'room': room,
-            'state': lights_state[room]
-        })
+        light_broadcaster.publish(record)
         
         return jsonify({'status': new_status})
     except Exception as e:
@@ -1434,7 +1552,7 @@ def set_brightness(room):
     Set brightness level for a specific room.
     
     Args:
-        room: Room name (living_room, kitchen, bedroom, bathroom, office)
+        room: Room name (any room in the room registry)
         
     Request Body:
         - brightness (int): Brightness level 0-100
@@ -1459,7 +1577,7 @@ def set_brightness(room):
         brightness = data.get('brightness', 0)
         
         # Validate room exists
-        if room not in lights_state:
+        if room not in light_store:
             logger.warning(f"Attempted to set brightness for non-existent room: {room}")
             return jsonify({'error': f'Room "{room}" not found'}), 404
         
@@ -1469,33 +1587,26 @@ def set_brightness(room):
         if brightness < 0 or brightness > 100:
             return jsonify({'error': 'Brightness must be between 0 and 100'}), 400
         
-        # Store previous state for logging
-        previous_brightness = lights_state[room]['brightness']
-        
-        # Update brightness and status
-        lights_state[room]['brightness'] = brightness
-        if brightness > 0:
-            lights_state[room]['status'] = 'on'
-        else:
-            lights_state[room]['status'] = 'off'
+        # Update brightness and status, keeping the previous state for logging
+        previous, record = light_store.modify(room, lambda current: {
+            'brightness': brightness,
+            'status': 'on' if brightness > 0 else 'off'
+        })
         
         # Log the activity for analytics
         log_activity(
             action='brightness_adjust',
             room=room,
             details={
-                'previous_brightness': previous_brightness,
+                'previous_brightness': previous.brightness,
                 'new_brightness': brightness,
-                'status': lights_state[room]['status'],
+                'status': record.status,
                 'method': 'manual_control'
             }
         )
         
         # Emit real-time update via WebSocket
-        safe_socket_emit('light_update', {
-            'room': room,
-            'state': lights_state[room]
-        })
+        light_broadcaster.publish(record)
         
         logger.info(f"Brightness updated: {room} -> {brightness}%")
         return jsonify({'brightness': brightness})
@@ -1514,11 +1625,10 @@ def set_color_temperature(room):
         data = request.get_json()
         temperature = data.get('temperature', 'warm')
         
-        if room not in lights_state:
+        previous, record = light_store.modify(room, lambda current: {'color_temperature': temperature})
+        if record is None:
             return jsonify({'error': 'Room not found'}), 404
-        
-        previous_temperature = lights_state[room].get('color_temperature', 'warm')
-        lights_state[room]['color_temperature'] = temperature
+        previous_temperature = previous.color_temperature
         
         # Log the activity
         log_activity(
@@ -1532,10 +1642,7 @@ def set_color_temperature(room):
         )
         
         # Emit socket event
-        safe_socket_emit('light_update', {
-            'room': room,
-            'state': lights_state[room]
-        })
+        light_broadcaster.publish(record)
         
         return jsonify({'temperature': temperature})
     except Exception as e:
@@ -1550,30 +1657,22 @@ def bulk_control_lights():
         action = data.get('action')
         brightness = data.get('brightness', 100)
         
-        results = {}
-        affected_rooms = []
+        if action in ('on', 'dim'):
+            changes = {'status': 'on', 'brightness': brightness}
+        elif action == 'off':
+            changes = {'status': 'off', 'brightness': 0}
+        else:
+            changes = {}
         
-        for room in lights_state:
-            previous_state = lights_state[room].copy()
-            
-            if action == 'on':
-                lights_state[room]['status'] = 'on'
-                lights_state[room]['brightness'] = brightness
-            elif action == 'off':
-                lights_state[room]['status'] = 'off'
-                lights_state[room]['brightness'] = 0
-            elif action == 'dim':
-                lights_state[room]['status'] = 'on'
-                lights_state[room]['brightness'] = brightness
-            
-            results[room] = lights_state[room]
-            affected_rooms.append(room)
-            
-            # Emit socket event for each room
-            safe_socket_emit('light_update', {
-                'room': room,
-                'state': lights_state[room]
-            })
+        # All rooms change together as one state version
+        records = light_store.update_many({room: changes for room in light_store.rooms()})
+        results = {room: record.to_dict() for room, record in records.items()}
+        affected_rooms = list(records)
+        
+        # One broadcast frame for all rooms
+        with light_broadcaster.batch():
+            for record in records.values():
+                light_broadcaster.publish(record)
         
         # Log the bulk activity
         log_activity(
@@ -1594,14 +1693,24 @@ def bulk_control_lights():
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/lights')
+@with_change_cursor
 def get_lights():
     """Get all lights status"""
     try:
-        return jsonify(lights_state)
+        return jsonify(light_store.snapshot().as_dict())
     except Exception as e:
         logger.error(f"Error getting lights: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/rooms')
+def get_rooms():
+    """Get the registered rooms (id, name, home, type)"""
+    try:
+        return jsonify(room_registry.to_dict())
+    except Exception as e:
+        logger.error(f"Error getting rooms: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/ai/mode', methods=['POST'])
 def toggle_ai_mode():
     """Toggle AI Mode on/off"""
@@ -1622,6 +1731,7 @@ def toggle_ai_mode():
         
         previous_state = ai_mode_enabled
         ai_mode_enabled = enabled
+        shared_settings.set('ai_mode_enabled', enabled)
         
         logger.info(f"AI Mode toggle: {previous_state} -> {enabled}")
         
@@ -1668,23 +1778,28 @@ def toggle_ai_mode():
 def get_ai_status():
     """Get AI Mode status and predictions"""
     try:
-        current_time = datetime.now()
-        time_of_day = get_time_of_day()
+        context = build_control_context()
+        current_time = context.timestamp
+        time_of_day = context.time_of_day
         
         # Get weather data
-        weather_data = get_weather_data()
-        weather_adjustment = get_weather_lighting_adjustment()
-        natural_light_factor = get_natural_light_factor()
+        weather_data = context.weather_data
+        weather_adjustment = context.weather_adjustment
+        natural_light_factor = context.natural_light_factor
         
-        # Get current predictions for all rooms
+        # Get current predictions for all rooms in a single batch
+        snapshot = light_store.snapshot()
+        probabilities = predict_occupancy_batch(snapshot, context)
         predictions = {}
-        for room in lights_state:
+        for room, record in snapshot.items():
             try:
-                occupancy_prob = advanced_occupancy_predictor.predict(current_time.isoformat(), room, weather_data, None)
+                occupancy_prob = probabilities[room]
                 predictions[room] = {
                     'occupancy_probability': round(occupancy_prob * 100, 1),
                     'predicted_occupied': occupancy_prob > 0.5,
-                    'optimized_brightness': optimize_brightness(room, lights_state[room]['brightness']),
+                    'optimized_brightness': optimize_brightness(
+                        room, record.brightness, occupancy_prob, context
+                    ),
                     'weather_adjustment': round(weather_adjustment, 2),
                     'natural_light_factor': round(natural_light_factor, 2)
                 }
@@ -1706,6 +1821,8 @@ def get_ai_status():
             'time_of_day': time_of_day,
             'predictions': predictions,
             'user_patterns': user_behavior_learner.get_user_patterns() if user_behavior_learner else {}, # Assuming user_behavior_learner has this method
+            'prediction_cache': get_prediction_cache_stats(),
+            'model': get_model_status(),
             'weather': {
                 'data': weather_data,
                 'lighting_adjustment': round(weather_adjustment, 2),
@@ -1720,23 +1837,28 @@ def get_ai_status():
 def test_ai_mode():
     """Test AI mode functionality"""
     try:
-        current_time = datetime.now()
-        time_of_day = get_time_of_day()
+        context = build_control_context()
+        current_time = context.timestamp
+        time_of_day = context.time_of_day
         
-        # Test predictions for each room
+        # Test predictions for each room (scored together in one batch)
+        snapshot = light_store.snapshot()
+        probabilities = predict_occupancy_batch(snapshot, context)
         test_results = {}
-        for room in lights_state:
+        for room, record in snapshot.items():
             try:
-                will_be_occupied = predict_occupancy(room)
-                current_brightness = lights_state[room]['brightness']
-                optimized_brightness = optimize_brightness(room, current_brightness)
+                occupancy_prob = probabilities[room]
+                current_brightness = record.brightness
+                optimized_brightness = optimize_brightness(
+                    room, current_brightness, occupancy_prob, context
+                )
                 
                 test_results[room] = {
-                    'prediction': 'occupied' if will_be_occupied else 'not_occupied',
+                    'prediction': 'occupied' if occupancy_prob > 0.5 else 'not_occupied',
                     'current_brightness': current_brightness,
                     'optimized_brightness': optimized_brightness,
                     'time_of_day': time_of_day,
-                    'base_probability': advanced_occupancy_predictor.predict(current_time.isoformat(), room, get_weather_data(), None) # Use advanced predictor
+                    'base_probability': occupancy_prob
                 }
             except Exception as room_error:
                 logger.error(f"Error testing AI for room {room}: {room_error}")
@@ -1769,7 +1891,8 @@ def get_weather():
         else:
             logger.info(f"✅ Weather API key is set (length: {len(WEATHER_API_KEY)})")
         
-        weather_data = get_weather_data()
+        context = build_control_context()
+        weather_data = context.weather_data
         if not weather_data:
             logger.error("❌ get_weather_data returned None")
             return jsonify({
@@ -1779,20 +1902,18 @@ def get_weather():
                 'using_demo': True
             }), 200  # Return 200 with error message so frontend can handle it
         
-        # Check if we're using demo data
-        using_demo = not api_key_set or (weather_data.get('main', {}).get('temp') == 72 and 
-                                        weather_data.get('weather', [{}])[0].get('description') == 'scattered clouds')
-        
-        weather_adjustment = get_weather_lighting_adjustment()
-        natural_light_factor = get_natural_light_factor()
+        # live, stale (older than the cache TTL) or demo
+        source = weather_cache.source
         
         return jsonify({
             'weather': weather_data,
-            'lighting_adjustment': round(weather_adjustment, 2),
-            'natural_light_factor': round(natural_light_factor, 2),
-            'timestamp': datetime.now().isoformat(),
+            'lighting_adjustment': round(context.weather_adjustment, 2),
+            'natural_light_factor': round(context.natural_light_factor, 2),
+            'timestamp': context.timestamp.isoformat(),
             'api_key_set': api_key_set,
-            'using_demo': using_demo,
+            'using_demo': source == 'demo',
+            'source': source,
+            'fetched_at': weather_cache.fetched_at,
             'location': weather_data.get('name', WEATHER_CITY)
         })
     except Exception as e:
@@ -1816,6 +1937,20 @@ def get_weather():
                 'api_key_set': api_key_set
             }), 500
 
+@app.route('/api/weather/metrics')
+def get_weather_metrics():
+    """Weather cache metrics (hits, stale serves, refresh latency, failures) and circuit breaker state"""
+    try:
+        return jsonify({
+            **weather_cache.stats(),
+            'forecast': forecast_cache.stats(),
+            'client': weather_client.stats(),
+            'provider': weather_provider.stats()
+        })
+    except Exception as e:
+        logger.error(f"Error getting weather metrics: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/weather/optimize', methods=['POST'])
 def apply_weather_optimization():
     """Apply weather-based optimization to all lights"""
@@ -1826,48 +1961,48 @@ def apply_weather_optimization():
         if not apply_optimization:
             return jsonify({'message': 'Weather optimization not applied'})
         
-        weather_adjustment = get_weather_lighting_adjustment()
-        natural_light_factor = get_natural_light_factor()
+        context = build_control_context()
+        weather_adjustment = context.weather_adjustment
+        natural_light_factor = context.natural_light_factor
         
         optimized_rooms = {}
         
-        for room in lights_state:
-            current_brightness = lights_state[room]['brightness']
+        def weather_optimize(current):
+            # Only lights that are on are adjusted
+            if current.status != 'on':
+                return None
+            # Apply weather adjustment
+            weather_optimized = int(current.brightness * weather_adjustment)
+            
+            # Consider natural light factor
+            if natural_light_factor > 0.7:  # High natural light
+                weather_optimized = max(20, int(weather_optimized * 0.8))
+            elif natural_light_factor < 0.3:  # Low natural light
+                weather_optimized = min(100, int(weather_optimized * 1.2))
+            
+            # Room-specific limits (e.g. bedroom cap, bathroom/kitchen minimum)
+            weather_optimized = room_registry.clamp_brightness(current.room, weather_optimized)
+            
+            return {'brightness': max(0, min(100, weather_optimized))}
+        
+        # One broadcast frame for all optimized rooms
+        with light_broadcaster.batch():
+            for room in light_store.rooms():
+                # Calculate and apply weather-optimized brightness atomically
+                previous, record = light_store.modify(room, weather_optimize)
+                if previous is None or previous.status != 'on':
+                    continue
+                current_brightness = previous.brightness
+                light_broadcaster.publish(
+                    record,
+                    source='weather_optimization',
+                    weather_adjustment=round(weather_adjustment, 2),
+                    natural_light_factor=round(natural_light_factor, 2)
+                )
             
-            # Calculate weather-optimized brightness
-            if lights_state[room]['status'] == 'on':
-                # Apply weather adjustment
-                weather_optimized = int(current_brightness * weather_adjustment)
-                
-                # Consider natural light factor
-                if natural_light_factor > 0.7:  # High natural light
-                    weather_optimized = max(20, int(weather_optimized * 0.8))
-                elif natural_light_factor < 0.3:  # Low natural light
-                    weather_optimized = min(100, int(weather_optimized * 1.2))
-                
-                # Room-specific adjustments
-                if room == 'bedroom':
-                    weather_optimized = min(weather_optimized, 80)  # Cap bedroom brightness
-                elif room == 'bathroom':
-                    weather_optimized = max(weather_optimized, 60)  # Minimum bathroom brightness
-                elif room == 'kitchen':
-                    weather_optimized = max(weather_optimized, 70)  # Minimum kitchen brightness
-                
-                # Update light state
-                lights_state[room]['brightness'] = max(0, min(100, weather_optimized))
-                
-                # Emit socket event
-                safe_socket_emit('light_update', {
-                    'room': room,
-                    'state': lights_state[room],
-                    'source': 'weather_optimization',
-                    'weather_adjustment': round(weather_adjustment, 2),
-                    'natural_light_factor': round(natural_light_factor, 2)
-                })
-                
                 optimized_rooms[room] = {
                     'previous_brightness': current_brightness,
-                    'new_brightness': lights_state[room]['brightness'],
+                    'new_brightness': record.brightness,
                     'adjustment': weather_adjustment,
                     'natural_light_factor': natural_light_factor
                 }
@@ -1889,7 +2024,7 @@ def apply_weather_optimization():
             'weather_adjustment': round(weather_adjustment, 2),
             'natural_light_factor': round(natural_light_factor, 2),
             'optimized_rooms': optimized_rooms,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': context.timestamp.isoformat()
         })
         
     except Exception as e:
@@ -1898,85 +2033,21 @@ def apply_weather_optimization():
 
 @app.route('/api/weather/forecast')
 def get_weather_forecast():
-    """Get accurate weather forecast for the next 24 hours from OpenWeatherMap"""
+    """Get the weather forecast for the next 24 hours (cached until the next 3-hour period)"""
     try:
-        if WEATHER_API_KEY == 'demo_key':
-            # Return demo forecast
-            weather_data = get_weather_data()
-            forecast = []
-            for i in range(1, 9):  # Next 8 periods (3-hour intervals)
-                forecast_time = datetime.now() + timedelta(hours=i*3)
-                forecast.append({
-                    'dt': int(forecast_time.timestamp()),
-                    'main': {
-                        'temp': 20 + random.uniform(-3, 3),
-                        'humidity': 65 + random.uniform(-10, 10),
-                        'pressure': 1013
-                    },
-                    'weather': [{
-                        'main': 'Clouds',
-                        'description': 'scattered clouds',
-                        'icon': '03d'
-                    }],
-                    'clouds': {'all': 40},
-                    'wind': {'speed': 5, 'deg': 180},
-                    'visibility': 10000
-                })
-            return jsonify({
-                'list': forecast,
-                'city': {'name': WEATHER_CITY},
-                'timestamp': datetime.now().isoformat()
-            })
-        
-        # Real API call for forecast
-        params = {
-            'appid': WEATHER_API_KEY,
-            'units': 'imperial',
-            'cnt': 8,  # 8 periods = 24 hours (3-hour intervals)
-            'lang': 'en'
-        }
-        
-        # Use coordinates if available for more accuracy
-        if WEATHER_LAT and WEATHER_LON:
-            params['lat'] = WEATHER_LAT
-            params['lon'] = WEATHER_LON
-        else:
-            params['q'] = WEATHER_CITY
-        
-        # Use session with retry logic for forecast API
-        # Increased timeout for Render's network conditions
-        try:
-            response = weather_session.get(WEATHER_FORECAST_URL, params=params, timeout=(5, 15))
-            if response.status_code == 200:
-                forecast_data = response.json()
-                logger.info(f"✅ Successfully fetched weather forecast")
-                return jsonify({
-                    'list': forecast_data.get('list', []),
-                    'city': forecast_data.get('city', {'name': WEATHER_CITY}),
-                    'timestamp': datetime.now().isoformat()
-                })
-            else:
-                logger.warning(f"⚠️ Weather forecast API error: {response.status_code}")
-        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
-            logger.warning(f"⚠️ Weather forecast API connection error: {e}")
-            # Return demo forecast on connection error
-            # Fall back to current weather as single forecast point
-            weather_data = get_weather_data()
-            if weather_data:
-                return jsonify({
-                    'list': [{
-                        'dt': int(datetime.now().timestamp()),
-                        'main': weather_data['main'],
-                        'weather': weather_data['weather'],
-                        'clouds': weather_data.get('clouds', {}),
-                        'wind': weather_data.get('wind', {}),
-                        'visibility': weather_data.get('visibility', 10000)
-                    }],
-                    'city': {'name': weather_data.get('name', WEATHER_CITY)},
-                    'timestamp': datetime.now().isoformat()
-                })
-            return jsonify({'error': 'Weather forecast unavailable'}), 500
-        
+        forecast = forecast_cache.get()
+        return jsonify({
+            'list': [{
+                'dt': period['dt'],
+                'main': {'temp': period['temp']},
+                'weather': [{'id': period['code'], 'main': period['condition']}],
+                'clouds': {'all': period['clouds']}
+            } for period in forecast.periods()],
+            'city': {'name': forecast.city or WEATHER_CITY},
+            'source': forecast_cache.source,
+            'fetched_at': forecast_cache.fetched_at,
+            'timestamp': datetime.now().isoformat()
+        })
     except Exception as e:
         logger.error(f"Error getting weather forecast: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -1985,15 +2056,20 @@ def get_weather_forecast():
 def get_weather_impact():
     """Get weather impact on lighting for all rooms"""
     try:
-        weather_data = get_weather_data()
-        weather_adjustment = get_weather_lighting_adjustment()
-        natural_light_factor = get_natural_light_factor()
+        context = build_control_context()
+        weather_data = context.weather_data
+        weather_adjustment = context.weather_adjustment
+        natural_light_factor = context.natural_light_factor
         
         # Calculate impact for each room
+        snapshot = light_store.snapshot()
+        probabilities = predict_occupancy_batch(snapshot, context)
         room_impacts = {}
-        for room in lights_state:
-            current_brightness = lights_state[room]['brightness']
-            optimized_brightness = optimize_brightness(room, current_brightness)
+        for room, record in snapshot.items():
+            current_brightness = record.brightness
+            optimized_brightness = optimize_brightness(
+                room, current_brightness, probabilities[room], context
+            )
             
             room_impacts[room] = {
                 'current_brightness': current_brightness,
@@ -2008,7 +2084,7 @@ def get_weather_impact():
             'overall_adjustment': round(weather_adjustment, 2),
             'natural_light_factor': round(natural_light_factor, 2),
             'room_impacts': room_impacts,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': context.timestamp.isoformat()
         })
     except Exception as e:
         logger.error(f"Error getting weather impact: {e}")
@@ -2022,25 +2098,22 @@ def control_all_lights():
         action = data.get('action')
         brightness = data.get('brightness', 100)
         
-        for room in lights_state:
-            if action == 'on':
-                lights_state[room]['status'] = 'on'
-                lights_state[room]['brightness'] = brightness
-            elif action == 'off':
-                lights_state[room]['status'] = 'off'
-                lights_state[room]['brightness'] = 0
-            elif action == 'dim':
-                lights_state[room]['brightness'] = max(0, min(100, brightness))
-                if lights_state[room]['brightness'] > 0:
-                    lights_state[room]['status'] = 'on'
-                else:
-                    lights_state[room]['status'] = 'off'
-            
-            # Emit socket event for each room
-            safe_socket_emit('light_update', {
-                'room': room,
-                'state': lights_state[room]
-            })
+        if action == 'on':
+            changes = {'status': 'on', 'brightness': brightness}
+        elif action == 'off':
+            changes = {'status': 'off', 'brightness': 0}
+        elif action == 'dim':
+            dimmed = max(0, min(100, brightness))
+            changes = {'status': 'on' if dimmed > 0 else 'off', 'brightness': dimmed}
+        else:
+            changes = {}
+        
+        # All rooms change together as one state version
+        records = light_store.update_many({room: changes for room in light_store.rooms()})
+        # One broadcast frame for all rooms
+        with light_broadcaster.batch():
+            for record in records.values():
+                light_broadcaster.publish(record)
         
         return jsonify({'message': f'All lights {action}'})
     except Exception as e:
@@ -2048,10 +2121,11 @@ def control_all_lights():
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/schedules')
+@with_change_cursor
 def get_schedules():
     """Get all schedules"""
     try:
-        return jsonify(schedules)
+        return jsonify(schedules.as_dict())
     except Exception as e:
         logger.error(f"Error getting schedules: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -2063,17 +2137,11 @@ def toggle_schedule(room):
         data = request.get_json()
         enabled = data.get('enabled', False)
         
-        if room not in schedules:
-            schedules[room] = {
-                'enabled': enabled,
-                'vacation_mode': False,
-                'sunrise_sunset': False,
-                'daily_schedule': {}
-            }
-        else:
-            schedules[room]['enabled'] = enabled
+        schedule = _room_schedule(room)
+        schedule['enabled'] = enabled
+        schedules.set(room, schedule)
         
-        return jsonify({'schedule': schedules[room]})
+        return jsonify({'schedule': schedule})
     except Exception as e:
         logger.error(f"Error toggling schedule: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -2085,17 +2153,11 @@ def toggle_vacation_mode(room):
         data = request.get_json()
         vacation_mode = data.get('vacation_mode', False)
         
-        if room not in schedules:
-            schedules[room] = {
-                'enabled': False,
-                'vacation_mode': vacation_mode,
-                'sunrise_sunset': False,
-                'daily_schedule': {}
-            }
-        else:
-            schedules[room]['vacation_mode'] = vacation_mode
+        schedule = _room_schedule(room)
+        schedule['vacation_mode'] = vacation_mode
+        schedules.set(room, schedule)
         
-        return jsonify({'schedule': schedules[room]})
+        return jsonify({'schedule': schedule})
     except Exception as e:
         logger.error(f"Error toggling vacation mode: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -2107,17 +2169,11 @@ def toggle_sunrise_sunset(room):
         data = request.get_json()
         sunrise_sunset = data.get('sunrise_sunset', False)
         
-        if room not in schedules:
-            schedules[room] = {
-                'enabled': False,
-                'vacation_mode': False,
-                'sunrise_sunset': sunrise_sunset,
-                'daily_schedule': {}
-            }
-        else:
-            schedules[room]['sunrise_sunset'] = sunrise_sunset
+        schedule = _room_schedule(room)
+        schedule['sunrise_sunset'] = sunrise_sunset
+        schedules.set(room, schedule)
         
-        return jsonify({'schedule': schedules[room]})
+        return jsonify({'schedule': schedule})
     except Exception as e:
         logger.error(f"Error toggling sunrise/sunset mode: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -2130,17 +2186,11 @@ def update_schedule_times(room):
         day = data.get('day')
         times = data.get('times', [])
         
-        if room not in schedules:
-            schedules[room] = {
-                'enabled': False,
-                'vacation_mode': False,
-                'sunrise_sunset': False,
-                'daily_schedule': {}
-            }
+        schedule = _room_schedule(room)
+        schedule['daily_schedule'][day] = times
+        schedules.set(room, schedule)
         
-        schedules[room]['daily_schedule'][day] = times
-        
-        return jsonify({'schedule': schedules[room]})
+        return jsonify({'schedule': schedule})
     except Exception as e:
         logger.error(f"Error updating schedule times: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -2186,40 +2236,65 @@ def get_schedule_status():
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/activity/logs')
+@with_change_cursor
 def get_activity_logs():
     """Get activity logs"""
     try:
         # Get query parameters
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 20))
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = max(1, min(int(request.args.get('per_page', 20)), 200))
         search = request.args.get('search', '')
         action_filter = request.args.get('action', '')
+        before = request.args.get('before', type=int)
+        
+        if activity_store is not None:
+            # Indexed SQL over the stored history (new entries land within ACTIVITY_FLUSH_INTERVAL);
+            # `before` is a keyset cursor (last id seen)
+            logs, total_logs = activity_store.query(
+                search=search or None,
+                action=action_filter or None,
+                room=request.args.get('room') or None,
+                since=request.args.get('since') or None,
+                until=request.args.get('until') or None,
+                before=before,
+                page=page,
+                limit=per_page
+            )
+            return jsonify({
+                'logs': logs,
+                'pages': (total_logs + per_page - 1) // per_page,
+                'total': total_logs,
+                'current_page': page,
+                'next_before': logs[-1]['id'] if len(logs) == per_page else None
+            })
         
-        # Get logs from memory
-        logs = getattr(app, 'activity_logs', [])
-        
-        # Apply filters
-        filtered_logs = logs
-        if search:
-            filtered_logs = [log for log in logs if 
-                           search.lower() in log.get('action', '').lower() or
-                           search.lower() in log.get('room', '').lower() or
-                           search.lower() in str(log.get('details', '')).lower()]
-        
-        if action_filter:
-            filtered_logs = [log for log in filtered_logs if log.get('action') == action_filter]
-        
-        # Calculate pagination
-        total_logs = len(filtered_logs)
-        total_pages = (total_logs + per_page - 1) // per_page
         start_idx = (page - 1) * per_page
         end_idx = start_idx + per_page
         
-        # Get page of logs
-        page_logs = filtered_logs[start_idx:end_idx]
+        if not search and not action_filter:
+            # Unfiltered: index straight into the ring buffer
+            total_logs = len(activity_log)
+            page_logs = activity_log.page(page, per_page)
+        else:
+            # Filtered: one newest-first pass, keeping only the requested page
+            search = search.lower()
+            total_logs = 0
+            page_logs = []
+            for record in activity_log:
+                if action_filter and record.action != action_filter:
+                    continue
+                if search and not (search in record.action.lower() or
+                                   search in (record.room or '').lower() or
+                                   search in str(record.details or '').lower()):
+                    continue
+                if start_idx <= total_logs < end_idx:
+                    page_logs.append(record)
+                total_logs += 1
+        
+        total_pages = (total_logs + per_page - 1) // per_page
         
         return jsonify({
-            'logs': page_logs,
+            'logs': [record.to_dict() for record in page_logs],
             'pages': total_pages,
             'total': total_logs,
             'current_page': page
@@ -2228,6 +2303,46 @@ def get_activity_logs():
         logger.error(f"Error getting activity logs: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/changes')
+def get_changes():
+    """
+    Changes to lights, schedules, settings and activity after a cursor.
+    
+    Query params: since (seq from a previous response or X-Change-Seq header),
+    epoch, kinds (comma-separated), limit. When the cursor can't be served
+    the response has resync=true: refetch the full state and continue from seq.
+    Single-worker only (WORKERS=1): the journal is per process, so with more
+    workers this answers 501 and clients should poll the full state instead.
+    """
+    if not CHANGE_FEED_ENABLED:
+        return jsonify({
+            'error': 'The change feed needs a single worker (WORKERS=1); poll the full state endpoints instead',
+            'workers': WORKERS
+        }), 501
+    try:
+        epoch = request.args.get('epoch') or None
+        since = request.args.get('since', type=int)
+        limit = max(1, min(request.args.get('limit', 500, type=int), 1000))
+        kinds = request.args.get('kinds')
+        kinds = set(kinds.split(',')) if kinds else None
+        
+        result = change_journal.since(since, epoch, kinds, limit) if since is not None else None
+        if result is None:
+            current_epoch, seq = change_journal.cursor()
+            return jsonify({'epoch': current_epoch, 'seq': seq, 'changes': [], 'has_more': False, 'resync': True})
+        
+        changes, seq, has_more = result
+        return jsonify({
+            'epoch': change_journal.epoch,
+            'seq': seq,
+            'changes': [change.to_dict() for change in changes],
+            'has_more': has_more,
+            'resync': False
+        })
+    except Exception as e:
+        logger.error(f"Error getting changes: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/statistics')
 def get_statistics():
     """Get energy statistics"""
@@ -2278,9 +2393,31 @@ def _register_socketio_events():
         
         emit('connected', {'data': 'Connected'})
 
+    @sio.on('subscribe_lights_batch')
+    def handle_subscribe_lights_batch(data=None):
+        """
+        Switch this client from per-room light_update events to lights_batch_update.
+        
+        data may hold the client's last {epoch, seq}; the lights_state reply
+        replays what it missed (or is a snapshot).
+        """
+        from flask_socketio import join_room
+        join_room(BATCH_ROOM)
+        light_broadcaster.subscribe(request.sid)
+        handle_lights_resync(data)
+
+    @sio.on('lights_resync')
+    def handle_lights_resync(data=None):
+        """Reply with the light changes after the client's {epoch, seq}, or a snapshot"""
+        data = data or {}
+        seq = data.get('seq')
+        state = light_broadcaster.resync(data.get('epoch'), seq if isinstance(seq, int) else None)
+        safe_socket_emit('lights_state', state, room=request.sid)
+
     @sio.on('disconnect')
     def handle_disconnect():
         """Handle client disconnection"""
+        light_broadcaster.unsubscribe(request.sid)
         try:
             logger.info('Client disconnected')
         except Exception as e:
@@ -2293,8 +2430,7 @@ def _register_socketio_events():
     def handle_motion(data):
         """Handle motion detection"""
         room = data.get('room')
-        if room in lights_state:
-            lights_state[room]['motion_detected'] = True
+        if light_store.update(room, motion_detected=True) is not None:
             
             # Track motion detection
             if DATADOG_IMPORTED:
@@ -2548,7 +2684,8 @@ try:
 except: pass
 # #endregion
 
-if __name__ == '__main__':
+def main():
+    """Run the development / single-process server (started through server.py)"""
     try:
         logger.info("🚀 Starting AI Smart Light Control System...")
         
@@ -2571,4 +2708,9 @@ if __name__ == '__main__':
             sio.run(app, host='0.0.0.0', port=port, debug=True, allow_unsafe_werkzeug=True)
     except Exception as startup_error:
         logger.error(f"❌ Fatal error during startup: {startup_error}", exc_info=True)
-        raise 
\ No newline at end of file
+        raise 
+
+if __name__ == '__main__':
+    # Spawned training processes re-import __main__, i.e. all of this file's setup
+    logger.warning("⚠️ Run python3 server.py instead: as __main__, app.py is re-imported by every training process")
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the flattened random forest inference engine.
+
+Trains the occupancy model on generated sample data (in this process, with
+MODEL_DIR pointed at a temporary directory so the production bundle is not
+touched), checks that FlatForest matches sklearn's predict_proba, and compares latency
+and throughput for 1, 5 and 1000 rows.
+
+Run from the backend directory: python3 bench_forest.py
+"""
+
+import os
+import time
+import atexit
+import shutil
+import logging
+import tempfile
+
+import numpy as np
+
+logging.disable(logging.INFO)
+
+# Bundles and samples go to a scratch directory (read when ai_models is imported)
+os.environ['MODEL_DIR'] = tempfile.mkdtemp(prefix='bench_forest_')
+os.environ.pop('SAMPLE_STORE_DIR', None)
+atexit.register(shutil.rmtree, os.environ['MODEL_DIR'], ignore_errors=True)
+
+from ai_models import advanced_occupancy_predictor, generate_enhanced_training_data
+from forest_engine import compile_forest
+
+ROW_COUNTS = (1, 5, 1000)
+
+
+def time_call(fn, min_seconds=1.0):
+    """Return mean seconds per call, running fn for at least min_seconds"""
+    fn()  # warm up
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def main():
+    predictor = advanced_occupancy_predictor
+    print("🤖 Training occupancy model on sample data...")
+    predictor.train(generate_enhanced_training_data())
+
+    model = predictor.model
+    start = time.perf_counter()
+    forest = compile_forest(model)
+    compile_ms = (time.perf_counter() - start) * 1000
+    print(f"🌲 Compiled {forest.n_trees} trees / {forest.n_nodes} nodes "
+          f"(max depth {forest.max_depth}) in {compile_ms:.1f} ms\n")
+
+    rng = np.random.default_rng(42)
+    X_all = rng.normal(size=(max(ROW_COUNTS), forest.n_features)).astype(np.float32)
+
+    # Numerical equivalence check
+    expected = model.predict_proba(X_all)
+    actual = forest.predict_proba(X_all)
+    max_diff = float(np.abs(expected - actual).max())
+    status = "✅" if max_diff < 1e-9 else "❌"
+    print(f"{status} Max |sklearn - flat| probability difference: {max_diff:.2e}\n")
+
+    print(f"{'rows':>6} | {'sklearn ms':>11} | {'flat ms':>9} | {'speedup':>7} | {'flat rows/s':>12}")
+    print("-" * 58)
+    for rows in ROW_COUNTS:
+        X = X_all[:rows]
+        sklearn_s = time_call(lambda: model.predict_proba(X))
+        flat_s = time_call(lambda: forest.predict_proba(X))
+        print(f"{rows:>6} | {sklearn_s * 1000:>11.3f} | {flat_s * 1000:>9.3f} | "
+              f"{sklearn_s / flat_s:>6.1f}x | {rows / flat_s:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the weather-heavy endpoints.
+
+Serves recorded responses through the replay weather provider (see
+weather_providers.py) with injected latency and faults, sends requests to
+/api/weather, /api/weather/impact and /api/weather/forecast from several
+threads, and reports request latency with the weather cache, circuit
+breaker and provider counters.
+
+Run from the backend directory:
+    python3 bench_weather.py [--requests 300] [--threads 8] [--latency 0.5]
+                             [--error-rate 0.3] [--dns-failure-rate 0] [--ttl 2]
+"""
+
+import os
+import time
+import logging
+import argparse
+import threading
+
+ENDPOINTS = ('/api/weather', '/api/weather/impact', '/api/weather/forecast')
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300, help='Requests per endpoint and thread')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds per replayed API call')
+    parser.add_argument('--error-rate', type=float, default=0.3)
+    parser.add_argument('--dns-failure-rate', type=float, default=0.0)
+    parser.add_argument('--ttl', type=float, default=2.0, help='Weather cache TTL, short to force refreshes')
+    args = parser.parse_args()
+
+    # Configure the weather path before the app reads its settings
+    os.environ['WEATHER_PROVIDER'] = 'replay'
+    os.environ['WEATHER_REPLAY_LATENCY'] = str(args.latency)
+    os.environ['WEATHER_REPLAY_ERROR_RATE'] = str(args.error_rate)
+    os.environ['WEATHER_REPLAY_DNS_FAILURE_RATE'] = str(args.dns_failure_rate)
+    os.environ['WEATHER_CACHE_TTL'] = str(args.ttl)
+    os.environ['WEATHER_RETRY_SECONDS'] = str(args.ttl)
+    logging.disable(logging.WARNING)
+
+    import app as smart_lights
+
+    latencies = {endpoint: [] for endpoint in ENDPOINTS}
+    errors = {endpoint: 0 for endpoint in ENDPOINTS}
+    lock = threading.Lock()
+
+    def worker():
+        client = smart_lights.app.test_client()
+        for _ in range(args.requests):
+            for endpoint in ENDPOINTS:
+                start = time.perf_counter()
+                status = client.get(endpoint).status_code
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    latencies[endpoint].append(elapsed)
+                    if status != 200:
+                        errors[endpoint] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"Replay: {args.latency}s latency, {args.error_rate:.0%} errors, "
+          f"{args.dns_failure_rate:.0%} DNS failures; cache TTL {args.ttl}s")
+    print(f"{args.threads} threads x {args.requests} rounds in {elapsed:.1f}s\n")
+    print(f"{'endpoint':<24}{'requests':>10}{'non-200':>9}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for endpoint in ENDPOINTS:
+        values = sorted(latencies[endpoint])
+        print(f"{endpoint:<24}{len(values):>10}{errors[endpoint]:>9}{percentile(values, 0.5):>9.2f}"
+              f"{percentile(values, 0.95):>9.2f}{values[-1]:>9.2f}")
+
+    for name, stats in (('weather cache', smart_lights.weather_cache.stats()),
+                        ('forecast cache', smart_lights.forecast_cache.stats())):
+        print(f"\n{name}: hits {stats['hits']}, stale {stats['stale_serves']}, "
+              f"fallback {stats['fallback_serves']}, refreshes {stats['refreshes']}, failures {stats['failures']}")
+    breaker = smart_lights.weather_client.breaker.stats()
+    print(f"breaker: {breaker['state']}, short circuits {breaker['short_circuits']}, "
+          f"transitions {breaker['transitions']}")
+    provider = smart_lights.weather_provider.stats()
+    print(f"provider: {provider['calls']} calls, {provider['injected_errors']} errors, "
+          f"{provider['injected_dns_failures']} DNS failures, {provider['injected_timeouts']} timeouts")
+
+
+if __name__ == "__main__":
+    main()
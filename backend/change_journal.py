@@ -0,0 +1,141 @@
+"""
+Bounded in-memory journal of state changes, for incremental client sync.
+
+Every mutation of lights, schedules, settings and the activity log is
+recorded as a Change with a sequence number. Clients keep the last seq they
+saw and ask for changes after it (GET /api/changes?since=<seq>), so catching
+up costs in proportion to what changed rather than to the total state.
+
+The journal keeps the last CHANGE_JOURNAL_CAPACITY changes in a ring of
+preallocated slots. Sequence numbers are contiguous, so a cursor maps
+straight to its slot. A cursor older than the ring, or from another epoch
+(each process start gets a new one), cannot be served and the client is
+told to resync: refetch the full state, then continue from the seq it was
+given.
+
+The journal is per process, so GET /api/changes is only served with a
+single worker (WORKERS=1); with more, successive polls would hit journals
+of different epochs and resync every time.
+
+Changes are 'set' (the value is the key's full new state, superseding
+earlier sets of the same key) or 'append' (an event, e.g. an activity
+entry). since() drops superseded sets, so a light toggled fifty times while
+a client was away comes back as one change.
+"""
+
+import os
+import time
+import uuid
+import threading
+
+# Changes kept in memory (older cursors get a resync)
+CHANGE_JOURNAL_CAPACITY = int(os.getenv('CHANGE_JOURNAL_CAPACITY', '5000'))
+
+SET = 'set'
+APPEND = 'append'
+
+
+class Change:
+    """One journal entry"""
+
+    __slots__ = ('seq', 'kind', 'key', 'op', 'value', 'timestamp')
+
+    def __init__(self, seq, kind, key, op, value, timestamp):
+        self.seq = seq
+        self.kind = kind
+        self.key = key
+        self.op = op
+        self.value = value
+        self.timestamp = timestamp
+
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'kind': self.kind,
+            'key': self.key,
+            'op': self.op,
+            'value': self.value,
+            'timestamp': self.timestamp
+        }
+
+
+class ChangeJournal:
+    """Fixed-capacity, seq-ordered log of changes"""
+
+    def __init__(self, capacity=CHANGE_JOURNAL_CAPACITY):
+        if capacity < 1:
+            raise ValueError("Change journal capacity must be at least 1")
+        self.capacity = capacity
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0  # Seq of the newest change
+        self._slots = [None] * capacity
+        self._lock = threading.Lock()
+        self.resyncs = 0
+
+    @property
+    def oldest_seq(self):
+        """Seq of the oldest change still held (seq + 1 when empty)"""
+        return max(self.seq - self.capacity, 0) + 1
+
+    def record(self, kind, key, value, op=SET):
+        """Append a change and return its seq"""
+        with self._lock:
+            seq = self.seq + 1
+            self._slots[seq % self.capacity] = Change(seq, kind, key, op, value, time.time())
+            self.seq = seq
+        return seq
+
+    def cursor(self):
+        """(epoch, seq) a client can resume from"""
+        return self.epoch, self.seq
+
+    def since(self, seq, epoch=None, kinds=None, limit=None):
+        """
+        Changes after seq, oldest first.
+
+        Args:
+            seq (int): Last seq the client has seen
+            epoch (str): Epoch the seq belongs to (None to skip the check)
+            kinds (set): Only these kinds (None for all)
+            limit (int): At most this many changes; the client asks again from the returned seq
+
+        Returns:
+            tuple: (list of Change, seq to resume from, has_more) or None when the
+            client must resync
+        """
+        with self._lock:
+            head = self.seq
+            slots = self._slots
+        # Unknown epoch, a cursor from the future, or one the ring has already overwritten
+        if (epoch is not None and epoch != self.epoch) or not max(head - self.capacity, 0) <= seq <= head:
+            self.resyncs += 1
+            return None
+        stop = head if limit is None else min(head, seq + limit)
+        entries = [slots[s % self.capacity] for s in range(seq + 1, stop + 1)]
+        # A concurrent record() may have lapped the ring while we copied
+        if any(change.seq != expected for expected, change in zip(range(seq + 1, stop + 1), entries)):
+            self.resyncs += 1
+            return None
+        # Keep only the newest set per (kind, key); appends are all kept
+        latest = set()
+        changes = []
+        for change in reversed(entries):
+            if kinds is not None and change.kind not in kinds:
+                continue
+            if change.op == SET:
+                ident = (change.kind, change.key)
+                if ident in latest:
+                    continue
+                latest.add(ident)
+            changes.append(change)
+        changes.reverse()
+        return changes, stop, stop < head
+
+    def stats(self):
+        return {
+            'epoch': self.epoch,
+            'seq': self.seq,
+            'oldest_seq': self.oldest_seq,
+            'capacity': self.capacity,
+            'resyncs': self.resyncs
+        }
@@ -0,0 +1,134 @@
+"""
+Circuit breaker for calls to an unreliable upstream (the weather API).
+
+closed     calls go through; failure_threshold consecutive failures open it
+open       calls fail at once with CircuitOpenError, without touching the
+           network, for reset_timeout seconds
+half-open  after that, one trial call goes through (others still fail fast);
+           its success closes the circuit, its failure opens it again
+
+Callers report outcomes with call(), or allow() followed by
+record_success() / record_failure(). stats() reports the state and how
+often each transition happened.
+"""
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the circuit is open"""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker with transition counters"""
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=60.0):
+        """
+        Args:
+            name (str): Upstream name, for logs and errors
+            failure_threshold (int): Consecutive failures that open the circuit
+            reset_timeout (float): Seconds the circuit stays open before a trial call
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._opened_at = None  # time.monotonic() of the last opening
+        self._trial_running = False
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.short_circuits = 0
+        self.transitions = {}  # 'closed->open' -> count
+        self.last_error = None
+
+    def _transition(self, state):
+        key = f'{self.state}->{state}'
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        if state == OPEN:
+            logger.warning(f"🔌 {self.name} circuit open for {self.reset_timeout:.0f}s "
+                           f"after {self.consecutive_failures} failures: {self.last_error}")
+        elif state == CLOSED:
+            logger.info(f"🔌 {self.name} circuit closed")
+        self.state = state
+
+    def allow(self):
+        """True if a call may go to the upstream now (it must then record its outcome)"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.short_circuits += 1
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    self.short_circuits += 1
+                    return False
+                self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self._trial_running = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self._trial_running = False
+            if error is not None:
+                self.last_error = str(error)[:200]
+            if self.state == HALF_OPEN or (self.state == CLOSED
+                                           and self.consecutive_failures >= self.failure_threshold):
+                self._transition(OPEN)
+                self._opened_at = time.monotonic()
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Run fn through the breaker.
+
+        Raises:
+            CircuitOpenError: Without calling fn, while the circuit is open
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def retry_in(self):
+        """Seconds until the next trial call is allowed (0 unless open)"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'retry_in_seconds': round(self.retry_in(), 1),
+            'failure_threshold': self.failure_threshold,
+            'reset_timeout_seconds': self.reset_timeout,
+            'consecutive_failures': self.consecutive_failures,
+            'successes': self.successes,
+            'failures': self.failures,
+            'short_circuits': self.short_circuits,
+            'transitions': dict(self.transitions),
+            'last_error': self.last_error
+        }
@@ -0,0 +1,278 @@
+"""
+Fixed-schema feature encoder for the occupancy model.
+
+Every row has the same FEATURE_COUNT float32 columns whether or not weather
+or user activity data is available (missing inputs use neutral defaults), so
+a trained scaler/forest always matches the serving-time feature layout.
+
+Date- and hour-derived columns come from precomputed lookup tables: a yearly
+calendar table indexed by day of year and a 24-row hour table. Encoding a row
+is a handful of slice copies into a float32 buffer instead of pandas
+timestamp parsing and per-call dict building.
+"""
+
+import math
+import threading
+from datetime import datetime, date
+
+import numpy as np
+
+from room_registry import ROOM_TYPE_NAMES, room_registry
+
+# Major holidays as (month, day) - simplified
+HOLIDAYS = frozenset([
+    (1, 1),   # New Year's Day
+    (7, 4),   # Independence Day
+    (12, 25)  # Christmas Day
+])
+
+WEATHER_ENCODINGS = {
+    'Clear': 0, 'Clouds': 1, 'Rain': 2, 'Snow': 3, 'Thunderstorm': 4
+}
+
+# Column blocks, in schema order
+CALENDAR_FEATURES = ('day_of_week', 'day_of_month', 'month', 'is_weekend',
+                     'is_holiday', 'is_workday', 'day_sin', 'day_cos')
+HOUR_FEATURES = ('hour', 'early_morning', 'morning', 'lunch', 'afternoon',
+                 'dinner', 'evening', 'night', 'hour_sin', 'hour_cos')
+MINUTE_FEATURES = ('minute',)
+# One-hot room type (see room_registry); rooms of the same type share an encoding
+ROOM_FEATURES = tuple(f'room_{i}' for i in range(len(ROOM_TYPE_NAMES)))
+WEATHER_FEATURES = ('temperature', 'humidity', 'weather_condition', 'is_rainy', 'is_cloudy')
+ACTIVITY_FEATURES = ('recent_activity', 'user_preference', 'last_occupancy_duration')
+
+FEATURE_NAMES = (CALENDAR_FEATURES + HOUR_FEATURES + MINUTE_FEATURES +
+                 ROOM_FEATURES + WEATHER_FEATURES + ACTIVITY_FEATURES)
+FEATURE_COUNT = len(FEATURE_NAMES)
+
+# Version of the column layout above; bump whenever FEATURE_NAMES changes
+FEATURE_SCHEMA_VERSION = 2
+
+
+def _block(start, names):
+    return slice(start, start + len(names))
+
+CALENDAR_SLICE = _block(0, CALENDAR_FEATURES)
+HOUR_SLICE = _block(CALENDAR_SLICE.stop, HOUR_FEATURES)
+MINUTE_INDEX = HOUR_SLICE.stop
+ROOM_SLICE = _block(MINUTE_INDEX + 1, ROOM_FEATURES)
+WEATHER_SLICE = _block(ROOM_SLICE.stop, WEATHER_FEATURES)
+ACTIVITY_SLICE = _block(WEATHER_SLICE.stop, ACTIVITY_FEATURES)
+
+# Neutral values used when weather / user activity are not available
+DEFAULT_WEATHER = np.array([20, 50, 0, 0, 0], dtype=np.float32)
+DEFAULT_ACTIVITY = np.array([0, 0.5, 0], dtype=np.float32)
+
+# user_activity dict keys, in ACTIVITY_FEATURES order (also the columnar training column names)
+ACTIVITY_COLUMNS = ('recent_activity', 'preference', 'last_duration')
+
+
+def _build_hour_table():
+    """24 x len(HOUR_FEATURES) table of hour-derived features"""
+    table = np.zeros((24, len(HOUR_FEATURES)), dtype=np.float32)
+    for hour in range(24):
+        table[hour] = (
+            hour,
+            5 <= hour <= 8,    # early_morning
+            9 <= hour <= 11,   # morning
+            12 <= hour <= 13,  # lunch
+            14 <= hour <= 17,  # afternoon
+            18 <= hour <= 20,  # dinner
+            21 <= hour <= 23,  # evening
+            0 <= hour <= 4,    # night
+            math.sin(2 * math.pi * hour / 24),
+            math.cos(2 * math.pi * hour / 24),
+        )
+    return table
+
+HOUR_TABLE = _build_hour_table()
+
+
+def build_calendar_table(year):
+    """366 x len(CALENDAR_FEATURES) table of date-derived features, indexed by day of year - 1"""
+    table = np.zeros((366, len(CALENDAR_FEATURES)), dtype=np.float32)
+    first = date(year, 1, 1).toordinal()
+    days = 366 if date(year, 12, 31).timetuple().tm_yday == 366 else 365
+    for offset in range(days):
+        day = date.fromordinal(first + offset)
+        dow = day.weekday()
+        table[offset] = (
+            dow,
+            day.day,
+            day.month,
+            dow >= 5,                          # is_weekend
+            (day.month, day.day) in HOLIDAYS,  # is_holiday
+            dow <= 4,                          # is_workday
+            math.sin(2 * math.pi * dow / 7),
+            math.cos(2 * math.pi * dow / 7),
+        )
+    return table
+
+
+def to_datetime(timestamp):
+    """Coerce a datetime, date, epoch seconds or ISO-8601 string to a datetime"""
+    if isinstance(timestamp, datetime):
+        return timestamp
+    if isinstance(timestamp, (int, float, np.integer, np.floating)):
+        return datetime.fromtimestamp(float(timestamp))
+    if isinstance(timestamp, date):
+        return datetime(timestamp.year, timestamp.month, timestamp.day)
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp)
+    if isinstance(timestamp, np.datetime64):
+        return datetime.fromisoformat(str(timestamp.astype('datetime64[us]')))
+    raise TypeError(f"Unsupported timestamp type: {type(timestamp).__name__}")
+
+
+def encode_weather(weather_data):
+    """Encode a weather payload into the WEATHER_FEATURES block"""
+    if not weather_data:
+        return DEFAULT_WEATHER
+    main = weather_data.get('main', {})
+    conditions = weather_data.get('weather', [])
+    condition_values = [str(value) for entry in conditions for value in entry.values()]
+    return np.array([
+        main.get('temp', 20),
+        main.get('humidity', 50),
+        WEATHER_ENCODINGS.get((conditions or [{}])[0].get('main', 'Clear'), 0),
+        any('Rain' in value for value in condition_values),
+        any('Clouds' in value for value in condition_values),
+    ], dtype=np.float32)
+
+
+def encode_activity(user_activity):
+    """Encode a user activity dict into the ACTIVITY_FEATURES block"""
+    if not user_activity:
+        return DEFAULT_ACTIVITY
+    return np.array([
+        user_activity.get(column, default)
+        for column, default in zip(ACTIVITY_COLUMNS, DEFAULT_ACTIVITY)
+    ], dtype=np.float32)
+
+
+class FeatureEncoder:
+    """Encodes (timestamp, room, weather, activity) into fixed-schema float32 rows"""
+
+    def __init__(self, registry=room_registry):
+        self.registry = registry
+        # year -> (ordinal of Jan 1st, calendar table)
+        self._calendar_tables = {}
+        self._calendar_lock = threading.Lock()
+        # (payload, encoded block) of the last weather payload seen; weather
+        # refreshes always create a new dict so identity is a safe memo key
+        self._weather_memo = (None, DEFAULT_WEATHER)
+
+    def calendar_table(self, year):
+        """Get (building once) the (Jan 1st ordinal, calendar lookup table) pair for a year"""
+        entry = self._calendar_tables.get(year)
+        if entry is None:
+            with self._calendar_lock:
+                entry = self._calendar_tables.get(year)
+                if entry is None:
+                    entry = (date(year, 1, 1).toordinal(), build_calendar_table(year))
+                    self._calendar_tables[year] = entry
+        return entry
+
+    def weather_vector(self, weather_data):
+        """Get the encoded weather block, reusing the last result for the same payload"""
+        if not weather_data:
+            return DEFAULT_WEATHER
+        memo = self._weather_memo
+        if memo[0] is weather_data:
+            return memo[1]
+        vector = encode_weather(weather_data)
+        self._weather_memo = (weather_data, vector)
+        return vector
+
+    def room_vector(self, room):
+        """Get the precomputed room type vector for a room name (or room type name)"""
+        return self.registry.encoding(room)
+
+    def _write_time(self, rows, dt):
+        first_ordinal, table = self.calendar_table(dt.year)
+        rows[:, CALENDAR_SLICE] = table[dt.toordinal() - first_ordinal]
+        rows[:, HOUR_SLICE] = HOUR_TABLE[dt.hour]
+        rows[:, MINUTE_INDEX] = dt.minute
+
+    def encode(self, timestamp, room, weather_data=None, user_activity=None, out=None):
+        """
+        Encode a single row.
+
+        Args:
+            timestamp: datetime, epoch seconds or ISO-8601 string
+            room (str): Room name
+            weather_data (dict, optional): OpenWeatherMap-style payload
+            user_activity (dict, optional): Recent activity / preference values
+            out (ndarray, optional): Preallocated (1, FEATURE_COUNT) float32 buffer
+
+        Returns:
+            ndarray: (1, FEATURE_COUNT) float32 row (out if given)
+        """
+        if out is None:
+            out = np.empty((1, FEATURE_COUNT), dtype=np.float32)
+        self._write_time(out, to_datetime(timestamp))
+        row = out[0]
+        row[ROOM_SLICE] = self.room_vector(room)
+        row[WEATHER_SLICE] = self.weather_vector(weather_data)
+        row[ACTIVITY_SLICE] = encode_activity(user_activity)
+        return out
+
+    def encode_batch(self, timestamp, rooms, weather_data=None, user_activity=None, out=None):
+        """
+        Encode one row per room, all sharing the same timestamp and context.
+
+        Time, weather and activity blocks are computed once and broadcast.
+
+        Returns:
+            ndarray: (len(rooms), FEATURE_COUNT) float32 matrix (out if given)
+        """
+        rooms = list(rooms)
+        if out is None:
+            out = np.empty((len(rooms), FEATURE_COUNT), dtype=np.float32)
+        self._write_time(out, to_datetime(timestamp))
+        for i, room in enumerate(rooms):
+            out[i, ROOM_SLICE] = self.room_vector(room)
+        out[:, WEATHER_SLICE] = self.weather_vector(weather_data)
+        out[:, ACTIVITY_SLICE] = encode_activity(user_activity)
+        return out
+
+    def encode_columns(self, timestamps, rooms, weather=None, activity=None):
+        """
+        Encode many rows at once from columnar inputs (training path).
+
+        Calendar, hour and room blocks are gathered from the lookup tables
+        with array indexing, so the cost is a few vectorized passes rather
+        than per-row Python.
+
+        Args:
+            timestamps: array-like of naive datetime64 values (local wall time)
+            rooms: array-like of room names
+            weather (ndarray, optional): (N, len(WEATHER_FEATURES)) block; defaults if None
+            activity (ndarray, optional): (N, len(ACTIVITY_FEATURES)) block; defaults if None
+
+        Returns:
+            ndarray: (N, FEATURE_COUNT) float32 matrix
+        """
+        minutes = np.asarray(timestamps, dtype='datetime64[m]')
+        out = np.empty((len(minutes), FEATURE_COUNT), dtype=np.float32)
+
+        days = minutes.astype('datetime64[D]')
+        years = days.astype('datetime64[Y]')
+        day_of_year = (days - years.astype('datetime64[D]')).astype(np.int64)
+        year_numbers = years.astype(np.int64) + 1970
+        for year in np.unique(year_numbers):
+            _, table = self.calendar_table(int(year))
+            mask = year_numbers == year
+            out[mask, CALENDAR_SLICE] = table[day_of_year[mask]]
+
+        minute_of_day = (minutes - days).astype(np.int64)
+        out[:, HOUR_SLICE] = HOUR_TABLE[minute_of_day // 60]
+        out[:, MINUTE_INDEX] = minute_of_day % 60
+
+        names, inverse = np.unique(np.asarray(rooms).astype(str), return_inverse=True)
+        room_table = np.stack([self.room_vector(name) for name in names] or [self.room_vector(None)])
+        out[:, ROOM_SLICE] = room_table[inverse.ravel()]
+
+        out[:, WEATHER_SLICE] = DEFAULT_WEATHER if weather is None else weather
+        out[:, ACTIVITY_SLICE] = DEFAULT_ACTIVITY if activity is None else activity
+        return out
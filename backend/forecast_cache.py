@@ -0,0 +1,160 @@
+"""
+Weather forecast cache, aligned to the 3-hour forecast periods.
+
+OpenWeatherMap publishes its forecast in 3-hour periods starting at
+00:00 UTC, so a fetched forecast stays valid until the next period
+boundary and is refreshed only then. It is the same single-flight,
+stale-while-revalidate cache as the current weather (see weather_cache.py),
+shared by workers under its own key in the weather store.
+
+The parsed forecast is kept as parallel arrays (timestamp, temperature,
+cloud cover, condition code) rather than the API's nested dicts. Lighting
+and AI code read upcoming conditions with Forecast.at() without any
+network work.
+"""
+
+import os
+import time
+from array import array
+from bisect import bisect_right
+
+from weather_cache import WeatherCache
+
+# Seconds per forecast period (periods start at multiples of this since the epoch, i.e. UTC)
+FORECAST_PERIOD_SECONDS = int(os.getenv('FORECAST_PERIOD_SECONDS', '10800'))
+
+# OpenWeatherMap condition code (weather[0].id) groups
+CONDITION_GROUPS = (
+    (200, 300, 'Thunderstorm'),
+    (300, 400, 'Drizzle'),
+    (500, 600, 'Rain'),
+    (600, 700, 'Snow'),
+    (700, 800, 'Atmosphere'),
+    (800, 801, 'Clear'),
+    (801, 900, 'Clouds'),
+)
+
+
+def condition_name(code):
+    """Main condition ('Rain', 'Clouds', ...) of an OpenWeatherMap condition code"""
+    for low, high, name in CONDITION_GROUPS:
+        if low <= code < high:
+            return name
+    return 'Unknown'
+
+
+class Forecast:
+    """Forecast periods as parallel arrays, oldest first"""
+
+    __slots__ = ('city', 'dt', 'temp', 'clouds', 'code')
+
+    def __init__(self, city, dt=(), temp=(), clouds=(), code=()):
+        self.city = city
+        self.dt = array('q', dt)  # Period start, epoch seconds
+        self.temp = array('f', temp)  # °F
+        self.clouds = array('B', clouds)  # Cloud cover, %
+        self.code = array('H', code)  # OpenWeatherMap condition code
+
+    @classmethod
+    def from_api(cls, payload, city=None):
+        """Parse an OpenWeatherMap /forecast response"""
+        forecast = cls((payload.get('city') or {}).get('name', city))
+        for period in payload.get('list', []):
+            forecast.append(
+                period['dt'],
+                period.get('main', {}).get('temp', 0.0),
+                period.get('clouds', {}).get('all', 0),
+                (period.get('weather') or [{}])[0].get('id', 0)
+            )
+        return forecast
+
+    def append(self, dt, temp, clouds, code):
+        self.dt.append(int(dt))
+        self.temp.append(float(temp))
+        self.clouds.append(max(0, min(100, int(clouds))))
+        self.code.append(int(code))
+
+    def __len__(self):
+        return len(self.dt)
+
+    def at(self, timestamp):
+        """
+        Conditions forecast for a moment.
+
+        Args:
+            timestamp (float): Epoch seconds
+
+        Returns:
+            dict: {'dt', 'temp', 'clouds', 'code', 'condition'} of the period covering
+            timestamp (the first period before it starts), or None without periods
+        """
+        if not self.dt:
+            return None
+        index = max(0, bisect_right(self.dt, timestamp) - 1)
+        return self._period(index)
+
+    def _period(self, index):
+        code = self.code[index]
+        return {
+            'dt': self.dt[index],
+            'temp': round(self.temp[index], 1),
+            'clouds': self.clouds[index],
+            'code': code,
+            'condition': condition_name(code)
+        }
+
+    def periods(self):
+        return [self._period(index) for index in range(len(self))]
+
+    def to_dict(self):
+        return {
+            'city': self.city,
+            'dt': self.dt.tolist(),
+            'temp': [round(value, 1) for value in self.temp],
+            'clouds': self.clouds.tolist(),
+            'code': self.code.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['city'], data['dt'], data['temp'], data['clouds'], data['code'])
+
+
+def next_period_start(timestamp, period=FORECAST_PERIOD_SECONDS):
+    """Epoch seconds of the first forecast period boundary after timestamp"""
+    return (int(timestamp) // period + 1) * period
+
+
+class ForecastCache(WeatherCache):
+    """WeatherCache of a Forecast that expires at the next forecast period boundary"""
+
+    def __init__(self, fetch, fallback, period=FORECAST_PERIOD_SECONDS, **kwargs):
+        """
+        Args:
+            fetch: fetch() -> Forecast; raises on failure
+            fallback: fallback() -> Forecast served while nothing was ever fetched
+            period (int): Forecast period length in seconds
+        """
+        self.period = period
+        kwargs.setdefault('key', 'forecast')
+        super().__init__(fetch, fallback, ttl=period, **kwargs)
+
+    def expires_at(self, fetched_at):
+        return next_period_start(fetched_at, self.period)
+
+    def refresh_at(self, fetched_at):
+        # New periods are only published at the boundary, so there is nothing to refresh ahead of
+        return self.expires_at(fetched_at)
+
+    def encode(self, data):
+        return data.to_dict()
+
+    def decode(self, payload):
+        return Forecast.from_dict(payload)
+
+    def upcoming(self, hours=24, now=None):
+        """Forecast periods from now over the next hours (cached; never waits once fetched)"""
+        now = time.time() if now is None else now
+        forecast = self.get()
+        return [period for period in forecast.periods()
+                if period['dt'] + self.period > now and period['dt'] < now + hours * 3600]
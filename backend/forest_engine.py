@@ -0,0 +1,139 @@
+"""
+Flattened random forest inference engine.
+
+compile_forest() exports a fitted sklearn RandomForestClassifier into a few
+flat NumPy arrays (one node table shared by all trees). FlatForest evaluates
+them with vectorized NumPy only, walking every (tree, row) pair one level per
+step. This avoids sklearn's per-call input validation and joblib thread
+dispatch, which dominate latency for the handful of rows scored per AI tick.
+
+Leaves point back to themselves, and walks that reach a leaf are dropped
+from the active set, so deep trees only cost work for the rows still
+descending them.
+"""
+
+import numpy as np
+
+# Arrays that fully describe a compiled forest (used for saving/loading)
+FOREST_ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots')
+
+
+class FlatForest:
+    """Numpy-only evaluator for a forest compiled by compile_forest()"""
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, n_features, classes):
+        # Index arrays are intp so np.take uses them without conversion, and
+        # memory-mapped arrays of the right dtype are used without copying
+        self.feature = np.asarray(feature, dtype=np.intp)      # (n_nodes,) split feature (0 for leaves)
+        self.threshold = np.asarray(threshold, dtype=np.float64)  # (n_nodes,) split threshold
+        self.children = np.asarray(children, dtype=np.intp)    # (2 * n_nodes,) interleaved left/right child (self for leaves)
+        self.value = np.asarray(value, dtype=np.float64)       # (n_nodes, n_classes) leaf class probabilities
+        self.roots = np.asarray(roots, dtype=np.intp)          # (n_trees,) root node of each tree
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.classes = np.asarray(classes)
+        self._is_leaf = self.children[0::2] == np.arange(len(self.feature))
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def apply(self, X):
+        """Return the leaf index reached in every tree, shape (n_trees, n_rows)"""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected input with {self.n_features} features, got shape {X.shape}")
+        n_rows = X.shape[0]
+        X_flat = np.ascontiguousarray(X.T).ravel()
+
+        # One walk per (tree, row); finished walks are dropped from the active set
+        leaves = np.repeat(self.roots, n_rows)
+        walks = np.arange(leaves.size)
+        nodes = leaves.copy()
+        rows = np.tile(np.arange(n_rows), self.n_trees)
+        for _ in range(self.max_depth):
+            go_right = np.take(X_flat, np.take(self.feature, nodes) * n_rows + rows) > np.take(self.threshold, nodes)
+            nodes = np.take(self.children, nodes * 2 + go_right)
+            done = np.take(self._is_leaf, nodes)
+            if done.any():
+                leaves[walks[done]] = nodes[done]
+                pending = ~done
+                if not pending.any():
+                    break
+                walks, nodes, rows = walks[pending], nodes[pending], rows[pending]
+        return leaves.reshape(self.n_trees, n_rows)
+
+    def predict_proba(self, X):
+        """Class probabilities, shape (n_rows, n_classes) - matches sklearn's predict_proba"""
+        return np.take(self.value, self.apply(X), axis=0).mean(axis=0)
+
+    def predict(self, X):
+        """Most likely class for each row"""
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+    def to_arrays(self):
+        """Arrays and metadata needed to rebuild this forest with from_arrays()"""
+        arrays = {name: getattr(self, name) for name in FOREST_ARRAYS}
+        arrays['classes'] = self.classes
+        meta = {'max_depth': self.max_depth, 'n_features': self.n_features}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Rebuild a forest from to_arrays() output (arrays may be memory-mapped)"""
+        return cls(
+            arrays['feature'], arrays['threshold'], arrays['children'], arrays['value'],
+            arrays['roots'], meta['max_depth'], meta['n_features'], arrays['classes']
+        )
+
+
+def compile_forest(model):
+    """
+    Compile a fitted sklearn RandomForestClassifier into a FlatForest.
+
+    All trees are concatenated into one node table; child indexes are
+    rewritten to global node indexes and leaf value counts are normalized to
+    per-tree class probabilities.
+    """
+    if not hasattr(model, 'estimators_'):
+        raise ValueError("Model is not fitted")
+
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes)
+        is_leaf = tree.children_left == -1
+
+        roots.append(offset)
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        children.append(np.stack([
+            np.where(is_leaf, node_ids, tree.children_left),
+            np.where(is_leaf, node_ids, tree.children_right)
+        ], axis=1).ravel() + offset)
+
+        counts = tree.value[:, 0, :]
+        totals = counts.sum(axis=1, keepdims=True)
+        values.append(counts / np.where(totals == 0, 1, totals))
+
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n_nodes
+
+    return FlatForest(
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        children=np.concatenate(children),
+        value=np.concatenate(values),
+        roots=roots,
+        max_depth=max_depth,
+        n_features=model.n_features_in_,
+        classes=model.classes_
+    )
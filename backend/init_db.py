@@ -5,6 +5,7 @@ Ensures all tables are created and sample data is loaded for presentation
 """
 
 from app import app, db, LightDevice, EnergyUsage, OccupancyData, User, ActivityLog
+from room_registry import room_registry
 from datetime import datetime, timedelta
 import random
 
@@ -45,7 +46,7 @@ def init_database():
                 db.session.add(usage)
         
         # Create sample occupancy data
-        rooms = ['living_room', 'kitchen', 'bedroom', 'bathroom', 'office']
+        rooms = list(room_registry.names())
         for i in range(100):  # Last 100 occupancy records
             date = datetime.now() - timedelta(hours=i)
             room = random.choice(rooms)
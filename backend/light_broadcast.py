@@ -0,0 +1,231 @@
+"""
+Coalesced, sequence-numbered Socket.IO broadcasts of light changes.
+
+Every commit to the light store is tracked here (track(), called from a
+store listener together with the change journal, so each room's latest
+record comes with its journal seq) and marks the room dirty. Dirty rooms
+are sent when a `with broadcaster.batch():` block ends (one bulk, weather
+or AI operation), or LIGHTS_BROADCAST_WINDOW seconds after a change made
+outside such a block. A room changed several times is sent once.
+
+Frames carry only the fields that changed since the room was last sent,
+and a cursor: `since` is the seq of the previous frame and `seq` the
+journal seq of the newest change included. Clients that emit
+`subscribe_lights_batch` get one frame per flush:
+
+    lights_batch_update {'epoch', 'since', 'seq', 'count',
+                         'updates': [{'room': ..., 'changes': {...}, ...}]}
+
+A frame whose `since` is not the client's last seq means frames were
+missed (e.g. a dropped socket). The client then sends its epoch and last
+seq (with subscribe_lights_batch, or lights_resync), and gets a
+`lights_state` reply. The reply either replays the rooms changed since
+that seq (from the change journal) or, when the seq is unknown or too
+old, holds a full snapshot.
+
+Every other client keeps receiving one `light_update` per room with the
+full state (plus `seq` and `changes`).
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+# Seconds to gather changes made outside a batch() block (0 = send immediately)
+LIGHTS_BROADCAST_WINDOW = float(os.getenv('LIGHTS_BROADCAST_WINDOW', '0.05'))
+
+BATCH_ROOM = 'lights_batch'
+
+
+class LightBroadcaster:
+    """Sends light changes as seq-numbered delta batches plus legacy per-room events"""
+
+    def __init__(self, emit, journal, initial, window=LIGHTS_BROADCAST_WINDOW):
+        """
+        Args:
+            emit: emit(event, data, room=None, skip_sid=None)
+            journal (ChangeJournal): Journal the 'lights' changes are recorded in
+            initial (dict): room -> current state dict (what clients can already have)
+            window (float): Seconds to gather changes made outside batch() blocks
+        """
+        self._emit = emit
+        self.journal = journal
+        self.window = window
+        self._sent = {room: dict(state) for room, state in initial.items()}
+        self.seq = journal.seq  # Seq of the newest change sent
+        self._latest = {}  # room -> (record, seq) of the newest commit
+        self._dirty = set()
+        self._extras = {}  # room -> extra keys from publish()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()  # Frames leave in seq order
+        self._wake = threading.Event()
+        self._thread = None
+        self._local = threading.local()
+        self._subscribers = set()
+        self.updates = 0
+        self.flushes = 0
+        self.legacy_frames = 0
+        self.batch_frames = 0
+        self.replays = 0
+        self.snapshots = 0
+
+    # Subscriptions (Socket.IO session ids of batch-aware clients)
+
+    def subscribe(self, sid):
+        self._subscribers.add(sid)
+
+    def unsubscribe(self, sid):
+        self._subscribers.discard(sid)
+
+    # Publishing
+
+    def _in_batch(self):
+        return getattr(self._local, 'batch', False)
+
+    def track(self, record, seq):
+        """Note a committed record and its journal seq (store listener: runs under the store lock)"""
+        with self._lock:
+            self._latest[record.room] = (record, seq)
+            self._dirty.add(record.room)
+        if not self._in_batch() and self._thread is not None:
+            self._wake.set()
+
+    def publish(self, record, **extra):
+        """Send a room's change (extra keys, e.g. source, go along with it)"""
+        if extra:
+            with self._lock:
+                self._extras.setdefault(record.room, {}).update(extra)
+        if self._in_batch():
+            return
+        if self.window <= 0 or self._thread is None:
+            self.flush()
+        else:
+            self._wake.set()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Send every change made in this block (on this thread) in one flush at the end"""
+        if self._in_batch():
+            # Nested: the outer block sends
+            yield
+            return
+        self._local.batch = True
+        try:
+            yield
+        finally:
+            self._local.batch = False
+            self.flush()
+
+    def flush(self):
+        """Send all dirty rooms; returns the number of room updates sent"""
+        with self._send_lock:
+            with self._lock:
+                rooms, self._dirty = self._dirty, set()
+                entries = [(room,) + self._latest[room] + (self._extras.pop(room, {}),) for room in rooms]
+            if not entries:
+                return 0
+            updates, legacy = [], []
+            for room, record, seq, extra in sorted(entries, key=lambda entry: entry[2]):
+                state = record.to_dict()
+                sent = self._sent.get(room, {})
+                changes = {name: value for name, value in state.items() if sent.get(name) != value}
+                if not changes:
+                    continue
+                self._sent[room] = state
+                update = {'room': room, 'changes': changes}
+                update.update(extra)
+                updates.append(update)
+                legacy.append(dict(update, state=state, seq=seq))
+            newest = max(entry[2] for entry in entries)
+            if not updates:
+                # Nothing visible changed; clients are still current at the new seq
+                self.seq = max(self.seq, newest)
+                return 0
+            since, self.seq = self.seq, max(self.seq, newest)
+            self._send(since, updates, legacy)
+            return len(updates)
+
+    def _send(self, since, updates, legacy):
+        subscribers = list(self._subscribers)
+        for update in legacy:
+            self._emit('light_update', update, skip_sid=subscribers or None)
+        self.legacy_frames += len(legacy)
+        if subscribers:
+            self._emit('lights_batch_update', {
+                'epoch': self.journal.epoch,
+                'since': since,
+                'seq': self.seq,
+                'updates': updates,
+                'count': len(updates)
+            }, room=BATCH_ROOM)
+            self.batch_frames += 1
+        self.updates += len(updates)
+        self.flushes += 1
+
+    # Resync
+
+    def resync(self, epoch=None, seq=None):
+        """
+        lights_state payload that brings a client to the current broadcast seq.
+
+        Rooms changed after (epoch, seq) are replayed with their full state;
+        without a usable seq the payload is a snapshot of every room.
+        """
+        with self._send_lock:
+            result = self.journal.since(seq, epoch, kinds={'lights'}) if seq is not None else None
+            if result is None:
+                self.snapshots += 1
+                return {
+                    'epoch': self.journal.epoch,
+                    'seq': self.seq,
+                    'snapshot': True,
+                    'lights': {room: dict(state) for room, state in self._sent.items()}
+                }
+            changes = result[0]
+            rooms = sorted({change.key for change in changes if change.key in self._sent})
+            self.replays += 1
+            return {
+                'epoch': self.journal.epoch,
+                'seq': self.seq,
+                'snapshot': False,
+                'updates': [{'room': room, 'changes': dict(self._sent[room])} for room in rooms],
+                'count': len(rooms)
+            }
+
+    # Window thread
+
+    def start(self):
+        """Start the thread that sends changes made outside batch() blocks"""
+        if self._thread is None and self.window > 0:
+            self._thread = threading.Thread(target=self._flush_loop, name='light-broadcast', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait()
+            # Let the rest of the burst arrive
+            time.sleep(self.window)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error broadcasting light updates: {e}")
+
+    def stats(self):
+        return {
+            'window_seconds': self.window,
+            'seq': self.seq,
+            'subscribers': len(self._subscribers),
+            'updates': self.updates,
+            'flushes': self.flushes,
+            'legacy_frames': self.legacy_frames,
+            'batch_frames': self.batch_frames,
+            'replays': self.replays,
+            'snapshots': self.snapshots
+        }
@@ -0,0 +1,170 @@
+"""
+Write-behind persistence of light state to the SQLite `lights` table.
+
+Control endpoints only update the in-memory LightStateStore; a store
+listener marks the changed rooms dirty. A background thread flushes the
+dirty rooms every LIGHTS_FLUSH_INTERVAL seconds, or as soon as
+LIGHTS_FLUSH_THRESHOLD rooms are dirty, with one executemany upsert in a
+single transaction. Each flush writes the room's current record, so a room
+changed many times between flushes is written once.
+
+restore() loads the table back into the store at startup, so a restart
+keeps the last persisted state instead of resetting every light to off.
+"""
+
+import os
+import time
+import atexit
+import sqlite3
+import contextlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds between flushes of dirty rooms
+LIGHTS_FLUSH_INTERVAL = float(os.getenv('LIGHTS_FLUSH_INTERVAL', '2.0'))
+# Flush early once this many rooms are dirty
+LIGHTS_FLUSH_THRESHOLD = int(os.getenv('LIGHTS_FLUSH_THRESHOLD', '50'))
+
+_UPSERT = '''INSERT INTO lights (room, status, brightness, color_temperature, motion_detected)
+             VALUES (?, ?, ?, ?, ?)
+             ON CONFLICT (room) DO UPDATE SET status = excluded.status, brightness = excluded.brightness,
+                 color_temperature = excluded.color_temperature, motion_detected = excluded.motion_detected'''
+
+
+class LightStatePersister:
+    """Batches light state changes from a LightStateStore into the lights table"""
+
+    def __init__(self, store, db_path, interval=LIGHTS_FLUSH_INTERVAL, threshold=LIGHTS_FLUSH_THRESHOLD):
+        self.store = store
+        self.db_path = db_path
+        self.interval = interval
+        self.threshold = max(1, threshold)
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._conn = None  # Used by flush() only, under _flush_lock
+        self.flushes = 0
+        self.rows_written = 0
+        self.errors = 0
+        self.last_flush_ms = None
+        self.last_flush_at = None
+        store.add_listener(self._mark_dirty)
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        # Same schema as init_db(), which may not have run yet
+        conn.execute('''CREATE TABLE IF NOT EXISTS lights
+                        (room TEXT PRIMARY KEY, status TEXT, brightness INTEGER,
+                         color_temperature TEXT, motion_detected BOOLEAN)''')
+        return conn
+
+    def _mark_dirty(self, records):
+        # Runs under the store's writer lock: only record the room names
+        with self._dirty_lock:
+            self._dirty.update(records)
+            if len(self._dirty) >= self.threshold:
+                self._wake.set()
+
+    def restore(self):
+        """
+        Load persisted state into the store (rooms not in the store are ignored).
+
+        Returns:
+            int: Number of rooms restored
+        """
+        try:
+            with contextlib.closing(self._connect()) as conn:
+                rows = conn.execute('SELECT room, status, brightness, color_temperature, motion_detected '
+                                    'FROM lights').fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not restore light state from {self.db_path}: {e}")
+            return 0
+        updates = {}
+        for room, status, brightness, color_temperature, motion_detected in rows:
+            if room not in self.store or status is None:
+                continue
+            updates[room] = {
+                'status': status,
+                'brightness': int(brightness or 0),
+                'color_temperature': color_temperature or 'warm',
+                'motion_detected': bool(motion_detected)
+            }
+        restored = self.store.update_many(updates)
+        # Restored values are already on disk
+        with self._dirty_lock:
+            self._dirty.difference_update(restored)
+        if restored:
+            logger.info(f"💡 Restored light state for {len(restored)} rooms")
+        return len(restored)
+
+    def start(self):
+        """Start the background flush thread (also flushes at interpreter exit)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name='light-persister', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def flush(self):
+        """
+        Write every dirty room's current state in one transaction.
+
+        Returns:
+            int: Number of rows written
+        """
+        with self._flush_lock:
+            with self._dirty_lock:
+                rooms, self._dirty = self._dirty, set()
+            if not rooms:
+                return 0
+            rows = []
+            for room in rooms:
+                record = self.store.get(room)
+                if record is not None:
+                    rows.append((room, record.status, record.brightness,
+                                 record.color_temperature, record.motion_detected))
+            start = time.perf_counter()
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                with self._conn:
+                    self._conn.executemany(_UPSERT, rows)
+            except sqlite3.Error as e:
+                # Keep the rooms dirty and retry on the next flush
+                with self._dirty_lock:
+                    self._dirty.update(rooms)
+                self.errors += 1
+                logger.error(f"Error persisting light state: {e}")
+                return 0
+            self.flushes += 1
+            self.rows_written += len(rows)
+            self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+            self.last_flush_at = time.time()
+            return len(rows)
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in light persistence loop: {e}")
+
+    def stats(self):
+        """Flush counters for status endpoints"""
+        return {
+            'pending': len(self._dirty),
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'errors': self.errors,
+            'last_flush_ms': self.last_flush_ms,
+            'interval_seconds': self.interval,
+            'threshold': self.threshold
+        }
@@ -0,0 +1,370 @@
+"""
+Thread-safe, versioned store for light state.
+
+Each room's state is an immutable LightRecord (__slots__, interned strings).
+Writers replace records under a single writer lock; readers never lock and
+always see either the old or the new record, never a half-applied update.
+
+Every committed write (a single-room update or an atomic multi-room batch)
+increments the store's global version, and each record it changes is
+stamped with that version, so a record's version is also the per-room
+version. compare_and_set() makes read-then-write sequences (e.g. the AI
+loop deciding from a state it read earlier) safe against concurrent
+changes.
+
+snapshot() returns an immutable LightsSnapshot that is cached until the
+next write, so repeated reads (GET /api/lights, status endpoints) do not
+rebuild or copy anything.
+
+attach() shares the store with other worker processes through a
+state_backend backend: local writes are published and other workers'
+writes are applied. Versions are per process. Publishing is queued to the
+backend's publisher thread, so a write never waits on the cross-process
+lock; a room's remote changes are held back while its own publish is in
+flight and applied afterwards if they turn out to be newer.
+"""
+
+import sys
+import time
+import logging
+import threading
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+LIGHT_FIELDS = ('status', 'brightness', 'color_temperature', 'motion_detected')
+
+DEFAULT_LIGHT_STATE = {
+    'status': 'off',
+    'brightness': 0,
+    'color_temperature': 'warm',
+    'motion_detected': False
+}
+
+
+class LightRecord:
+    """Immutable state of one light"""
+
+    __slots__ = ('room', 'status', 'brightness', 'color_temperature', 'motion_detected',
+                 'version', 'updated_at', '_dict')
+
+    def __init__(self, room, status, brightness, color_temperature, motion_detected, version, updated_at):
+        set_field = object.__setattr__
+        set_field(self, 'room', sys.intern(room))
+        set_field(self, 'status', sys.intern(status))
+        set_field(self, 'brightness', int(brightness))
+        set_field(self, 'color_temperature', sys.intern(str(color_temperature)))
+        set_field(self, 'motion_detected', bool(motion_detected))
+        set_field(self, 'version', version)
+        set_field(self, 'updated_at', updated_at)
+        set_field(self, '_dict', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"LightRecord is immutable (tried to set '{name}')")
+
+    def __repr__(self):
+        return (f"LightRecord(room={self.room!r}, status={self.status!r}, brightness={self.brightness}, "
+                f"color_temperature={self.color_temperature!r}, motion_detected={self.motion_detected}, "
+                f"version={self.version})")
+
+    def changed_fields(self, changes):
+        """Subset of changes that differ from this record"""
+        return {name: value for name, value in changes.items() if getattr(self, name) != value}
+
+    def to_dict(self):
+        """API representation (the legacy lights_state shape); built once per record, do not mutate"""
+        data = self._dict
+        if data is None:
+            data = {name: getattr(self, name) for name in LIGHT_FIELDS}
+            object.__setattr__(self, '_dict', data)
+        return data
+
+
+class LightsSnapshot:
+    """Immutable view of all rooms at one store version"""
+
+    __slots__ = ('version', 'records', '_dict')
+
+    def __init__(self, version, records):
+        self.version = version
+        self.records = MappingProxyType(records)
+        self._dict = None
+
+    def __getitem__(self, room):
+        return self.records[room]
+
+    def __contains__(self, room):
+        return room in self.records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, room, default=None):
+        return self.records.get(room, default)
+
+    def items(self):
+        return self.records.items()
+
+    def as_dict(self):
+        """room -> API dict for every light; built once per snapshot, do not mutate"""
+        data = self._dict
+        if data is None:
+            data = self._dict = {room: record.to_dict() for room, record in self.records.items()}
+        return data
+
+
+class LightStateStore:
+    """Versioned light state with lock-free reads and serialized, atomic writes"""
+
+    def __init__(self, rooms=(), defaults=None):
+        # Reentrant: the local state backend runs publish callbacks inside _commit
+        self._lock = threading.RLock()
+        self._records = {}
+        self.version = 0
+        self._snapshot = None
+        self._backend = None
+        self._namespace = None
+        self._on_remote_change = None
+        self._seqs = {}  # room -> backend sequence number of its latest write
+        self._unpublished = {}  # room -> local writes queued but not yet published
+        self._deferred = {}  # room -> (value, seq) of the newest remote change held back meanwhile
+        self._listeners = []
+        defaults = dict(DEFAULT_LIGHT_STATE, **(defaults or {}))
+        for room in rooms:
+            self._records[room] = self._make_record(room, defaults, 0)
+
+    @staticmethod
+    def _make_record(room, fields, version):
+        return LightRecord(
+            room, fields['status'], fields['brightness'], fields['color_temperature'],
+            fields['motion_detected'], version, time.time()
+        )
+
+    def _validate(self, changes):
+        unknown = set(changes) - set(LIGHT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown light fields: {', '.join(sorted(unknown))}")
+
+    def _commit(self, updates, publish=True):
+        """Apply {room: changes} as one version (caller holds the lock); returns the new records"""
+        changed = {}
+        for room, changes in updates.items():
+            current = self._records[room]
+            changes = current.changed_fields(changes)
+            if changes:
+                changed[room] = changes
+        if not changed:
+            return {}
+        self.version += 1
+        records = {}
+        for room, changes in changed.items():
+            current = self._records[room]
+            fields = {name: changes.get(name, getattr(current, name)) for name in LIGHT_FIELDS}
+            records[room] = self._make_record(room, fields, self.version)
+        # Readers see each record either before or after; never a mix of fields
+        self._records.update(records)
+        self._snapshot = None
+        if publish and self._backend is not None:
+            self._publish(records)
+        for listener in self._listeners:
+            listener(records)
+        return records
+
+    def add_listener(self, listener):
+        """
+        Call listener(records) after every commit, local or from another worker.
+
+        records maps room -> new LightRecord. Listeners run under the writer
+        lock, so they must be cheap (e.g. mark rooms dirty) and must not
+        write to the store.
+        """
+        self._listeners.append(listener)
+
+    def _publish(self, records):
+        """Queue changed records for other workers (caller holds the lock, so the queue is in commit order)"""
+        rooms = tuple(records)
+        for room in rooms:
+            self._unpublished[room] = self._unpublished.get(room, 0) + 1
+        try:
+            self._backend.publish_async(
+                self._namespace, {room: record.to_dict() for room, record in records.items()},
+                lambda seqs: self._published(rooms, seqs)
+            )
+        except Exception as e:
+            self._published(rooms, {})
+            logger.error(f"Could not share light state with other workers: {e}")
+
+    def _published(self, rooms, seqs):
+        """Publish callback: record the seqs, then apply remote changes held back meanwhile"""
+        applied = []
+        with self._lock:
+            self._seqs.update(seqs)
+            for room in rooms:
+                self._unpublished[room] -= 1
+                if self._unpublished[room]:
+                    continue
+                del self._unpublished[room]
+                deferred = self._deferred.pop(room, None)
+                # Only a change committed after our own publish is newer than our write
+                if deferred is not None and deferred[1] > self._seqs.get(room, 0):
+                    record = self._apply_remote_locked(room, *deferred)
+                    if record is not None:
+                        applied.append(record)
+        if self._on_remote_change is not None:
+            for record in applied:
+                self._on_remote_change(record)
+
+    @staticmethod
+    def _shared_fields(value):
+        return {name: value[name] for name in LIGHT_FIELDS if name in value}
+
+    def attach(self, backend, namespace='lights', on_remote_change=None):
+        """
+        Share this store with other worker processes through a state backend.
+
+        Shared state already in the backend replaces the local defaults. Later
+        local writes are published; writes from other workers are applied
+        (and passed to on_remote_change(record)) unless this process has
+        written the room more recently.
+        """
+        with self._lock:
+            self._backend = backend
+            self._namespace = namespace
+            self._on_remote_change = on_remote_change
+            updates = {}
+            for room, (value, seq) in backend.load(namespace).items():
+                if room in self._records:
+                    updates[room] = self._shared_fields(value)
+                    self._seqs[room] = seq
+            self._commit(updates, publish=False)
+        backend.subscribe(namespace, self._apply_remote)
+
+    def _apply_remote(self, room, value, seq):
+        with self._lock:
+            if room not in self._records or seq <= self._seqs.get(room, 0):
+                return
+            if self._unpublished.get(room):
+                # Ordered against our own queued write once that has its seq (see _published)
+                if seq > self._deferred.get(room, (None, 0))[1]:
+                    self._deferred[room] = (value, seq)
+                return
+            record = self._apply_remote_locked(room, value, seq)
+        if record is not None and self._on_remote_change is not None:
+            self._on_remote_change(record)
+
+    def _apply_remote_locked(self, room, value, seq):
+        self._seqs[room] = seq
+        return self._commit({room: self._shared_fields(value)}, publish=False).get(room)
+
+    # Reads (lock-free)
+
+    def __contains__(self, room):
+        return room in self._records
+
+    def __iter__(self):
+        return iter(self.rooms())
+
+    def __len__(self):
+        return len(self._records)
+
+    def rooms(self):
+        """Tuple of room names"""
+        return tuple(self._records)
+
+    def get(self, room):
+        """Current record for a room, or None if the room does not exist"""
+        return self._records.get(room)
+
+    def snapshot(self):
+        """Immutable snapshot of all rooms, cached until the next write"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._snapshot = LightsSnapshot(self.version, dict(self._records))
+        return snapshot
+
+    # Writes
+
+    def add_room(self, room, **fields):
+        """Add a room (no-op if it already exists); returns its record"""
+        self._validate(fields)
+        with self._lock:
+            record = self._records.get(room)
+            if record is None:
+                self.version += 1
+                record = self._make_record(room, dict(DEFAULT_LIGHT_STATE, **fields), self.version)
+                self._records[room] = record
+                self._snapshot = None
+            return record
+
+    def update(self, room, **changes):
+        """
+        Set fields of one room.
+
+        Returns:
+            LightRecord: The room's record after the update (unchanged if the
+            values were already set), or None if the room does not exist
+        """
+        self._validate(changes)
+        with self._lock:
+            if room not in self._records:
+                return None
+            return self._commit({room: changes}).get(room, self._records[room])
+
+    def compare_and_set(self, room, expected_version, **changes):
+        """
+        Update a room only if its record is still at expected_version.
+
+        Returns:
+            LightRecord: The new (or unchanged) record, or None if the room does
+            not exist or was changed by someone else since expected_version
+        """
+        self._validate(changes)
+        with self._lock:
+            current = self._records.get(room)
+            if current is None or current.version != expected_version:
+                return None
+            return self._commit({room: changes}).get(room, current)
+
+    def modify(self, room, fn):
+        """
+        Atomic read-modify-write of one room.
+
+        fn(current_record) returns a dict of changes (or None for no change)
+        and runs under the writer lock, so keep it cheap and side-effect free.
+
+        Returns:
+            tuple: (previous record, record after the update), or (None, None)
+            if the room does not exist
+        """
+        with self._lock:
+            current = self._records.get(room)
+            if current is None:
+                return None, None
+            changes = fn(current) or {}
+            self._validate(changes)
+            return current, self._commit({room: changes}).get(room, current)
+
+    def update_many(self, updates):
+        """
+        Atomically apply {room: changes} to several rooms as a single version.
+
+        Unknown rooms are ignored. Returns {room: record after the update}
+        for every known room in updates.
+        """
+        for changes in updates.values():
+            self._validate(changes)
+        with self._lock:
+            known = {room: changes for room, changes in updates.items() if room in self._records}
+            records = self._commit(known)
+            return {room: records.get(room, self._records[room]) for room in known}
+
+    def stats(self):
+        """Version and size counters for status endpoints"""
+        return {'version': self.version, 'rooms': len(self._records),
+                'shared': self._backend.name if self._backend is not None else None}
@@ -0,0 +1,254 @@
+"""
+Versioned on-disk model bundles.
+
+A bundle is a directory of plain .npy arrays plus a manifest.json describing
+them (dtype, shape, sha256) and whatever metadata the caller adds (feature
+schema, training hash, metrics). Bundles live under
+
+    <root>/<name>/v000001/
+    <root>/<name>/CURRENT      -> "v000001"
+
+Publishing writes into a temporary directory, renames it into place and then
+atomically swaps the CURRENT pointer with os.replace(), so readers never see
+a half-written bundle. Arrays are loaded with mmap_mode='r': every worker
+process maps the same files and shares their pages through the OS page cache
+instead of unpickling a private copy of the model.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Default bundle root: backend/models, independent of the working directory
+MODEL_DIR = os.getenv('MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+
+# Number of published versions kept on disk per bundle name
+MODEL_KEEP_VERSIONS = int(os.getenv('MODEL_KEEP_VERSIONS', '3'))
+
+# Hash every array on load (reads the whole bundle once; disable for fastest cold start)
+MODEL_VERIFY_CHECKSUMS = os.getenv('MODEL_VERIFY_CHECKSUMS', 'true').lower() == 'true'
+
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+CURRENT_FILE = 'CURRENT'
+
+
+class BundleError(Exception):
+    """Raised when a bundle is missing, incomplete or fails validation"""
+
+
+class ModelBundle:
+    """A loaded bundle: version number, manifest and (memory-mapped) arrays"""
+
+    __slots__ = ('name', 'version', 'path', 'manifest', 'arrays')
+
+    def __init__(self, name, version, path, manifest, arrays):
+        self.name = name
+        self.version = version
+        self.path = path
+        self.manifest = manifest
+        self.arrays = arrays
+
+    @property
+    def metadata(self):
+        return self.manifest.get('metadata', {})
+
+
+def _version_dir(version):
+    return f'v{version:06d}'
+
+
+def _parse_version(entry):
+    if len(entry) == 7 and entry[0] == 'v' and entry[1:].isdigit():
+        return int(entry[1:])
+    return None
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def list_versions(name, root=MODEL_DIR):
+    """Published version numbers for a bundle name, oldest first"""
+    base = os.path.join(root, name)
+    if not os.path.isdir(base):
+        return []
+    return sorted(v for v in map(_parse_version, os.listdir(base)) if v is not None)
+
+
+def current_version(name, root=MODEL_DIR):
+    """Version the CURRENT pointer refers to, or None if nothing is published"""
+    try:
+        with open(os.path.join(root, name, CURRENT_FILE)) as f:
+            return _parse_version(f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def save_bundle(name, arrays, metadata=None, root=MODEL_DIR, keep=MODEL_KEEP_VERSIONS):
+    """
+    Publish a new bundle version.
+
+    Args:
+        name (str): Bundle name, e.g. 'occupancy'
+        arrays (dict): name -> ndarray (numeric dtypes only; no pickled objects)
+        metadata (dict, optional): JSON-serializable metadata stored in the manifest
+        root (str): Bundle root directory
+        keep (int): Number of versions to keep; older ones are removed
+
+    Returns:
+        int: The published version number
+    """
+    base = os.path.join(root, name)
+    os.makedirs(base, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=base)
+    try:
+        entries = {}
+        for array_name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            if array.dtype.hasobject:
+                raise BundleError(f"Array '{array_name}' has an object dtype")
+            filename = f'{array_name}.npy'
+            path = os.path.join(staging, filename)
+            with open(path, 'wb') as f:
+                np.save(f, array, allow_pickle=False)
+                f.flush()
+                os.fsync(f.fileno())
+            entries[array_name] = {
+                'file': filename,
+                'dtype': array.dtype.str,
+                'shape': list(array.shape),
+                'sha256': _sha256(path)
+            }
+
+        # Claim the next free version; a concurrent publisher may take a number first
+        version = (list_versions(name, root) or [0])[-1] + 1
+        while True:
+            manifest = {
+                'format_version': BUNDLE_FORMAT_VERSION,
+                'name': name,
+                'version': version,
+                'created_at': datetime.now().isoformat(),
+                'arrays': entries,
+                'metadata': metadata or {}
+            }
+            with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.rename(staging, os.path.join(base, _version_dir(version)))
+                break
+            except OSError:
+                if not os.path.exists(os.path.join(base, _version_dir(version))):
+                    raise
+                version += 1
+        staging = None
+        _fsync_dir(base)
+
+        # Swap the CURRENT pointer atomically
+        fd, pointer_tmp = tempfile.mkstemp(prefix='.current-', dir=base)
+        with os.fdopen(fd, 'w') as f:
+            f.write(_version_dir(version))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, os.path.join(base, CURRENT_FILE))
+        _fsync_dir(base)
+
+        _prune_versions(name, root, keep)
+        logger.info(f"Published model bundle {name} {_version_dir(version)}")
+        return version
+    finally:
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+
+
+def _prune_versions(name, root, keep):
+    """Remove all but the newest `keep` versions (never the current one)"""
+    current = current_version(name, root)
+    versions = list_versions(name, root)
+    for version in versions[:-keep] if keep > 0 else []:
+        if version != current:
+            # Processes that still map the old files keep them until they unmap
+            shutil.rmtree(os.path.join(root, name, _version_dir(version)), ignore_errors=True)
+
+
+def load_bundle(name, root=MODEL_DIR, version=None, mmap_mode='r', verify_checksums=MODEL_VERIFY_CHECKSUMS):
+    """
+    Load and validate a bundle (the CURRENT version unless one is given).
+
+    Every array listed in the manifest must exist with the recorded dtype and
+    shape, and (when verify_checksums is set) the recorded sha256.
+
+    Raises:
+        BundleError: If nothing is published or the bundle fails validation
+    """
+    if version is None:
+        version = current_version(name, root)
+        if version is None:
+            raise BundleError(f"No published '{name}' bundle in {root}")
+    path = os.path.join(root, name, _version_dir(version))
+
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BundleError(f"Unreadable manifest for {name} {_version_dir(version)}: {e}")
+
+    if manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format_version')}")
+    if manifest.get('name') != name or manifest.get('version') != version:
+        raise BundleError(f"Manifest does not match {name} {_version_dir(version)}")
+
+    arrays = {}
+    for array_name, entry in manifest.get('arrays', {}).items():
+        file_path = os.path.join(path, entry['file'])
+        try:
+            if verify_checksums and _sha256(file_path) != entry['sha256']:
+                raise BundleError(f"Checksum mismatch for '{array_name}'")
+            array = np.load(file_path, mmap_mode=mmap_mode, allow_pickle=False)
+        except OSError as e:
+            raise BundleError(f"Cannot read '{array_name}': {e}")
+        if array.dtype.str != entry['dtype'] or list(array.shape) != entry['shape']:
+            raise BundleError(
+                f"Array '{array_name}' is {array.dtype.str}{list(array.shape)}, "
+                f"manifest says {entry['dtype']}{entry['shape']}"
+            )
+        arrays[array_name] = array
+
+    return ModelBundle(name, version, path, manifest, arrays)
+
+
+def hash_arrays(*arrays):
+    """sha256 over the dtype, shape and bytes of the given arrays (e.g. training X and y)"""
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f'{array.dtype.str}{array.shape}'.encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
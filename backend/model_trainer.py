@@ -0,0 +1,320 @@
+"""
+Out-of-band model training.
+
+Fitting the occupancy forest (the initial training and online retrains) runs
+in a single-worker process pool, so it never competes with request handling
+for the GIL or holds the predictor's locks. The training process runs at a
+lower CPU priority with a limited number of cores and CPU seconds, publishes
+a new model bundle, and the serving process then swaps the new model in by
+reference (AdvancedOccupancyPredictor.load_model).
+
+Retrains start only inside the TRAIN_WINDOW off-peak window when one is set;
+requests outside it wait as a pending job. A background thread starts pending
+jobs once the window opens, and picks up bundles published by other worker
+processes.
+"""
+
+import os
+import time
+import logging
+import threading
+import contextlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from model_bundle import MODEL_DIR, current_version
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Run training in a separate process ('false' falls back to a background thread)
+TRAIN_IN_PROCESS = os.getenv('TRAIN_IN_PROCESS', 'true').lower() == 'true'
+# CPU budget for the training process
+TRAIN_CPU_CORES = int(os.getenv('TRAIN_CPU_CORES', '1'))
+TRAIN_NICE = int(os.getenv('TRAIN_NICE', '10'))
+TRAIN_MAX_CPU_SECONDS = int(os.getenv('TRAIN_MAX_CPU_SECONDS', '900'))  # 0 = no limit
+# Off-peak window for retrains, local time "HH:MM-HH:MM" (may wrap midnight); empty = any time
+TRAIN_WINDOW = os.getenv('TRAIN_WINDOW', '')
+# How often pending jobs and newly published bundles are checked
+TRAIN_POLL_SECONDS = float(os.getenv('TRAIN_POLL_SECONDS', '60'))
+
+
+def parse_window(spec):
+    """Parse "HH:MM-HH:MM" into (start, end) minutes since midnight, or None for no window"""
+    if not spec or not spec.strip():
+        return None
+    try:
+        start, end = spec.split('-')
+        start_h, start_m = (int(part) for part in start.strip().split(':'))
+        end_h, end_m = (int(part) for part in end.strip().split(':'))
+        return (start_h * 60 + start_m) % 1440, (end_h * 60 + end_m) % 1440
+    except ValueError:
+        logger.warning(f"Invalid TRAIN_WINDOW '{spec}', training is allowed at any time")
+        return None
+
+
+def in_window(window, now=None):
+    """Check whether now falls inside a (start, end) minutes window (None = always)"""
+    if window is None:
+        return True
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    start, end = window
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+def _init_training_process(nice, max_cpu_seconds):
+    """Process pool initializer: lower priority and cap CPU time of the training process"""
+    try:
+        os.nice(nice)
+    except (AttributeError, OSError):
+        pass
+    if resource is not None and max_cpu_seconds > 0:
+        try:
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            resource.setrlimit(resource.RLIMIT_CPU, (max_cpu_seconds, hard))
+        except (ValueError, OSError):
+            pass
+
+
+@contextlib.contextmanager
+def _publish_lock(bundle_name):
+    """Cross-process lock so concurrent workers do not train the same bundle at once"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    with open(os.path.join(MODEL_DIR, f'.{bundle_name}.train.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def run_training_job(kind, samples, known_version, cpu_cores, bundle_name):
+    """
+    Train and publish a model bundle (runs inside the training process).
+
+    Args:
+        kind (str): 'initial' (train on generated sample data) or 'online'
+        samples (tuple): (X, y) raw feature rows and labels for 'online'; None
+            retrains on the sample store
+        known_version (int): Bundle version the requesting process is serving
+        cpu_cores (int): n_jobs for the forest fit
+        bundle_name (str): Bundle the job publishes
+
+    Returns:
+        dict: kind, published bundle_version, metrics and elapsed seconds
+    """
+    # Imported here: the training process only needs the models, not the web app
+    from ai_models import advanced_occupancy_predictor as predictor, generate_enhanced_training_data
+
+    start = time.time()
+    with _publish_lock(bundle_name):
+        # Start from the newest bundle, which another worker may have just published
+        predictor.load_model()
+        if kind == 'initial' and predictor.is_trained and predictor.bundle_version != known_version:
+            return {'kind': kind, 'bundle_version': predictor.bundle_version, 'skipped': True,
+                    'metrics': predictor.training_metrics, 'seconds': round(time.time() - start, 1)}
+
+        predictor.model.set_params(n_jobs=cpu_cores)
+        if kind == 'initial':
+            predictor.train(generate_enhanced_training_data())
+        elif kind == 'online' and samples is None:
+            # Read the feedback rows straight from the shared, memory-mapped sample store
+            predictor.retrain_from_store()
+        elif kind == 'online':
+            predictor.retrain_on_samples(*samples)
+        else:
+            raise ValueError(f"Unknown training job kind: {kind}")
+
+    return {'kind': kind, 'bundle_version': predictor.bundle_version, 'skipped': False,
+            'metrics': predictor.training_metrics, 'seconds': round(time.time() - start, 1)}
+
+
+class ModelTrainer:
+    """Runs training jobs for a predictor out of band and hot-swaps the results in"""
+
+    def __init__(self, predictor, bundle_name='occupancy', window=TRAIN_WINDOW, use_process=TRAIN_IN_PROCESS):
+        self.predictor = predictor
+        self.bundle_name = bundle_name
+        self.window = parse_window(window)
+        self.use_process = use_process
+        self._executor = None
+        self._future = None
+        self._running = None    # Kind of the job in flight
+        self._pending = None    # (kind, samples) waiting for the window or the running job
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ignored_version = None
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.jobs_deferred = 0
+        self.last_result = None
+        self.last_error = None
+        self.last_started = None
+        self.last_finished = None
+
+    def start(self):
+        """Start the background thread that runs deferred jobs and adopts new bundles"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll_loop, name='model-trainer', daemon=True)
+                self._thread.start()
+
+    def submit(self, kind, samples=None, force=False):
+        """
+        Request a training job.
+
+        Jobs start immediately when nothing is running and the off-peak
+        window is open (or force is set); otherwise the request is kept as
+        the pending job, replacing any earlier pending retrain.
+
+        Returns:
+            bool: True if the job was started now
+        """
+        with self._lock:
+            if self._running is None and (force or in_window(self.window)):
+                self._start_locked(kind, samples)
+                return True
+            # An initial training request is never replaced by a retrain
+            if self._pending is None or self._pending[0] != 'initial':
+                self._pending = (kind, samples)
+            self.jobs_deferred += 1
+            return False
+
+    def wait(self, timeout=None):
+        """Block until the job in flight (if any) has finished and been swapped in"""
+        future = self._future
+        if future is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            future.result(timeout)
+        except Exception:
+            pass
+        # The swap happens in the done callback, after result() returns
+        while self._running is not None:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def status(self):
+        """Snapshot of trainer state for status endpoints"""
+        with self._lock:
+            return {
+                'mode': 'process' if self.use_process else 'thread',
+                'running': self._running,
+                'pending': self._pending[0] if self._pending else None,
+                'window': TRAIN_WINDOW or None,
+                'in_window': in_window(self.window),
+                'jobs_completed': self.jobs_completed,
+                'jobs_failed': self.jobs_failed,
+                'jobs_deferred': self.jobs_deferred,
+                'last_started': self.last_started,
+                'last_finished': self.last_finished,
+                'last_result': self.last_result,
+                'last_error': self.last_error
+            }
+
+    def _get_executor(self):
+        if self._executor is None and self.use_process:
+            try:
+                # spawn: the training process must not inherit the server's threads and locks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_training_process,
+                    initargs=(TRAIN_NICE, TRAIN_MAX_CPU_SECONDS),
+                    max_tasks_per_child=1
+                )
+            except (OSError, ValueError, NotImplementedError) as e:
+                logger.warning(f"Process pool unavailable ({e}), training in a background thread")
+                self.use_process = False
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-training')
+        return self._executor
+
+    def _start_locked(self, kind, samples):
+        self._running = kind
+        self.last_started = datetime.now().isoformat()
+        try:
+            self._future = self._get_executor().submit(
+                run_training_job, kind, samples, self.predictor.bundle_version, TRAIN_CPU_CORES, self.bundle_name
+            )
+        except Exception as e:
+            self._executor = None
+            self._running = None
+            self._record_failure(f"Could not start training: {e}")
+            return
+        logger.info(f"🤖 Started {kind} model training ({'process' if self.use_process else 'thread'})")
+        self._future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        try:
+            result = future.result()
+            version = result.get('bundle_version')
+            if version is not None and version != self.predictor.bundle_version:
+                self.predictor.load_model(version)
+            self.last_result = result
+            self.last_error = None
+            self.jobs_completed += 1
+            logger.info(f"✅ Model training finished: bundle v{version} in {result.get('seconds')}s")
+        except BrokenProcessPool as e:
+            # e.g. the training process hit TRAIN_MAX_CPU_SECONDS; start a fresh pool next time
+            self._executor = None
+            self._record_failure(f"Training process died: {e}")
+        except Exception as e:
+            self._record_failure(str(e))
+        finally:
+            with self._lock:
+                self._running = None
+                self.last_finished = datetime.now().isoformat()
+                pending, self._pending = self._pending, None
+                if pending is not None:
+                    if pending[0] == 'initial' or in_window(self.window):
+                        self._start_locked(*pending)
+                    else:
+                        self._pending = pending
+
+    def _record_failure(self, message):
+        self.jobs_failed += 1
+        self.last_error = message
+        logger.error(f"Model training failed: {message}")
+
+    def refresh(self):
+        """Swap in a bundle published by another process, if there is a newer one"""
+        if self._running is not None:
+            return
+        latest = current_version(self.bundle_name)
+        if latest is None or latest == self.predictor.bundle_version or latest == self._ignored_version:
+            return
+        if not self.predictor.load_model(latest):
+            self._ignored_version = latest
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(TRAIN_POLL_SECONDS)
+            try:
+                self.refresh()
+                with self._lock:
+                    if self._pending is not None and self._running is None and in_window(self.window):
+                        pending, self._pending = self._pending, None
+                        self._start_locked(*pending)
+            except Exception as e:
+                logger.error(f"Error in model trainer loop: {e}")
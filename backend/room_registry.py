@@ -0,0 +1,283 @@
+"""
+Room registry: every room the system controls, loaded once at startup.
+
+Each room has an integer id, a unique name, the home it belongs to and a
+room type. Room types carry the behaviour profiles that used to be
+hardcoded per room name (brightness factor, weather-optimization brightness
+limits, default schedule, synthetic occupancy pattern) and the precomputed
+one-hot vector the occupancy model uses for the room.
+
+Rooms are encoded by type, not by name, so the model's feature schema stays
+the same size however many rooms or homes are registered: a second kitchen
+is encoded exactly like the first.
+
+The layout comes from the JSON file named by ROOMS_CONFIG:
+
+    {"rooms": [{"name": "kitchen", "type": "kitchen", "home": "main"},
+               {"id": 7, "name": "guest_room", "type": "bedroom"}]}
+
+A room without a type must be named after one. Without ROOMS_CONFIG the
+registry holds the default single-home layout, one room per type.
+"""
+
+import os
+import sys
+import json
+import logging
+from types import MappingProxyType
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Path to a JSON room layout; empty = the default five-room home
+ROOMS_CONFIG = os.getenv('ROOMS_CONFIG', '')
+
+DEFAULT_HOME = 'home'
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday')
+
+
+class RoomRegistryError(Exception):
+    """Raised when a room layout is invalid"""
+
+
+class RoomType:
+    """Behaviour profile shared by all rooms of one type"""
+
+    __slots__ = ('name', 'index', 'encoding', 'brightness_factor', 'min_brightness', 'max_brightness',
+                 'schedule', 'schedule_enabled', 'sunrise_sunset', 'weekday_hours', 'weekend_hours')
+
+    def __init__(self, name, index, n_types, brightness_factor=1.0, min_brightness=0, max_brightness=100,
+                 schedule=None, schedule_enabled=False, sunrise_sunset=False,
+                 weekday_hours=(), weekend_hours=None):
+        self.name = sys.intern(name)
+        self.index = index
+        # One-hot model input for every room of this type
+        self.encoding = np.zeros(n_types, dtype=np.float32)
+        self.encoding[index] = 1
+        self.encoding.flags.writeable = False
+        self.brightness_factor = brightness_factor
+        # Limits applied by weather optimization
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        # Default schedule: {'weekday' | 'saturday' | 'sunday': (on time, brightness, off time)}
+        self.schedule = schedule or {}
+        self.schedule_enabled = schedule_enabled
+        self.sunrise_sunset = sunrise_sunset
+        # Hours the room is usually occupied (synthetic training data)
+        self.weekday_hours = frozenset(weekday_hours)
+        self.weekend_hours = self.weekday_hours if weekend_hours is None else frozenset(weekend_hours)
+
+    def default_schedule(self):
+        """Fresh schedule dict in the /api/schedules format"""
+        daily = {}
+        for day in WEEKDAYS + ('saturday', 'sunday'):
+            entry = self.schedule.get('weekday' if day in WEEKDAYS else day)
+            if entry is None:
+                daily[day] = []
+                continue
+            on_time, brightness, off_time = entry
+            daily[day] = [{'time': on_time, 'action': 'on', 'brightness': brightness},
+                          {'time': off_time, 'action': 'off'}]
+        return {
+            'enabled': self.schedule_enabled,
+            'vacation_mode': False,
+            'sunrise_sunset': self.sunrise_sunset,
+            'daily_schedule': daily
+        }
+
+    def is_usually_occupied(self, hour, weekend):
+        return hour in (self.weekend_hours if weekend else self.weekday_hours)
+
+
+def _build_room_types():
+    specs = (
+        # name, profile
+        ('living_room', dict(brightness_factor=0.9,  # Slightly dimmer for comfort
+                             schedule={'weekday': ('07:00', 80, '22:00'), 'saturday': ('08:00', 60, '23:00'),
+                                       'sunday': ('08:00', 60, '22:00')},
+                             schedule_enabled=True, sunrise_sunset=True,
+                             weekday_hours=[9, 10, 11] + list(range(18, 24)),
+                             weekend_hours=range(10, 24))),  # More living room use on weekends
+        ('kitchen', dict(brightness_factor=1.1,  # Brighter for cooking
+                         min_brightness=70,
+                         schedule={'weekday': ('06:30', 100, '23:00'), 'saturday': ('08:00', 80, '00:00'),
+                                   'sunday': ('08:00', 80, '00:00')},
+                         weekday_hours=[6, 7, 8, 9, 12, 13, 18, 19, 20])),
+        ('bedroom', dict(brightness_factor=0.7,  # Dimmer for sleep
+                         max_brightness=80,
+                         schedule={'weekday': ('06:00', 60, '23:30'), 'saturday': ('08:00', 40, '01:00'),
+                                   'sunday': ('08:00', 40, '01:00')},
+                         weekday_hours=list(range(0, 9)) + [22, 23])),
+        ('bathroom', dict(brightness_factor=1.2,  # Brighter for safety
+                          min_brightness=60,
+                          schedule={'weekday': ('06:00', 100, '23:00'), 'saturday': ('08:00', 80, '00:00'),
+                                    'sunday': ('08:00', 80, '00:00')},
+                          weekday_hours=[0, 4, 6, 7, 8, 12, 16, 20, 22, 23])),
+        ('office', dict(brightness_factor=1.0,
+                        schedule={'weekday': ('08:00', 90, '18:00'), 'saturday': ('10:00', 70, '16:00'),
+                                  'sunday': ('10:00', 70, '16:00')},
+                        weekday_hours=range(8, 19),
+                        weekend_hours=())),  # No office use on weekends
+    )
+    return {name: RoomType(name, index, len(specs), **profile) for index, (name, profile) in enumerate(specs)}
+
+# Order defines the model's room columns; append new types only (and bump FEATURE_SCHEMA_VERSION)
+ROOM_TYPES = MappingProxyType(_build_room_types())
+ROOM_TYPE_NAMES = tuple(ROOM_TYPES)
+
+UNKNOWN_ROOM_ENCODING = np.zeros(len(ROOM_TYPES), dtype=np.float32)
+UNKNOWN_ROOM_ENCODING.flags.writeable = False
+
+
+class Room:
+    """One registered room"""
+
+    __slots__ = ('id', 'name', 'home', 'type')
+
+    def __init__(self, room_id, name, home, room_type):
+        self.id = room_id
+        self.name = sys.intern(name)
+        self.home = sys.intern(home)
+        self.type = room_type
+
+    @property
+    def encoding(self):
+        return self.type.encoding
+
+    def __repr__(self):
+        return f"Room(id={self.id}, name={self.name!r}, home={self.home!r}, type={self.type.name!r})"
+
+
+class RoomRegistry:
+    """Immutable set of rooms with O(1) lookup by name or id"""
+
+    def __init__(self, rooms):
+        by_name, by_id = {}, {}
+        for room in rooms:
+            if room.name in by_name:
+                raise RoomRegistryError(f"Duplicate room name '{room.name}'")
+            if room.id in by_id:
+                raise RoomRegistryError(f"Duplicate room id {room.id}")
+            by_name[room.name] = by_id[room.id] = room
+        self._by_name = by_name
+        self._by_id = by_id
+        self._names = tuple(by_name)
+
+    @classmethod
+    def from_layout(cls, entries, home=DEFAULT_HOME):
+        """
+        Build a registry from a list of room dicts (name, optional type, home and id).
+
+        Raises:
+            RoomRegistryError: On unknown types, missing names or duplicates
+        """
+        rooms = []
+        next_id = 1
+        for entry in entries:
+            name = entry.get('name')
+            if not name:
+                raise RoomRegistryError(f"Room entry without a name: {entry}")
+            type_name = entry.get('type', name)
+            room_type = ROOM_TYPES.get(type_name)
+            if room_type is None:
+                raise RoomRegistryError(
+                    f"Room '{name}' has unknown type '{type_name}' (known: {', '.join(ROOM_TYPE_NAMES)})")
+            room_id = int(entry.get('id', next_id))
+            next_id = max(next_id, room_id) + 1
+            rooms.append(Room(room_id, name, entry.get('home', home), room_type))
+        return cls(rooms)
+
+    @classmethod
+    def default(cls):
+        """One room per type in a single home (the original layout)"""
+        return cls.from_layout([{'name': name} for name in ROOM_TYPE_NAMES])
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def names(self):
+        """Room names, in registration order"""
+        return self._names
+
+    def get(self, name):
+        """Room by name, or None"""
+        return self._by_name.get(name)
+
+    def by_id(self, room_id):
+        """Room by integer id, or None"""
+        return self._by_id.get(room_id)
+
+    def room_type(self, name):
+        """Type profile of a room; a room type name also resolves to its own profile"""
+        room = self._by_name.get(name)
+        if room is not None:
+            return room.type
+        return ROOM_TYPES.get(name)
+
+    def encoding(self, name):
+        """Precomputed model encoding of a room (zeros for unknown rooms)"""
+        room_type = self.room_type(name)
+        return UNKNOWN_ROOM_ENCODING if room_type is None else room_type.encoding
+
+    def brightness_factor(self, name):
+        room_type = self.room_type(name)
+        return 1.0 if room_type is None else room_type.brightness_factor
+
+    def clamp_brightness(self, name, brightness):
+        """Apply the room type's min/max brightness limits"""
+        room_type = self.room_type(name)
+        if room_type is None:
+            return brightness
+        return max(room_type.min_brightness, min(room_type.max_brightness, brightness))
+
+    def homes(self):
+        """home -> room names"""
+        homes = {}
+        for room in self._by_name.values():
+            homes.setdefault(room.home, []).append(room.name)
+        return homes
+
+    def types_in_use(self):
+        """Room type profiles with at least one registered room, in schema order"""
+        used = {room.type.name for room in self._by_name.values()}
+        return [room_type for name, room_type in ROOM_TYPES.items() if name in used]
+
+    def default_schedules(self):
+        """room -> default schedule from its type profile"""
+        return {room.name: room.type.default_schedule() for room in self._by_name.values()}
+
+    def to_dict(self):
+        """Layout for status endpoints"""
+        return {
+            'rooms': [{'id': room.id, 'name': room.name, 'home': room.home, 'type': room.type.name}
+                      for room in self._by_name.values()],
+            'types': list(ROOM_TYPE_NAMES),
+            'homes': len(self.homes())
+        }
+
+
+def load_room_registry(path=ROOMS_CONFIG):
+    """Load the registry from a JSON layout file, or the default layout if no path is set"""
+    if not path:
+        return RoomRegistry.default()
+    try:
+        with open(path) as f:
+            layout = json.load(f)
+    except (OSError, ValueError) as e:
+        raise RoomRegistryError(f"Cannot read room layout {path}: {e}")
+    entries = layout.get('rooms', []) if isinstance(layout, dict) else layout
+    registry = RoomRegistry.from_layout(entries)
+    logger.info(f"Loaded {len(registry)} rooms in {len(registry.homes())} homes from {path}")
+    return registry
+
+
+# Loaded once at import; every module reads rooms from here
+room_registry = load_room_registry()
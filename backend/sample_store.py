@@ -0,0 +1,243 @@
+"""
+Persistent ring buffer of labelled feature rows for online learning.
+
+Rows, labels and append times live in preallocated .npy files opened as
+memory maps, so appends are O(1) writes into shared pages and survive
+restarts. A small header array holds the ring position:
+
+    [format, n_features, capacity, schema_version, head, count, total_appended]
+
+head is the next slot to write, count the number of live rows ending just
+before head, and total_appended a monotonic counter callers can use to
+tell how many rows arrived since they last looked. Rows older than
+max_age_seconds are evicted from the tail. training_arrays() returns
+zero-copy views when the live rows are contiguous.
+
+Every gunicorn worker maps the same files; appends are serialized with a
+file lock (where fcntl is available) as well as a thread lock.
+"""
+
+import os
+import time
+import logging
+import threading
+import contextlib
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT_VERSION = 1
+
+# Header slots
+_FORMAT, _N_FEATURES, _CAPACITY, _SCHEMA, _HEAD, _COUNT, _TOTAL = range(7)
+_HEADER_SIZE = 7
+
+
+class SampleStore:
+    """Fixed-capacity, memory-mapped ring buffer of (features, label, timestamp) rows"""
+
+    def __init__(self, directory, n_features, capacity=50000, max_age_seconds=None, schema_version=0):
+        self.directory = directory
+        self.n_features = int(n_features)
+        self.capacity = int(capacity)
+        self.max_age_seconds = max_age_seconds
+        self.schema_version = int(schema_version)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            self._open()
+
+    def _path(self, name):
+        return os.path.join(self.directory, f'{name}.npy')
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Thread lock plus an exclusive file lock shared by all processes using the store"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _open(self):
+        """Map the existing store, migrating or resetting it if its layout does not match"""
+        try:
+            header = np.load(self._path('header'), mmap_mode='r+')
+            features = np.load(self._path('features'), mmap_mode='r+')
+            labels = np.load(self._path('labels'), mmap_mode='r+')
+            timestamps = np.load(self._path('timestamps'), mmap_mode='r+')
+        except (OSError, ValueError):
+            self._create()
+            return
+
+        layout_ok = (
+            header.shape == (_HEADER_SIZE,) and header[_FORMAT] == STORE_FORMAT_VERSION and
+            features.shape == (header[_CAPACITY], header[_N_FEATURES]) and
+            labels.shape == timestamps.shape == (header[_CAPACITY],)
+        )
+        if not layout_ok or header[_N_FEATURES] != self.n_features or header[_SCHEMA] != self.schema_version:
+            logger.warning("Sample store layout or feature schema changed, starting an empty store")
+            self._create()
+            return
+
+        self._header, self._features, self._labels, self._timestamps = header, features, labels, timestamps
+        if header[_CAPACITY] != self.capacity:
+            # Keep the newest rows that fit in the new capacity
+            rows, row_labels, row_times = (np.array(part) for part in self._ordered())
+            total = int(header[_TOTAL])
+            keep = min(len(rows), self.capacity)
+            self._create()
+            self._write(rows[len(rows) - keep:], row_labels[len(rows) - keep:], row_times[len(rows) - keep:])
+            self._header[_TOTAL] = total
+            logger.info(f"Sample store resized to {self.capacity} rows, kept {keep}")
+
+    def _create(self):
+        header = open_memmap(self._path('header'), mode='w+', dtype=np.int64, shape=(_HEADER_SIZE,))
+        header[:] = (STORE_FORMAT_VERSION, self.n_features, self.capacity, self.schema_version, 0, 0, 0)
+        self._header = header
+        self._features = open_memmap(self._path('features'), mode='w+', dtype=np.float32,
+                                     shape=(self.capacity, self.n_features))
+        self._labels = open_memmap(self._path('labels'), mode='w+', dtype=np.int8, shape=(self.capacity,))
+        self._timestamps = open_memmap(self._path('timestamps'), mode='w+', dtype=np.float64,
+                                       shape=(self.capacity,))
+
+    def _write(self, rows, labels, timestamps):
+        """Append rows at head, wrapping around (caller holds the lock)"""
+        header = self._header
+        head, count = int(header[_HEAD]), int(header[_COUNT])
+        n = len(rows)
+        if n > self.capacity:
+            rows, labels, timestamps = rows[-self.capacity:], labels[-self.capacity:], timestamps[-self.capacity:]
+            n = self.capacity
+        first = min(n, self.capacity - head)
+        self._features[head:head + first] = rows[:first]
+        self._labels[head:head + first] = labels[:first]
+        self._timestamps[head:head + first] = timestamps[:first]
+        if first < n:
+            self._features[:n - first] = rows[first:]
+            self._labels[:n - first] = labels[first:]
+            self._timestamps[:n - first] = timestamps[first:]
+        # Rows are written before the header moves, so readers never see unwritten slots
+        header[_COUNT] = min(count + n, self.capacity)
+        header[_HEAD] = (head + n) % self.capacity
+        header[_TOTAL] += n
+
+    def append(self, features, label, timestamp=None):
+        """Append one labelled feature row (O(1)); the oldest row is overwritten when full"""
+        row = np.asarray(features, dtype=np.float32).reshape(1, self.n_features)
+        with self._locked():
+            self._write(row, np.array([label], dtype=np.int8),
+                        np.array([time.time() if timestamp is None else timestamp]))
+
+    def append_many(self, features, labels, timestamps=None):
+        """Append a block of labelled rows"""
+        rows = np.asarray(features, dtype=np.float32).reshape(-1, self.n_features)
+        labels = np.asarray(labels, dtype=np.int8).reshape(-1)
+        if timestamps is None:
+            timestamps = np.full(len(rows), time.time())
+        with self._locked():
+            self._write(rows, labels, np.asarray(timestamps, dtype=np.float64))
+
+    def evict_expired(self, now=None):
+        """Drop rows older than max_age_seconds from the tail; returns the number evicted"""
+        if not self.max_age_seconds:
+            return 0
+        cutoff = (time.time() if now is None else now) - self.max_age_seconds
+        with self._locked():
+            timestamps, = self._ordered(self._timestamps)
+            # Rows are in append order, so expired rows form a prefix
+            expired = int(np.searchsorted(timestamps, cutoff, side='left'))
+            if expired:
+                self._header[_COUNT] -= expired
+            return expired
+
+    def _segments(self):
+        """Index ranges of the live rows, oldest first (one range, or two if they wrap)"""
+        # Stored capacity, which differs from self.capacity while a resize is migrating rows
+        capacity = int(self._header[_CAPACITY])
+        head, count = int(self._header[_HEAD]), int(self._header[_COUNT])
+        start = head - count
+        if start >= 0:
+            return [(start, head)]
+        if head == 0:
+            return [(start + capacity, capacity)]
+        return [(start + capacity, capacity), (0, head)]
+
+    def _ordered(self, *arrays):
+        """Live rows of the given arrays (default: features, labels, timestamps), oldest first"""
+        arrays = arrays or (self._features, self._labels, self._timestamps)
+        segments = self._segments()
+        if len(segments) == 1:
+            start, stop = segments[0]
+            return tuple(array[start:stop] for array in arrays)
+        return tuple(
+            np.concatenate([array[start:stop] for start, stop in segments])
+            for array in arrays
+        )
+
+    def training_arrays(self):
+        """
+        Live rows as (X, y) for fitting.
+
+        Returns zero-copy read-only views into the mapped files when the
+        live rows are contiguous or the ring is full (then in slot order,
+        since row order does not matter for fitting). Only a wrapped,
+        partially evicted ring is concatenated into a copy. Views of a full
+        ring can see their oldest rows overwritten by later appends.
+        """
+        with self._locked():
+            if len(self) == self.capacity:
+                features, labels = self._features, self._labels
+            else:
+                features, labels = self._ordered(self._features, self._labels)
+        features = features.view()
+        labels = labels.view()
+        features.flags.writeable = False
+        labels.flags.writeable = False
+        return features, labels
+
+    @property
+    def total_appended(self):
+        """Number of rows ever appended (survives restarts)"""
+        return int(self._header[_TOTAL])
+
+    def __len__(self):
+        return int(self._header[_COUNT])
+
+    def flush(self):
+        """Write dirty pages of the mapped files back to disk"""
+        with self._locked():
+            for array in (self._features, self._labels, self._timestamps, self._header):
+                array.flush()
+
+    def clear(self):
+        with self._locked():
+            self._header[_HEAD] = 0
+            self._header[_COUNT] = 0
+
+    def stats(self):
+        """Size and capacity counters for status endpoints"""
+        count = len(self)
+        oldest = None
+        if count:
+            start, _ = self._segments()[0]
+            oldest = float(self._timestamps[start])
+        return {
+            'samples': count,
+            'capacity': self.capacity,
+            'total_appended': self.total_appended,
+            'max_age_seconds': self.max_age_seconds,
+            'oldest_age_seconds': round(time.time() - oldest) if oldest else None
+        }
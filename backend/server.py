@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""
+Entry point for the development / single-process server.
+
+Run from the backend directory: python3 server.py
+
+Training jobs run in spawned processes (see model_trainer.py), and a
+spawned process re-imports the __main__ module. Starting the server from
+this file, with app imported only under the main guard, keeps that
+re-import empty: the training process imports model_trainer and ai_models,
+not app.py's stores, database connections and SocketIO setup.
+"""
+
+if __name__ == '__main__':
+    import app
+
+    app.main()
@@ -19,5 +19,5 @@ fi
 
 # Start the Flask app
 echo "🔧 Starting Flask app..."
-python3 app.py
+python3 server.py
 
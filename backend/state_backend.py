@@ -0,0 +1,463 @@
+"""
+Shared state backends for running several gunicorn workers.
+
+Each worker keeps its own in-memory state (light store, schedules, settings)
+for fast reads and mirrors every write through a StateBackend:
+
+- LocalStateBackend: nothing is shared (single worker, the default when
+  WORKERS is 1).
+- SQLiteStateBackend: a WAL-mode SQLite file every worker on the host
+  opens. A write updates the `state` row of its key and appends to the
+  `changes` table in one transaction; the AUTOINCREMENT rowid of the change
+  is a global sequence number. A watcher thread in every worker checks
+  PRAGMA data_version (a cheap read that changes when another connection
+  commits) and hands new changes from other workers to subscribers in
+  sequence order. publish_async() hands writes to a publisher thread that
+  commits them in the order they were queued, several per transaction, so
+  hot paths (light control) never wait on the cross-process write lock.
+
+Background loops that must run once per deployment (schedules, AI control)
+ask is_leader(): one worker holds an exclusive file lock and is the leader;
+if it dies the lock is released and another worker takes over on its next
+check.
+"""
+
+import os
+import json
+import uuid
+import collections
+import atexit
+import sqlite3
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_INSTANCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+# 'local' or 'sqlite'; default: sqlite when gunicorn runs more than one worker
+STATE_BACKEND = os.getenv('STATE_BACKEND', '') or ('sqlite' if int(os.getenv('WORKERS', '1')) > 1 else 'local')
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', os.path.join(_INSTANCE_DIR, 'shared_state.db'))
+# How often workers look for changes made by other workers
+STATE_POLL_SECONDS = float(os.getenv('STATE_POLL_SECONDS', '0.25'))
+# Rows kept in the changes table (older ones are pruned; lagging workers resync from `state`)
+STATE_CHANGES_RETAIN = int(os.getenv('STATE_CHANGES_RETAIN', '10000'))
+
+
+class LeaderLock:
+    """Exclusive, non-blocking file lock held for the life of the process"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Try to become the leader; returns True while this process holds the lock"""
+        if self._file is not None:
+            return True
+        if fcntl is None:
+            return True
+        with self._lock:
+            if self._file is not None:
+                return True
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            lock_file = open(self.path, 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            lock_file.write(str(os.getpid()))
+            lock_file.flush()
+            self._file = lock_file
+            logger.info(f"👑 Worker {os.getpid()} is the background loop leader")
+            return True
+
+    @property
+    def held(self):
+        return self._file is not None or fcntl is None
+
+    def release(self):
+        with self._lock:
+            if self._file is not None:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+                self._file.close()
+                self._file = None
+
+
+class LocalStateBackend:
+    """Process-local backend: nothing is shared, this process is always the leader"""
+
+    name = 'local'
+
+    def __init__(self):
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def load(self, namespace):
+        return {}
+
+    def publish(self, namespace, items):
+        with self._lock:
+            seqs = {}
+            for key in items:
+                self._seq += 1
+                seqs[key] = self._seq
+            return seqs
+
+    def publish_async(self, namespace, items, callback=None):
+        seqs = self.publish(namespace, items)
+        if callback is not None:
+            callback(seqs)
+
+    def subscribe(self, namespace, callback):
+        pass
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+    def is_leader(self):
+        return True
+
+    def stats(self):
+        return {'backend': self.name, 'leader': True, 'seq': self._seq}
+
+
+class SQLiteStateBackend:
+    """State shared by all workers on a host through a WAL-mode SQLite database"""
+
+    name = 'sqlite'
+
+    def __init__(self, path=STATE_DB_PATH, poll_seconds=STATE_POLL_SECONDS, retain=STATE_CHANGES_RETAIN):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.retain = retain
+        # Identifies this process's own changes so the watcher can skip them
+        self.origin = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._local = threading.local()
+        self._subscribers = {}
+        self._thread = None
+        self._publisher = None
+        self._outbox = collections.deque()
+        self._queued = threading.Event()
+        self._publish_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._leader = LeaderLock(path + '.leader')
+        self.last_seq = 0
+        self.changes_applied = 0
+        self.resyncs = 0
+        self.async_published = 0
+        self.publish_errors = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS state
+                            (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+                             seq INTEGER NOT NULL, PRIMARY KEY (namespace, key)) WITHOUT ROWID''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS changes
+                            (seq INTEGER PRIMARY KEY AUTOINCREMENT, namespace TEXT NOT NULL,
+                             key TEXT NOT NULL, value TEXT NOT NULL, origin TEXT NOT NULL)''')
+            self.last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+
+    def _connection(self):
+        """One connection per thread (sqlite3 connections are not shared across threads)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    def load(self, namespace):
+        """Current {key: (value, seq)} of a namespace"""
+        with self._connection() as conn:
+            rows = conn.execute('SELECT key, value, seq FROM state WHERE namespace = ?', (namespace,)).fetchall()
+        return {key: (json.loads(value), seq) for key, value, seq in rows}
+
+    def publish(self, namespace, items):
+        """
+        Write {key: value} (JSON-serializable values) as changes from this process.
+
+        Returns:
+            dict: key -> sequence number assigned to its change
+        """
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            return self._write(conn, namespace, items)
+
+    def _write(self, conn, namespace, items):
+        seqs = {}
+        for key, value in items.items():
+            payload = json.dumps(value, sort_keys=True)
+            seq = conn.execute('INSERT INTO changes (namespace, key, value, origin) VALUES (?, ?, ?, ?)',
+                               (namespace, key, payload, self.origin)).lastrowid
+            conn.execute('''INSERT INTO state (namespace, key, value, seq) VALUES (?, ?, ?, ?)
+                            ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, seq = excluded.seq''',
+                         (namespace, key, payload, seq))
+            seqs[key] = seq
+        return seqs
+
+    def publish_async(self, namespace, items, callback=None):
+        """
+        Queue a publish() for the publisher thread; writes are committed in the order queued.
+
+        callback(seqs) runs on the publisher thread after the commit (seqs is {} if it failed).
+        """
+        self._outbox.append((namespace, dict(items), callback))
+        self._queued.set()
+
+    def flush(self):
+        """Commit every queued publish in one transaction; returns how many were written"""
+        with self._publish_lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._outbox.popleft())
+                except IndexError:
+                    break
+            if not batch:
+                return 0
+            results = []
+            try:
+                with self._connection() as conn:
+                    conn.execute('BEGIN IMMEDIATE')
+                    for namespace, items, _ in batch:
+                        results.append(self._write(conn, namespace, items))
+            except Exception as e:
+                self.publish_errors += 1
+                results = [{}] * len(batch)
+                logger.error(f"Could not share state with other workers: {e}")
+            else:
+                self.async_published += len(batch)
+            # Still under the lock, so callbacks see seqs in commit order
+            for (_, _, callback), seqs in zip(batch, results):
+                if callback is not None:
+                    try:
+                        callback(seqs)
+                    except Exception as e:
+                        logger.error(f"Error in shared state publish callback: {e}")
+        return len(batch)
+
+    def _publish_loop(self):
+        while True:
+            # Commit everything queued since the last wake in one transaction
+            self._queued.wait()
+            self._queued.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in shared state publisher: {e}")
+
+    def subscribe(self, namespace, callback):
+        """Call callback(key, value, seq) for every change another process makes in namespace"""
+        self._subscribers.setdefault(namespace, []).append(callback)
+
+    def start(self):
+        """Start the watcher and publisher threads (queued publishes are also written at exit)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch_loop, name='state-watcher', daemon=True)
+            self._thread.start()
+            self._publisher = threading.Thread(target=self._publish_loop, name='state-publisher', daemon=True)
+            self._publisher.start()
+            atexit.register(self.flush)
+
+    def close(self):
+        self._stopped.set()
+        self._leader.release()
+
+    def is_leader(self):
+        return self._leader.acquire()
+
+    def _dispatch(self, namespace, key, value, seq):
+        for callback in self._subscribers.get(namespace, ()):
+            try:
+                callback(key, value, seq)
+            except Exception as e:
+                logger.error(f"Error applying shared state change {namespace}/{key}: {e}")
+
+    def poll(self):
+        """Deliver changes made by other processes since the last poll; returns how many"""
+        with self._connection() as conn:
+            oldest = conn.execute('SELECT MIN(seq) FROM changes').fetchone()[0]
+            if oldest is not None and oldest > self.last_seq + 1 and self.last_seq > 0:
+                return self._resync(conn)
+            rows = conn.execute('SELECT seq, namespace, key, value, origin FROM changes WHERE seq > ? ORDER BY seq',
+                                (self.last_seq,)).fetchall()
+        delivered = 0
+        for seq, namespace, key, value, origin in rows:
+            self.last_seq = seq
+            if origin != self.origin and namespace in self._subscribers:
+                self._dispatch(namespace, key, json.loads(value), seq)
+                delivered += 1
+        self.changes_applied += delivered
+        return delivered
+
+    def _resync(self, conn):
+        """Changes we had not seen were pruned; reload every subscribed namespace from `state`"""
+        self.resyncs += 1
+        logger.warning("Shared state watcher fell behind the change log, resyncing")
+        self.last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+        delivered = 0
+        for namespace in list(self._subscribers):
+            for key, (value, seq) in self.load(namespace).items():
+                self._dispatch(namespace, key, value, seq)
+                delivered += 1
+        return delivered
+
+    def _prune(self):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?', (self.retain,))
+
+    def _watch_loop(self):
+        data_version = None
+        polls = 0
+        while not self._stopped.wait(self.poll_seconds):
+            try:
+                with self._connection() as conn:
+                    version = conn.execute('PRAGMA data_version').fetchone()[0]
+                if version != data_version:
+                    data_version = version
+                    self.poll()
+                polls += 1
+                # The leader trims the change log now and then
+                if polls % 1000 == 0 and self.is_leader():
+                    self._prune()
+            except Exception as e:
+                logger.error(f"Error in shared state watcher: {e}")
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'path': self.path,
+            'leader': self._leader.held,
+            'seq': self.last_seq,
+            'changes_applied': self.changes_applied,
+            'resyncs': self.resyncs,
+            'publish_queue': len(self._outbox),
+            'async_published': self.async_published,
+            'publish_errors': self.publish_errors
+        }
+
+
+class _Transaction:
+    """Context manager around an autocommit connection that commits/rolls back an explicit BEGIN"""
+
+    __slots__ = ('conn',)
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.conn.in_transaction:
+            if exc_type is None:
+                self.conn.execute('COMMIT')
+            else:
+                self.conn.execute('ROLLBACK')
+        return False
+
+
+def create_state_backend(kind=STATE_BACKEND):
+    """Build the configured backend (falls back to local if the shared one cannot be opened)"""
+    if kind == 'sqlite':
+        try:
+            return SQLiteStateBackend()
+        except sqlite3.Error as e:
+            logger.error(f"Cannot open shared state database {STATE_DB_PATH}: {e}; state will not be shared")
+    elif kind != 'local':
+        logger.warning(f"Unknown STATE_BACKEND '{kind}', using local state")
+    return LocalStateBackend()
+
+
+class SharedMap:
+    """
+    Process-local dict of JSON values mirrored through a state backend namespace.
+
+    Reads are plain dict reads. set() replaces a value and publishes it;
+    after mutating a value in place call publish(key). Changes from other
+    workers replace local values unless a newer local write exists.
+    on_change(key, value) is called for those remote changes; listeners
+    added with add_listener() see local and remote changes alike.
+    """
+
+    def __init__(self, backend, namespace, initial=None, on_change=None):
+        self.backend = backend
+        self.namespace = namespace
+        self.on_change = on_change
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._data = dict(initial or {})
+        self._seqs = {}
+        for key, (value, seq) in backend.load(namespace).items():
+            self._data[key] = value
+            self._seqs[key] = seq
+        backend.subscribe(namespace, self._apply_remote)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def items(self):
+        """(key, value) pairs; a list, so other workers' changes can't break iteration"""
+        return list(self._data.items())
+
+    def as_dict(self):
+        return self._data
+
+    def add_listener(self, listener):
+        """Call listener(key, value) after every local or remote change (under the map's lock)"""
+        self._listeners.append(listener)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._publish_locked(key)
+
+    def publish(self, key):
+        """Publish the current value of key (after an in-place change)"""
+        with self._lock:
+            self._publish_locked(key)
+
+    def _publish_locked(self, key):
+        try:
+            self._seqs.update(self.backend.publish(self.namespace, {key: self._data[key]}))
+        except Exception as e:
+            logger.error(f"Could not share {self.namespace}/{key} with other workers: {e}")
+        self._notify(key)
+
+    def _notify(self, key):
+        for listener in self._listeners:
+            listener(key, self._data[key])
+
+    def _apply_remote(self, key, value, seq):
+        with self._lock:
+            if seq <= self._seqs.get(key, 0):
+                return
+            self._data[key] = value
+            self._seqs[key] = seq
+            self._notify(key)
+        if self.on_change is not None:
+            self.on_change(key, value)
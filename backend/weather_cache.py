@@ -0,0 +1,315 @@
+"""
+Single-flight, stale-while-revalidate cache for the current weather.
+
+Readers never call the weather API themselves:
+
+- age < WEATHER_REFRESH_AHEAD * TTL: the cached value is returned
+- after that the cached value is still returned, and one background
+  refresh is started (refresh-ahead, so the value is normally renewed
+  before it expires)
+- past the TTL the stale value keeps being served (and counted) until a
+  refresh succeeds; the API is slow or down exactly when this matters
+- only before the first successful fetch does a caller wait, for at most
+  WEATHER_COLD_WAIT seconds on the single in-flight fetch, then it gets
+  the fallback value
+
+At most one refresh runs at a time, and after a failure the next attempt
+waits WEATHER_RETRY_SECONDS.
+
+With a shared store (see weather_store.py) the cache is also shared by all
+workers and survives restarts: the stored value is loaded at startup, a
+refresh first adopts a newer value another worker stored, and only the
+worker holding the store's fetch lease calls the API. Upstream calls then
+happen about once per TTL, however many workers run.
+
+With parse, each new value is also parsed once into a typed view
+(e.g. WeatherSnapshot) that current_parsed() returns with the payload.
+
+stats() reports hits, stale serves, refresh latency and failures.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Seconds a fetched value is fresh
+WEATHER_CACHE_TTL = float(os.getenv('WEATHER_CACHE_TTL', '300'))
+# Fraction of the TTL after which a background refresh starts
+WEATHER_REFRESH_AHEAD = float(os.getenv('WEATHER_REFRESH_AHEAD', '0.8'))
+# Seconds between attempts while the API is failing
+WEATHER_RETRY_SECONDS = float(os.getenv('WEATHER_RETRY_SECONDS', '30'))
+# Seconds a caller waits for the first fetch before getting the fallback
+WEATHER_COLD_WAIT = float(os.getenv('WEATHER_COLD_WAIT', '5'))
+# Stored values older than this are not loaded at startup
+WEATHER_STORE_MAX_AGE = float(os.getenv('WEATHER_STORE_MAX_AGE', '21600'))
+
+# Longest a fetch may hold the cross-worker lease (timeouts plus retries)
+FETCH_LEASE_SECONDS = 90.0
+# Seconds before checking again for the value another worker is fetching
+LEASE_BUSY_RETRY_SECONDS = 1.0
+
+LIVE = 'live'
+STALE = 'stale'
+DEMO = 'demo'
+
+
+class WeatherCache:
+    """Current weather with single-flight refresh and stale-while-revalidate"""
+
+    def __init__(self, fetch, fallback, ttl=WEATHER_CACHE_TTL, refresh_ahead=WEATHER_REFRESH_AHEAD,
+                 retry_seconds=WEATHER_RETRY_SECONDS, cold_wait=WEATHER_COLD_WAIT, on_refresh=None,
+                 store=None, key='current', source=LIVE, parse=None):
+        """
+        Args:
+            fetch: fetch() -> weather payload; raises on failure
+            fallback: fallback() -> payload served while nothing was ever fetched
+            on_refresh: Optional on_refresh(success) called after every fetch attempt
+            store (SQLiteWeatherStore): Optional tier shared with other workers and restarts
+            key (str): Row of this cache in the store
+            source (str): Source of fetched payloads ('live', 'demo' or 'replay'; see weather_providers)
+            parse: Optional parse(payload, version) -> typed view, run once per new value
+        """
+        self.fetch = fetch
+        self.fallback = fallback
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.retry_seconds = retry_seconds
+        self.cold_wait = cold_wait
+        self.on_refresh = on_refresh
+        self.store = store
+        self.key = key
+        self.fetch_source = source
+        self.parse = parse
+        self._lock = threading.Lock()
+        self._data = None
+        self._source = None
+        self.fetched_at = None  # Epoch seconds of the current value's fetch (any worker)
+        self.version = 0  # Incremented whenever the value changes; keys the AI prediction caches
+        self._parsed = None  # (version, parse() result) of the current value
+        self._in_flight = None  # threading.Event set when the running refresh ends
+        self._not_before = None  # time.monotonic() before which no refresh starts
+        self.last_error = None
+        # Metrics
+        self.hits = 0
+        self.stale_serves = 0
+        self.fallback_serves = 0
+        self.cold_waits = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.shared_loads = 0
+        self.lease_busy = 0
+        self.last_refresh_ms = None
+        self._latencies = deque(maxlen=100)
+        if store is not None:
+            self._load_shared(max_age=WEATHER_STORE_MAX_AGE)
+
+    # Reads
+
+    def age(self):
+        """Seconds since the current value was fetched (None if never)"""
+        if self.fetched_at is None:
+            return None
+        return max(0.0, time.time() - self.fetched_at)
+
+    @property
+    def source(self):
+        """'stale' (expired), 'demo', or the source it was fetched from ('live', 'replay')"""
+        if self._data is None or self._source == DEMO:
+            return DEMO
+        return STALE if time.time() >= self.expires_at(self.fetched_at) else self._source
+
+    def get(self):
+        """Current weather payload (never blocks on the API once a value exists)"""
+        return self.current()[0]
+
+    def current(self):
+        """(payload, version) read together"""
+        data, version, fetched_at = self._data, self.version, self.fetched_at
+        if data is not None:
+            now = time.time()
+            if now >= self.expires_at(fetched_at):
+                self.stale_serves += 1
+                self._start_refresh()
+            else:
+                self.hits += 1
+                if now >= self.refresh_at(fetched_at):
+                    self._start_refresh()
+            return data, version
+
+        # Nothing fetched yet: wait briefly for the single in-flight fetch
+        done = self._start_refresh()
+        if done is not None:
+            self.cold_waits += 1
+            done.wait(self.cold_wait)
+            if self._data is not None:
+                return self._data, self.version
+        self.fallback_serves += 1
+        return self.fallback(), self.version
+
+    def current_parsed(self):
+        """(payload, parsed view) read together; requires parse"""
+        data, version = self.current()
+        parsed = self._parsed
+        if parsed is not None and parsed[0] == version:
+            return data, parsed[1]
+        # Fallback payload (nothing fetched yet), or a refresh landed in between
+        return data, self.parse(data, version)
+
+    # Freshness (override to align expiry with the data, e.g. forecast periods)
+
+    def expires_at(self, fetched_at):
+        """Epoch seconds after which a value fetched at fetched_at is stale"""
+        return fetched_at + self.ttl
+
+    def refresh_at(self, fetched_at):
+        """Epoch seconds after which a value fetched at fetched_at is refreshed in the background"""
+        return fetched_at + self.ttl * self.refresh_ahead
+
+    # Shared store encoding (override when the cached value is not plain JSON)
+
+    def encode(self, data):
+        return data
+
+    def decode(self, payload):
+        return payload
+
+    # Refresh
+
+    def _set(self, data, fetched_at, source):
+        with self._lock:
+            self._data = data
+            self._source = source
+            self.fetched_at = fetched_at
+            self.version += 1
+            self._parsed = None if self.parse is None else (self.version, self.parse(data, self.version))
+
+    def _load_shared(self, max_age=None):
+        """Adopt the stored value if it is newer than ours; returns True if adopted"""
+        try:
+            entry = self.store.load(self.key)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read shared weather cache: {e}")
+            return False
+        if entry is None or (self.fetched_at is not None and entry.fetched_at <= self.fetched_at):
+            return False
+        if entry.source != self.fetch_source:
+            # Stored by a run with another provider (e.g. replayed or demo data)
+            return False
+        if max_age is not None and time.time() - entry.fetched_at > max_age:
+            return False
+        try:
+            data = self.decode(entry.payload)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"⚠️ Ignoring unreadable shared {self.key} weather: {e}")
+            return False
+        self._set(data, entry.fetched_at, entry.source)
+        self.shared_loads += 1
+        logger.info(f"📦 Loaded {entry.source} weather from shared cache ({self.age():.0f}s old)")
+        return True
+
+    def _start_refresh(self):
+        """Start a background refresh unless one is running or backing off; returns its Event"""
+        with self._lock:
+            if self._in_flight is not None:
+                return self._in_flight
+            if self._not_before is not None and time.monotonic() < self._not_before:
+                return None
+            done = self._in_flight = threading.Event()
+        threading.Thread(target=self._refresh, args=(done,), name='weather-refresh', daemon=True).start()
+        return done
+
+    def _refresh(self, done):
+        start = time.monotonic()
+        try:
+            if self.store is not None:
+                # Another worker may have refreshed already, or be fetching right now
+                if self._load_shared() and time.time() < self.refresh_at(self.fetched_at):
+                    return
+                try:
+                    leased = self.store.try_lease(self.key, FETCH_LEASE_SECONDS, time.time())
+                except Exception as e:
+                    logger.warning(f"⚠️ Shared weather cache unavailable, fetching locally: {e}")
+                    leased = None
+                if leased is False:
+                    self.lease_busy += 1
+                    if self._data is None:
+                        # Cold start: pick up the other worker's fetch as soon as it is stored
+                        deadline = time.monotonic() + self.cold_wait
+                        while time.monotonic() < deadline and not self._load_shared():
+                            time.sleep(0.1)
+                    self._not_before = time.monotonic() + LEASE_BUSY_RETRY_SECONDS
+                    return
+            self._fetch(start)
+        finally:
+            with self._lock:
+                self._in_flight = None
+            done.set()
+
+    def _fetch(self, start):
+        success = False
+        try:
+            data = self.fetch()
+            fetched_at = time.time()
+            self._set(data, fetched_at, self.fetch_source)
+            self._not_before = None
+            self.refreshes += 1
+            success = True
+            if self.store is not None:
+                try:
+                    self.store.save(self.key, self.encode(data), fetched_at, self.fetch_source)
+                except Exception as e:
+                    logger.warning(f"⚠️ Could not write shared weather cache: {e}")
+        except Exception as e:
+            self._not_before = time.monotonic() + self.retry_seconds
+            self.failures += 1
+            self.last_error = str(e)[:200]
+            logger.warning(f"⚠️ Weather refresh failed after {time.monotonic() - start:.2f}s: {e}")
+            if self.store is not None:
+                try:
+                    # Every worker waits out the retry interval, not just this one
+                    self.store.release(self.key, hold_until=time.time() + self.retry_seconds)
+                except Exception as release_error:
+                    logger.debug(f"Could not release weather fetch lease: {release_error}")
+        self.last_refresh_ms = round((time.monotonic() - start) * 1000, 1)
+        self._latencies.append(self.last_refresh_ms)
+        if self.on_refresh is not None:
+            self.on_refresh(success)
+
+    def refresh(self, wait=True):
+        """Trigger a refresh now (e.g. at startup); optionally wait for it"""
+        self._not_before = None
+        done = self._start_refresh()
+        if wait and done is not None:
+            done.wait()
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        age = self.age()
+        return {
+            'version': self.version,
+            'source': self.source,
+            'fetched_at': self.fetched_at,
+            'age_seconds': None if age is None else round(age, 1),
+            'ttl_seconds': self.ttl,
+            'expires_at': None if self.fetched_at is None else self.expires_at(self.fetched_at),
+            'refreshing': self._in_flight is not None,
+            'shared': self.store is not None,
+            'hits': self.hits,
+            'stale_serves': self.stale_serves,
+            'fallback_serves': self.fallback_serves,
+            'cold_waits': self.cold_waits,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'shared_loads': self.shared_loads,
+            'lease_busy': self.lease_busy,
+            'last_error': self.last_error,
+            'refresh_ms': {
+                'last': self.last_refresh_ms,
+                'avg': round(sum(latencies) / len(latencies), 1) if latencies else None,
+                'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None
+            }
+        }
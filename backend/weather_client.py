@@ -0,0 +1,119 @@
+"""
+Outbound weather API calls with a per-call deadline and a circuit breaker.
+
+Every get() finishes within WEATHER_CALL_BUDGET seconds, retries included:
+each attempt's timeouts are cut to what is left of the budget, and retries
+(connection errors, timeouts, 429/5xx) stop when it runs out or after
+WEATHER_MAX_ATTEMPTS. DNS failures are not retried; they need the network
+fixed, not another try.
+
+Calls go through a CircuitBreaker (see circuit_breaker.py). After
+WEATHER_BREAKER_FAILURES failed calls in a row, get() raises
+CircuitOpenError immediately for WEATHER_BREAKER_RESET_SECONDS. The weather
+caches then keep serving their cached or demo data at once, and the API is
+probed again with a single trial call.
+"""
+
+import os
+import time
+import logging
+
+import requests
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Seconds one call may take, all attempts included
+WEATHER_CALL_BUDGET = float(os.getenv('WEATHER_CALL_BUDGET', '10'))
+# Attempts per call (first try plus retries)
+WEATHER_MAX_ATTEMPTS = int(os.getenv('WEATHER_MAX_ATTEMPTS', '3'))
+# Consecutive failed calls that open the circuit
+WEATHER_BREAKER_FAILURES = int(os.getenv('WEATHER_BREAKER_FAILURES', '3'))
+# Seconds the circuit stays open before a trial call
+WEATHER_BREAKER_RESET_SECONDS = float(os.getenv('WEATHER_BREAKER_RESET_SECONDS', '60'))
+
+CONNECT_TIMEOUT = 5.0
+RETRY_BACKOFF = 0.5  # Seconds before the first retry, doubled for each further one
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def _is_dns_error(error):
+    message = str(error)
+    return 'NameResolutionError' in message or 'Failed to resolve' in message
+
+
+class WeatherClient:
+    """requests session wrapper enforcing a deadline budget behind a circuit breaker"""
+
+    def __init__(self, session, budget=WEATHER_CALL_BUDGET, max_attempts=WEATHER_MAX_ATTEMPTS, breaker=None):
+        self.session = session
+        self.budget = budget
+        self.max_attempts = max(1, max_attempts)
+        self.breaker = breaker or CircuitBreaker('Weather API', WEATHER_BREAKER_FAILURES,
+                                                 WEATHER_BREAKER_RESET_SECONDS)
+        self.calls = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.last_call_ms = None
+
+    def get(self, url, params):
+        """
+        GET url within the budget.
+
+        Returns:
+            requests.Response: The last response (any status; 429/5xx count as failures)
+
+        Raises:
+            CircuitOpenError: Without a request, while the circuit is open
+            requests.exceptions.RequestException: Connection errors and timeouts
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Weather API circuit is open (retry in {self.breaker.retry_in():.0f}s)")
+        self.calls += 1
+        start = time.monotonic()
+        try:
+            response = self._get_within(url, params, start + self.budget)
+        except Exception as e:
+            self.breaker.record_failure(e)
+            raise
+        finally:
+            self.last_call_ms = round((time.monotonic() - start) * 1000, 1)
+        if response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            # Any other answer means the API is reachable (401/404 are configuration problems)
+            self.breaker.record_success()
+        return response
+
+    def _get_within(self, url, params, deadline):
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.budget_exhausted += 1
+                raise requests.exceptions.Timeout(f"Weather call budget of {self.budget:g}s used up")
+            try:
+                response = self.session.get(url, params=params, timeout=(min(CONNECT_TIMEOUT, remaining), remaining))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if _is_dns_error(e) or attempt >= self.max_attempts:
+                    raise
+                logger.debug(f"Weather API attempt {attempt} failed: {e}")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_attempts:
+                    return response
+                logger.debug(f"Weather API attempt {attempt} got HTTP {response.status_code}")
+            self.retries += 1
+            time.sleep(max(0.0, min(RETRY_BACKOFF * 2 ** (attempt - 1), deadline - time.monotonic())))
+
+    def stats(self):
+        return {
+            'budget_seconds': self.budget,
+            'max_attempts': self.max_attempts,
+            'calls': self.calls,
+            'retries': self.retries,
+            'budget_exhausted': self.budget_exhausted,
+            'last_call_ms': self.last_call_ms,
+            'breaker': self.breaker.stats()
+        }
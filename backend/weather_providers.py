@@ -0,0 +1,409 @@
+"""
+Weather providers: where the current weather and forecast payloads come from.
+
+WEATHER_PROVIDER selects one (the default is openweathermap, or demo
+without an API key):
+
+openweathermap  The OpenWeatherMap API, through WeatherClient (call budget,
+                circuit breaker). WEATHER_API_HOST can point it at another
+                server, e.g. the replay stand-in below. With
+                WEATHER_RECORD_DIR set, every response is also written there
+                for later replay.
+demo            Fixed demo payloads, no network.
+replay          Recorded OpenWeatherMap responses from WEATHER_REPLAY_DIR
+                (current*.json and forecast*.json, served in rotation), with
+                injected latency (WEATHER_REPLAY_LATENCY plus up to
+                WEATHER_REPLAY_JITTER seconds), errors (WEATHER_REPLAY_ERROR_RATE)
+                and DNS failures (WEATHER_REPLAY_DNS_FAILURE_RATE). Calls go
+                through the weather circuit breaker and call budget, so cache,
+                timeout and degradation behaviour can be measured offline.
+
+Both kinds of payload use the OpenWeatherMap shape. Recorded forecasts are
+moved forward in time so they start at the next forecast period.
+
+The HTTP stand-in serves a replay provider on /data/2.5/weather and
+/data/2.5/forecast, so the real client path (HTTP, timeouts, retries) runs
+against it:
+
+    python3 weather_providers.py --port 8089 [--latency 0.2 --error-rate 0.1]
+    WEATHER_API_HOST=http://127.0.0.1:8089 WEATHER_API_KEY=offline python3 app.py
+"""
+
+import os
+import glob
+import json
+import time
+import random
+import logging
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from forecast_cache import FORECAST_PERIOD_SECONDS, next_period_start
+
+logger = logging.getLogger(__name__)
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# openweathermap, demo or replay (empty = openweathermap, or demo without an API key)
+WEATHER_PROVIDER = os.getenv('WEATHER_PROVIDER', '').lower()
+WEATHER_API_HOST = os.getenv('WEATHER_API_HOST', 'https://api.openweathermap.org').rstrip('/')
+# Directory live responses are saved to (empty = not recorded)
+WEATHER_RECORD_DIR = os.getenv('WEATHER_RECORD_DIR', '')
+WEATHER_REPLAY_DIR = os.getenv('WEATHER_REPLAY_DIR', os.path.join(_BACKEND_DIR, 'weather_recordings'))
+WEATHER_REPLAY_LATENCY = float(os.getenv('WEATHER_REPLAY_LATENCY', '0'))
+WEATHER_REPLAY_JITTER = float(os.getenv('WEATHER_REPLAY_JITTER', '0'))
+WEATHER_REPLAY_ERROR_RATE = float(os.getenv('WEATHER_REPLAY_ERROR_RATE', '0'))
+WEATHER_REPLAY_DNS_FAILURE_RATE = float(os.getenv('WEATHER_REPLAY_DNS_FAILURE_RATE', '0'))
+
+CURRENT = 'current'
+FORECAST = 'forecast'
+FORECAST_PERIODS = 8  # 8 periods = 24 hours (3-hour intervals)
+
+
+class WeatherProvider:
+    """
+    Source of OpenWeatherMap-shaped payloads.
+
+    current() and forecast() raise on failure; the weather caches count the
+    failure and keep serving what they have.
+    """
+
+    name = None
+    source = 'live'  # Reported by the weather caches and /api/weather
+
+    def current(self):
+        """Current weather payload (OpenWeatherMap /weather shape)"""
+        raise NotImplementedError
+
+    def forecast(self):
+        """Forecast payload (OpenWeatherMap /forecast shape)"""
+        raise NotImplementedError
+
+    def stats(self):
+        return {'name': self.name, 'source': self.source}
+
+
+class OpenWeatherMapProvider(WeatherProvider):
+    """The OpenWeatherMap API"""
+
+    name = 'openweathermap'
+
+    def __init__(self, client, api_key, city, lat=None, lon=None, host=WEATHER_API_HOST,
+                 record_dir=WEATHER_RECORD_DIR):
+        """
+        Args:
+            client (WeatherClient): Budgeted, circuit-broken HTTP client
+            lat, lon: Coordinates (more accurate than the city name when both are set)
+            host (str): API scheme and host
+            record_dir (str): Directory each successful response is saved to (empty = off)
+        """
+        self.client = client
+        self.api_key = api_key
+        self.city = city
+        self.lat = lat
+        self.lon = lon
+        self.current_url = f'{host}/data/2.5/weather'
+        self.forecast_url = f'{host}/data/2.5/forecast'
+        self.record_dir = record_dir
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+
+    def _params(self, **extra):
+        """Query parameters and a location label for logs"""
+        params = {
+            'appid': self.api_key,
+            'units': 'imperial',
+            'lang': 'en'
+        }
+        params.update(extra)
+        # Use coordinates if available (more accurate than city name)
+        if self.lat and self.lon:
+            params['lat'] = self.lat
+            params['lon'] = self.lon
+            return params, f"{self.lat},{self.lon}"
+        params['q'] = self.city
+        return params, self.city
+
+    def _get(self, url, params, location_str):
+        try:
+            # Within the call budget; only the background refresh waits on it
+            response = self.client.get(url, params)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as conn_error:
+            # DNS errors on Render free tier are common and won't resolve with retries
+            error_msg = str(conn_error)
+            if 'NameResolutionError' in error_msg or 'Failed to resolve' in error_msg:
+                logger.warning(f"⚠️ Weather API DNS resolution failed (Render network issue): {error_msg[:100]}")
+            else:
+                logger.warning(f"⚠️ Weather API connection error: {error_msg[:100]}")
+            raise
+
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 401:
+            logger.error("❌ Invalid OpenWeatherMap API key. Please check your WEATHER_API_KEY.")
+            raise Exception("Invalid API key")
+        elif response.status_code == 404:
+            logger.warning(f"⚠️ Location not found: {location_str}. Using demo data.")
+            raise Exception("Location not found")
+        else:
+            logger.warning(f"⚠️ Weather API error: {response.status_code} - {response.text[:200]}")
+            raise Exception(f"API error: {response.status_code}")
+
+    def _record(self, kind, payload):
+        path = os.path.join(self.record_dir, f'{kind}-{int(time.time())}.json')
+        try:
+            with open(path, 'w') as f:
+                json.dump(payload, f)
+        except OSError as e:
+            logger.warning(f"Could not record weather response to {path}: {e}")
+
+    def current(self):
+        params, location_str = self._params()
+        weather_data = self._get(self.current_url, params, location_str)
+        # Add name if not present (for coordinate-based calls)
+        if 'name' not in weather_data:
+            weather_data['name'] = self.city
+        logger.info(f"✅ Successfully fetched weather data for {location_str}")
+        if self.record_dir:
+            self._record(CURRENT, weather_data)
+        return weather_data
+
+    def forecast(self):
+        params, location_str = self._params(cnt=FORECAST_PERIODS)
+        forecast_data = self._get(self.forecast_url, params, location_str)
+        logger.info(f"✅ Successfully fetched weather forecast for {location_str}")
+        if self.record_dir:
+            self._record(FORECAST, forecast_data)
+        return forecast_data
+
+    def stats(self):
+        return {'name': self.name, 'source': self.source, 'url': self.current_url,
+                'recording': bool(self.record_dir)}
+
+
+def demo_forecast_payload(weather_data, now=None, period=FORECAST_PERIOD_SECONDS):
+    """The given current weather repeated for the next FORECAST_PERIODS periods"""
+    start = next_period_start(time.time() if now is None else now, period)
+    return {
+        'city': {'name': weather_data.get('name')},
+        'list': [{
+            'dt': start + i * period,
+            'main': dict(weather_data.get('main', {})),
+            'weather': list(weather_data.get('weather', [])),
+            'clouds': dict(weather_data.get('clouds', {}))
+        } for i in range(FORECAST_PERIODS)]
+    }
+
+
+class DemoProvider(WeatherProvider):
+    """Fixed demo payloads (no API key)"""
+
+    name = 'demo'
+    source = 'demo'
+
+    def __init__(self, payload):
+        """
+        Args:
+            payload: payload() -> demo current weather
+        """
+        self.payload = payload
+
+    def current(self):
+        return self.payload()
+
+    def forecast(self):
+        return demo_forecast_payload(self.payload())
+
+
+class ReplayProvider(WeatherProvider):
+    """Recorded responses from disk, with latency, error and DNS failure injection"""
+
+    name = 'replay'
+    source = 'replay'
+
+    def __init__(self, directory=WEATHER_REPLAY_DIR, latency=WEATHER_REPLAY_LATENCY, jitter=WEATHER_REPLAY_JITTER,
+                 error_rate=WEATHER_REPLAY_ERROR_RATE, dns_failure_rate=WEATHER_REPLAY_DNS_FAILURE_RATE,
+                 client=None, seed=None):
+        """
+        Args:
+            directory (str): Holds current*.json and forecast*.json recordings
+            latency (float): Seconds every call takes
+            jitter (float): Up to this many extra seconds, uniformly random
+            error_rate (float): Share of calls failing like an HTTP 503
+            dns_failure_rate (float): Share of calls failing like a DNS lookup
+            client (WeatherClient): Its circuit breaker and call budget apply to replayed
+                calls; latency beyond the budget is a timeout (None = neither)
+            seed: Random seed, for repeatable fault sequences
+        """
+        self.directory = directory
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.dns_failure_rate = dns_failure_rate
+        self.client = client
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recordings = {kind: self._load(kind) for kind in (CURRENT, FORECAST)}
+        if not self._recordings[CURRENT]:
+            raise ValueError(f"No {CURRENT}*.json weather recordings in {directory}")
+        self._rotation = {kind: itertools.cycle(payloads) for kind, payloads in self._recordings.items() if payloads}
+        self.calls = 0
+        self.injected_errors = 0
+        self.injected_dns_failures = 0
+        self.injected_timeouts = 0
+
+    def _load(self, kind):
+        payloads = []
+        for path in sorted(glob.glob(os.path.join(self.directory, f'{kind}*.json'))):
+            with open(path) as f:
+                payloads.append(json.load(f))
+        return payloads
+
+    def _next(self, kind):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter > 0 else 0.0)
+            roll = self._random.random()
+            payload = next(self._rotation[kind]) if kind in self._rotation else None
+        budget = self.client.budget if self.client is not None else None
+        if budget is not None and delay > budget:
+            time.sleep(budget)
+            self.injected_timeouts += 1
+            raise requests.exceptions.Timeout(f"Replayed call took over the {budget:g}s budget")
+        if delay > 0:
+            time.sleep(delay)
+        if roll < self.dns_failure_rate:
+            self.injected_dns_failures += 1
+            raise requests.exceptions.ConnectionError("Failed to resolve 'api.openweathermap.org' (injected)")
+        if roll < self.dns_failure_rate + self.error_rate:
+            self.injected_errors += 1
+            raise Exception("API error: 503 (injected)")
+        return json.loads(json.dumps(payload))  # Callers may modify it
+
+    def _call(self, kind):
+        if self.client is None:
+            return self._next(kind)
+        return self.client.breaker.call(self._next, kind)
+
+    def current(self):
+        return self._call(CURRENT)
+
+    def forecast(self):
+        if FORECAST not in self._rotation:
+            # No recorded forecast: repeat a recorded current weather
+            return demo_forecast_payload(self._call(CURRENT))
+        payload = self._call(FORECAST)
+        periods = payload.get('list', [])
+        if periods:
+            # Recordings are old: move them to start at the next period
+            shift = next_period_start(time.time()) - periods[0]['dt']
+            for period in periods:
+                period['dt'] += shift
+        return payload
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'source': self.source,
+            'directory': self.directory,
+            'recordings': {kind: len(payloads) for kind, payloads in self._recordings.items()},
+            'latency_seconds': self.latency,
+            'jitter_seconds': self.jitter,
+            'error_rate': self.error_rate,
+            'dns_failure_rate': self.dns_failure_rate,
+            'calls': self.calls,
+            'injected_errors': self.injected_errors,
+            'injected_dns_failures': self.injected_dns_failures,
+            'injected_timeouts': self.injected_timeouts
+        }
+
+
+def create_provider(name, client, api_key, city, lat=None, lon=None, demo_payload=None):
+    """
+    Provider for a WEATHER_PROVIDER value.
+
+    Raises:
+        ValueError: For an unknown name, or replay without recordings
+    """
+    if not name:
+        name = DemoProvider.name if api_key == 'demo_key' else OpenWeatherMapProvider.name
+    if name == OpenWeatherMapProvider.name:
+        return OpenWeatherMapProvider(client, api_key, city, lat, lon)
+    if name == DemoProvider.name:
+        return DemoProvider(demo_payload)
+    if name == ReplayProvider.name:
+        return ReplayProvider(client=client)
+    raise ValueError(f"Unknown WEATHER_PROVIDER '{name}' (openweathermap, demo or replay)")
+
+
+# Local HTTP stand-in for the OpenWeatherMap API
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    provider = None
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/data/2.5/weather':
+            fetch = self.provider.current
+        elif path == '/data/2.5/forecast':
+            fetch = self.provider.forecast
+        else:
+            self._send(404, {'cod': '404', 'message': 'not found'})
+            return
+        try:
+            payload = fetch()
+        except requests.exceptions.ConnectionError:
+            # The closest an HTTP server gets to a failed DNS lookup: drop the connection
+            self.close_connection = True
+            return
+        except Exception as e:
+            self._send(503, {'cod': '503', 'message': str(e)})
+            return
+        self._send(200, payload)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def serve_replay(provider, host='127.0.0.1', port=8089):
+    """Serve provider as the OpenWeatherMap API on http://host:port until interrupted"""
+    handler = type('ReplayHandler', (_ReplayHandler,), {'provider': provider})
+    server = ThreadingHTTPServer((host, port), handler)
+    logger.info(f"🌦️ Replaying weather from {provider.directory} on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve recorded weather responses as a local OpenWeatherMap API')
+    parser.add_argument('--dir', default=WEATHER_REPLAY_DIR, help='Directory with current*.json and forecast*.json')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=WEATHER_REPLAY_LATENCY, help='Seconds per response')
+    parser.add_argument('--jitter', type=float, default=WEATHER_REPLAY_JITTER, help='Up to this many extra seconds')
+    parser.add_argument('--error-rate', type=float, default=WEATHER_REPLAY_ERROR_RATE, help='Share of 503 responses')
+    parser.add_argument('--dns-failure-rate', type=float, default=WEATHER_REPLAY_DNS_FAILURE_RATE,
+                        help='Share of dropped connections')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve_replay(ReplayProvider(args.dir, args.latency, args.jitter, args.error_rate, args.dns_failure_rate,
+                                seed=args.seed), args.host, args.port)
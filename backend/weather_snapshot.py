@@ -0,0 +1,155 @@
+"""
+Typed, immutable view of a weather payload and the lighting factors derived from it.
+
+The weather cache parses each fetched payload once into a WeatherSnapshot:
+the conditions become Condition enum members, so the factors below compare
+integers instead of lowercasing and substring-matching the description on
+every call. Snapshots carry the cache version they were parsed at.
+
+weather_factors() is memoized per (snapshot, hour). A refresh publishes a
+snapshot with a new version, so cached factors of the old weather are never
+looked up again and age out of the LRU.
+"""
+
+import os
+from enum import IntEnum
+from functools import lru_cache
+from dataclasses import dataclass
+
+# (snapshot, hour) factor pairs kept
+WEATHER_FACTOR_CACHE_SIZE = int(os.getenv('WEATHER_FACTOR_CACHE_SIZE', '256'))
+
+
+class Condition(IntEnum):
+    OTHER = 0
+    CLEAR = 1
+    CLOUDS = 2
+    DRIZZLE = 3
+    RAIN = 4
+    SNOW = 5
+    THUNDERSTORM = 6
+    FOG = 7
+
+    @classmethod
+    def from_main(cls, main):
+        """Condition of an OpenWeatherMap weather[0].main group ('Clear', 'Rain', ...)"""
+        return _MAIN_CONDITIONS.get(main.lower(), cls.OTHER)
+
+    @classmethod
+    def from_description(cls, description):
+        """
+        Dominant condition named in a weather description.
+
+        Precipitation wins over everything else ('thunderstorm with light rain' is RAIN),
+        then snow, storms, fog and clear skies, in that order.
+        """
+        description = description.lower()
+        for words, condition in _DESCRIPTION_CONDITIONS:
+            if any(word in description for word in words):
+                return condition
+        return cls.OTHER
+
+
+_MAIN_CONDITIONS = {
+    'clear': Condition.CLEAR,
+    'clouds': Condition.CLOUDS,
+    'drizzle': Condition.DRIZZLE,
+    'rain': Condition.RAIN,
+    'snow': Condition.SNOW,
+    'thunderstorm': Condition.THUNDERSTORM,
+    'fog': Condition.FOG,
+    'mist': Condition.FOG,
+    'haze': Condition.FOG,
+}
+
+_DESCRIPTION_CONDITIONS = (
+    (('rain',), Condition.RAIN),
+    (('drizzle',), Condition.DRIZZLE),
+    (('snow',), Condition.SNOW),
+    (('thunderstorm',), Condition.THUNDERSTORM),
+    (('fog', 'mist'), Condition.FOG),
+    (('clear',), Condition.CLEAR),
+    (('cloud',), Condition.CLOUDS),
+)
+
+
+@dataclass(frozen=True, slots=True)
+class WeatherSnapshot:
+    """Parsed weather conditions at one cache version"""
+    version: int             # Weather cache version (None for payloads not from the cache)
+    main: Condition          # From weather[0].main
+    condition: Condition     # From weather[0].description (more specific)
+    clouds: int              # Cloud cover, %
+    visibility: int          # Meters
+    temp: float
+
+    @classmethod
+    def from_payload(cls, payload, version=None):
+        """Parse an OpenWeatherMap current weather payload"""
+        weather = (payload.get('weather') or [{}])[0]
+        return cls(
+            version=version,
+            main=Condition.from_main(weather.get('main', '')),
+            condition=Condition.from_description(weather.get('description', '')),
+            clouds=int(payload.get('clouds', {}).get('all', 0)),
+            visibility=int(payload.get('visibility', 10000)),
+            temp=float(payload.get('main', {}).get('temp', 0.0))
+        )
+
+
+# Brightness multipliers by described condition
+_CONDITION_ADJUSTMENT = {
+    Condition.RAIN: 1.3,  # 30% brighter for rain
+    Condition.DRIZZLE: 1.3,
+    Condition.SNOW: 1.4,  # 40% brighter for snow
+    Condition.THUNDERSTORM: 1.5,  # 50% brighter for storms
+    Condition.FOG: 1.2,  # 20% brighter for fog
+}
+
+
+def lighting_adjustment(snapshot, hour):
+    """Brightness multiplier for the weather (see get_weather_lighting_adjustment)"""
+    adjustment = _CONDITION_ADJUSTMENT.get(snapshot.condition)
+    if adjustment is None:
+        if snapshot.condition == Condition.CLEAR and snapshot.clouds < 20:
+            adjustment = 0.7  # 30% dimmer for clear skies
+        elif snapshot.clouds > 80:
+            adjustment = 1.2  # 20% brighter for cloudy skies
+        else:
+            adjustment = 1.0
+    # Poor visibility
+    if snapshot.visibility < 5000:
+        adjustment *= 1.2
+    # Even dimmer during clear daytime
+    if 6 <= hour <= 18 and snapshot.main == Condition.CLEAR:
+        adjustment *= 0.8
+    return max(0.5, min(1.5, adjustment))
+
+
+def natural_light_factor(snapshot, hour):
+    """Share of natural light for the weather and hour (see get_natural_light_factor)"""
+    # Base natural light factor by time of day
+    if 6 <= hour <= 10:  # Early morning
+        base_factor = 0.6
+    elif 10 <= hour <= 16:  # Midday
+        base_factor = 0.9
+    elif 16 <= hour <= 20:  # Late afternoon
+        base_factor = 0.4
+    else:  # Night
+        base_factor = 0.1
+    # Weather adjustments
+    if snapshot.main == Condition.CLEAR and snapshot.clouds < 30:
+        weather_multiplier = 1.2
+    elif snapshot.main == Condition.CLOUDS and snapshot.clouds > 70:
+        weather_multiplier = 0.6
+    elif snapshot.condition == Condition.RAIN:
+        weather_multiplier = 0.3
+    else:
+        weather_multiplier = 0.8
+    return min(1.0, base_factor * weather_multiplier)
+
+
+@lru_cache(maxsize=WEATHER_FACTOR_CACHE_SIZE)
+def weather_factors(snapshot, hour):
+    """(lighting adjustment, natural light factor), memoized per (snapshot, hour)"""
+    return lighting_adjustment(snapshot, hour), natural_light_factor(snapshot, hour)
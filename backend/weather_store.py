@@ -0,0 +1,90 @@
+"""
+Weather cache tier shared by all workers and kept across restarts.
+
+One row per cache key in the SQLite `weather_cache` table holds the last
+fetched payload, when it was fetched (epoch seconds) and its source
+('live' or 'demo'). A lease on the row makes fetching single-flight across
+processes: a worker fetches only after try_lease() succeeds, and everyone
+else reads the row it writes. After a failed fetch the lease is kept until
+the retry time, so all workers back off together.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = '''CREATE TABLE IF NOT EXISTS weather_cache
+             (key TEXT PRIMARY KEY, payload TEXT, fetched_at REAL, source TEXT,
+              lease_owner TEXT, lease_until REAL)'''
+
+
+class WeatherEntry:
+    """A stored payload with its fetch time and source"""
+
+    __slots__ = ('payload', 'fetched_at', 'source')
+
+    def __init__(self, payload, fetched_at, source):
+        self.payload = payload
+        self.fetched_at = fetched_at
+        self.source = source
+
+
+class SQLiteWeatherStore:
+    """weather_cache table access with cross-process fetch leases"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.owner = f'{os.getpid()}-{id(self):x}'
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=10.0, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA busy_timeout=30000')
+        with self._conn:
+            self._conn.execute(_SCHEMA)
+
+    def load(self, key):
+        """Stored WeatherEntry for key, or None"""
+        with self._lock:
+            row = self._conn.execute('SELECT payload, fetched_at, source FROM weather_cache WHERE key = ?',
+                                     (key,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        try:
+            return WeatherEntry(json.loads(row[0]), row[1], row[2])
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable cached weather for {key}: {e}")
+            return None
+
+    def try_lease(self, key, seconds, now):
+        """Take the fetch lease for key unless another worker holds it; returns True if taken"""
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO weather_cache (key) VALUES (?)', (key,))
+            cursor = self._conn.execute(
+                '''UPDATE weather_cache SET lease_owner = ?, lease_until = ?
+                   WHERE key = ? AND (lease_until IS NULL OR lease_until < ? OR lease_owner = ?)''',
+                (self.owner, now + seconds, key, now, self.owner)
+            )
+            return cursor.rowcount == 1
+
+    def save(self, key, payload, fetched_at, source):
+        """Store a fetched payload and release the lease"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                '''INSERT INTO weather_cache (key, payload, fetched_at, source) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (key) DO UPDATE SET payload = excluded.payload, fetched_at = excluded.fetched_at,
+                       source = excluded.source, lease_owner = NULL, lease_until = NULL''',
+                (key, json.dumps(payload), fetched_at, source)
+            )
+
+    def release(self, key, hold_until=None):
+        """Give up the lease (hold_until keeps other workers from fetching until then)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE weather_cache SET lease_until = ? WHERE key = ? AND lease_owner = ?',
+                (hold_until, key, self.owner)
+            )
@@ -40,9 +40,30 @@ const Dashboard = ({ lights, schedules }) => {
       forceNew: true
     });
 
+    // Position in the server's light stream; sent back on reconnect to replay missed changes
+    const lightsCursor = { epoch: null, seq: null };
+    let lightsResyncPending = false;
+
+    const requestLightsResync = (event) => {
+      lightsResyncPending = true;
+      newSocket.emit(event, lightsCursor);
+    };
+
+    const applyLightChanges = (updates) => {
+      setSystemStatus(prev => {
+        const lights = { ...prev.lights };
+        updates.forEach(update => {
+          lights[update.room] = { ...lights[update.room], ...update.changes };
+        });
+        return { ...prev, lights };
+      });
+    };
+
     newSocket.on('connect', () => {
       console.log('✅ Socket.IO connected:', SOCKET_URL);
       setIsConnected(true);
+      // One lights_batch_update per operation instead of a light_update per room
+      requestLightsResync('subscribe_lights_batch');
       toast.success('Connected to AI Light Control System');
     });
 
@@ -66,6 +87,33 @@ const Dashboard = ({ lights, schedules }) => {
       }));
     });
 
+    newSocket.on('lights_state', (data) => {
+      if (data.snapshot) {
+        setSystemStatus(prev => ({ ...prev, lights: data.lights }));
+      } else {
+        applyLightChanges(data.updates);
+      }
+      lightsCursor.epoch = data.epoch;
+      lightsCursor.seq = data.seq;
+      lightsResyncPending = false;
+    });
+
+    newSocket.on('lights_batch_update', (data) => {
+      if (lightsResyncPending) {
+        return;
+      }
+      if (data.epoch !== lightsCursor.epoch || data.since !== lightsCursor.seq) {
+        // Already applied, or frames were missed: ask the server to catch us up
+        if (data.epoch === lightsCursor.epoch && data.seq <= lightsCursor.seq) {
+          return;
+        }
+        requestLightsResync('lights_resync');
+        return;
+      }
+      applyLightChanges(data.updates);
+      lightsCursor.seq = data.seq;
+    });
+
     newSocket.on('motion_update', (data) => {
       toast.success(`Motion detected in ${data.room}!`);
     });
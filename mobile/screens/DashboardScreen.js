@@ -48,10 +48,31 @@ const DashboardScreen = () => {
 
       setSocket(newSocket);
 
+      // Position in the server's light stream; sent back on reconnect to replay missed changes
+      const lightsCursor = { epoch: null, seq: null };
+      let lightsResyncPending = false;
+
+      const requestLightsResync = (event) => {
+        lightsResyncPending = true;
+        newSocket.emit(event, lightsCursor);
+      };
+
+      const applyLightChanges = (updates) => {
+        setSystemStatus(prev => {
+          const lights = { ...(prev && prev.lights) };
+          updates.forEach(update => {
+            lights[update.room] = { ...lights[update.room], ...update.changes };
+          });
+          return { ...prev, lights };
+        });
+      };
+
       newSocket.on('connect', () => {
         setIsConnected(true);
         setConnectionError(null);
         console.log('✅ Socket.IO connected successfully');
+        // One lights_batch_update per operation instead of a light_update per room
+        requestLightsResync('subscribe_lights_batch');
       });
 
       newSocket.on('disconnect', (reason) => {
@@ -99,6 +120,35 @@ const DashboardScreen = () => {
         }));
       });
 
+      newSocket.on('lights_state', (data) => {
+        console.log('💡 Lights state received:', data.snapshot ? 'snapshot' : `${data.count} rooms replayed`);
+        if (data.snapshot) {
+          setSystemStatus(prev => ({ ...prev, lights: data.lights }));
+        } else {
+          applyLightChanges(data.updates);
+        }
+        lightsCursor.epoch = data.epoch;
+        lightsCursor.seq = data.seq;
+        lightsResyncPending = false;
+      });
+
+      newSocket.on('lights_batch_update', (data) => {
+        console.log('💡 Lights batch update received:', data.count);
+        if (lightsResyncPending) {
+          return;
+        }
+        if (data.epoch !== lightsCursor.epoch || data.since !== lightsCursor.seq) {
+          // Already applied, or frames were missed: ask the server to catch us up
+          if (data.epoch === lightsCursor.epoch && data.seq <= lightsCursor.seq) {
+            return;
+          }
+          requestLightsResync('lights_resync');
+          return;
+        }
+        applyLightChanges(data.updates);
+        lightsCursor.seq = data.seq;
+      });
+
       newSocket.on('ai_mode_update', (data) => {
         console.log('🤖 AI mode update:', data);
         setAiModeEnabled(data.enabled);
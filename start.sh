@@ -35,7 +35,7 @@ wait_for_service() {
 # Clean up any existing processes
 echo "🧹 Cleaning up existing processes..."
 pkill -f "react-scripts" 2>/dev/null
-pkill -f "python3 app.py" 2>/dev/null
+pkill -f "python3 server.py" 2>/dev/null
 pkill -f "node.*start" 2>/dev/null
 
 # Check and free ports
@@ -57,7 +57,7 @@ if ! python3 -c "import flask, socketio" 2>/dev/null; then
 fi
 
 # Start backend with automatic restart on failure
-python3 app.py &
+python3 server.py &
 BACKEND_PID=$!
 
 # Wait for backend to be ready
@@ -118,7 +118,7 @@ cleanup() {
     echo "🛑 Stopping all services..."
     kill $BACKEND_PID $FRONTEND_PID 2>/dev/null
     pkill -f "react-scripts" 2>/dev/null
-    pkill -f "python3 app.py" 2>/dev/null
+    pkill -f "python3 server.py" 2>/dev/null
     echo "✅ System stopped"
     exit 0
 }